@@ -29,6 +29,9 @@ DEFAULT_BACKENDS = "keystone.backends.sqlalchemy"
 #Configs applicable to all backends.
 SHOULD_HASH_PASSWORD = True
 
+# The configured backend modules
+BACKEND_MODULES = []
+
 
 class GroupConf(CONF.__class__):
     """ Allows direct access to the values in the backend groups."""
@@ -48,9 +51,39 @@ def configure_backends():
     """Load backends given in the 'backends' option."""
     global SHOULD_HASH_PASSWORD  # pylint: disable=W0603
     SHOULD_HASH_PASSWORD = CONF.hash_password
+    from keystone.backends import backendutils
+    backendutils.configure_hashing(CONF.password_hash_pool,
+                                   CONF.password_hash_workers)
 
     backend_names = CONF.backends or DEFAULT_BACKENDS
+    del BACKEND_MODULES[:]
     for module_name in backend_names.split(","):
         backend_module = utils.import_module(module_name)
         backend_conf = GroupConf(module_name)
         backend_module.configure_backend(backend_conf)
+        BACKEND_MODULES.append(backend_module)
+
+
+def open_request_scope():
+    """Lets the backends share resources, such as a database connection,
+    between all their calls until close_request_scope()"""
+    for backend_module in BACKEND_MODULES:
+        if hasattr(backend_module, 'open_request_scope'):
+            backend_module.open_request_scope()
+
+
+def close_request_scope():
+    for backend_module in BACKEND_MODULES:
+        if hasattr(backend_module, 'close_request_scope'):
+            backend_module.close_request_scope()
+
+
+def get_backend_stats():
+    """Returns the counters of the backends that keep any, by backend, and
+    of password hashing"""
+    from keystone.backends import backendutils
+    stats = {'passwords': backendutils.get_hashing_stats()}
+    for backend_module in BACKEND_MODULES:
+        if hasattr(backend_module, 'get_stats'):
+            stats[backend_module.__name__] = backend_module.get_stats()
+    return stats
@@ -18,6 +18,15 @@
 
 # pylint: disable=W0603, R0921
 
+import datetime
+
+from keystone.models import Role
+
+# Seconds within which an event id missing from the ids read may still be
+# taken by an event not committed (or stored) yet: event ids are assigned
+# in order, but the events become visible in the order they are committed
+REVOCATION_EVENT_LAG = 30
+
 
 #Base APIs
 class BaseUserAPI(object):
@@ -72,6 +81,12 @@ class BaseUserAPI(object):
     def get_page_markers(self, marker, limit):
         raise NotImplementedError
 
+    def get_page_with_markers(self, marker, limit):
+        """ Get one page and its markers as (page, prev, next); backends
+        override it to compute them in one query """
+        prev, next = self.get_page_markers(marker, limit)
+        return self.get_page(marker, limit), prev, next
+
     def user_roles_by_tenant(self, user_id, tenant_id):
         raise NotImplementedError
 
@@ -129,6 +144,11 @@ class BaseUserAPI(object):
     def users_get_page_markers(self, marker, limit):
         raise NotImplementedError
 
+    def users_get_page_with_markers(self, marker, limit):
+        """ Get one page of users and its markers as (page, prev, next) """
+        prev, next = self.users_get_page_markers(marker, limit)
+        return self.users_get_page(marker, limit), prev, next
+
     def users_get_by_tenant_get_page(self, tenant_id, role_id, marker, limit):
         raise NotImplementedError
 
@@ -171,6 +191,161 @@ class BaseTokenAPI(object):
     def get_all(self):
         raise NotImplementedError
 
+    def delete_expired(self, before, limit):
+        """ Delete tokens that expired before a given time
+
+        Backends should delete in batches that don't lock the tokens for
+        long, as the reaper calls this repeatedly until it returns 0.
+
+        :param before: datetime - delete tokens expiring before this
+        :param limit: int - the number of tokens to delete in this call
+        :returns: the number of tokens deleted
+
+        """
+        raise NotImplementedError
+
+    def add_revocation_event(self, type, target_id):
+        """ Record that a token was revoked, or a user or tenant disabled
+
+        :param type: string - 'token', 'user' or 'tenant'
+        :param target_id: string - the ID of the token, user or tenant
+        :returns: the models.RevocationEvent, whose id is greater than the
+            id of any event recorded before
+
+        """
+        raise NotImplementedError
+
+    def get_revocation_events(self, after, limit):
+        """ Get the revocation events recorded after a given event
+
+        :param after: int - the cursor returned by the previous call (0
+            for none)
+        :param limit: int - the number of events to return at most
+        :returns: tuple of the list of events (oldest first), the cursor
+            to read the next events after, and whether some events recorded
+            after `after` were deleted (see delete_revocation_events) before
+            they could be read; the events are then read from the oldest.
+            Events after the cursor may be returned again by the next call
+            (see revocation_cursor)
+
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def revocation_cursor(after, events, last=None, now=None):
+        """ Get the cursor to read the events after, once `events` were
+        read after cursor `after`
+
+        The cursor is the id of the last event read, or `last` if greater,
+        unless an id is missing before an event recorded less than
+        REVOCATION_EVENT_LAG seconds ago: the event with that id may not be
+        committed yet, so the cursor stays before it, and the events after
+        it are read again. Older missing ids belong to events that were
+        deleted or never recorded, and are skipped.
+
+        :param after: int - the cursor the events were read after
+        :param events: list of the events read (oldest first)
+        :param last: int - the greatest id read, if events were read by id
+        :param now: datetime - the current time
+        :returns: int - the cursor
+
+        """
+        recent = (now or datetime.datetime.now()) - \
+            datetime.timedelta(seconds=REVOCATION_EVENT_LAG)
+        cursor = after
+        for event in events:
+            # the first read starts at the oldest event kept
+            if cursor and event.id > cursor + 1 and event.created > recent:
+                return cursor
+            cursor = event.id
+        return max(cursor, last or 0)
+
+    def delete_revocation_events(self, before):
+        """ Delete the revocation events recorded before a given time,
+        except the newest one, which ids keep increasing from
+
+        :param before: datetime - delete events recorded before this
+        :returns: the number of events deleted
+
+        """
+        raise NotImplementedError
+
+    def get_validation_view(self, id):
+        """ Get a token and everything needed to validate it
+
+        Backends that can load the whole view at once (e.g. with a single
+        joined query) should override this. This default composes the view
+        from the currently registered user, tenant and role APIs.
+
+        :param id: string - the token ID
+        :returns: dict with the keys 'token', 'user', 'user_tenant',
+            'token_tenant', 'tenant_roles' and 'global_roles', or None if
+            the token does not exist. Roles are models.Role objects carrying
+            the name of the role and the tenant_id of the grant.
+
+        """
+        return self._validation_view(self.get(id))
+
+    @staticmethod
+    def _validation_view(token):
+        """ Composes the validation view of a token (or None) """
+        if token is None:
+            return None
+
+        user = USER.get(token.user_id)
+        view = {'token': token,
+                'user': user,
+                'user_tenant': None,
+                'token_tenant': None,
+                'tenant_roles': [],
+                'global_roles': []}
+        if user is None:
+            return view
+
+        if user.tenant_id:
+            view['user_tenant'] = TENANT.get(user.tenant_id)
+        if token.tenant_id:
+            view['token_tenant'] = TENANT.get(token.tenant_id)
+
+        roles_by_id = {}
+
+        def to_roles(grants):
+            roles = []
+            for grant in grants:
+                if grant.role_id not in roles_by_id:
+                    roles_by_id[grant.role_id] = ROLE.get(grant.role_id)
+                drole = roles_by_id[grant.role_id]
+                roles.append(Role(id=grant.role_id, name=drole.name,
+                                  description=drole.description,
+                                  service_id=drole.service_id,
+                                  tenant_id=grant.tenant_id))
+            return roles
+
+        if token.tenant_id:
+            view['tenant_roles'] = to_roles(
+                ROLE.list_tenant_roles_for_user(user.id, token.tenant_id))
+        view['global_roles'] = to_roles(
+            ROLE.list_global_roles_for_user(user.id))
+        return view
+
+    def get_validation_views(self, ids):
+        """ Get the validation views of several tokens
+
+        Backends that can load many tokens at once should override this.
+        This default loads the views one by one.
+
+        :param ids: list of token IDs
+        :returns: dict of token ID to validation view (see
+            get_validation_view); unknown tokens are left out
+
+        """
+        views = {}
+        for id in set(ids):
+            view = self.get_validation_view(id)
+            if view is not None:
+                views[id] = view
+        return views
+
 
 class BaseTenantAPI(object):
     def __init__(self, *args, **kw):
@@ -200,6 +375,12 @@ class BaseTenantAPI(object):
     def get_page_markers(self, marker, limit):
         raise NotImplementedError
 
+    def get_page_with_markers(self, marker, limit):
+        """ Get one page and its markers as (page, prev, next); backends
+        override it to compute them in one query """
+        prev, next = self.get_page_markers(marker, limit)
+        return self.get_page(marker, limit), prev, next
+
     def update(self, id, values):
         raise NotImplementedError
 
@@ -252,6 +433,12 @@ class BaseRoleAPI(object):
     def get_page_markers(self, marker, limit):
         raise NotImplementedError
 
+    def get_page_with_markers(self, marker, limit):
+        """ Get one page and its markers as (page, prev, next); backends
+        override it to compute them in one query """
+        prev, next = self.get_page_markers(marker, limit)
+        return self.get_page(marker, limit), prev, next
+
     #
     # Role-Grant Methods
     #
@@ -322,6 +509,12 @@ class BaseEndpointTemplateAPI(object):
     def get_page_markers(self, marker, limit):
         raise NotImplementedError
 
+    def get_page_with_markers(self, marker, limit):
+        """ Get one page and its markers as (page, prev, next); backends
+        override it to compute them in one query """
+        prev, next = self.get_page_markers(marker, limit)
+        return self.get_page(marker, limit), prev, next
+
     def get_by_service_get_page(self, service_id, marker, limit):
         raise NotImplementedError
 
@@ -376,6 +569,12 @@ class BaseServiceAPI(object):
     def get_page_markers(self, marker, limit):
         raise NotImplementedError
 
+    def get_page_with_markers(self, marker, limit):
+        """ Get one page and its markers as (page, prev, next); backends
+        override it to compute them in one query """
+        prev, next = self.get_page_markers(marker, limit)
+        return self.get_page(marker, limit), prev, next
+
     def delete(self, id):
         raise NotImplementedError
 
@@ -1,6 +1,12 @@
 import logging
 logger = logging.getLogger(__name__)  # pylint: disable=C0103
 
+import multiprocessing
+import os
+import time
+
+from eventlet import tpool
+
 from keystone.backends import models
 import keystone.backends as backends
 # pylint: disable=E0611
@@ -10,6 +16,116 @@ except ImportError as exc:
     logger.exception(exc)
     raise exc
 
+# Where passwords are hashed and verified (see configure_hashing)
+HASH_POOL = None
+HASH_WORKERS = 0
+HASH_POOLS = [None, 'thread', 'process']
+
+# The pool of worker processes, and the process that started it
+_PROCESS_POOL = None
+_PROCESS_POOL_PID = None
+
+# count, total and maximum seconds of the hashes and verifications
+_LATENCY = {}
+
+
+def configure_hashing(pool=None, workers=0):
+    """
+    Sets where passwords are hashed and verified, which takes tens of
+    milliseconds of CPU time or more:
+
+    - None: in the calling green thread, which blocks all of them
+    - 'thread': in eventlet's pool of OS threads (workers threads, or
+      eventlet's default), which only lets other green threads run with
+      hash implementations that release the GIL
+    - 'process': in a pool of worker processes (workers processes, or one
+      per CPU by default), which the calling green thread waits for
+    """
+    global HASH_POOL, HASH_WORKERS  # pylint: disable=W0603
+    pool = pool or None
+    if pool not in HASH_POOLS:
+        raise ValueError("Unsupported password_hash_pool %s" % pool)
+    if (pool, workers or 0) != (HASH_POOL, HASH_WORKERS):
+        _close_process_pool()
+    HASH_POOL = pool
+    HASH_WORKERS = workers or 0
+    if pool == 'thread' and HASH_WORKERS:
+        # takes effect when eventlet starts its threads, on first use
+        tpool.set_num_threads(HASH_WORKERS)
+
+
+def start_process_pool():
+    """Starts the worker processes of the 'process' pool now, rather than
+    on first use. Servers call this before binding their listening sockets
+    and opening database connections, which the workers would otherwise
+    inherit."""
+    if HASH_POOL == 'process':
+        _process_pool()
+
+
+def _close_process_pool():
+    global _PROCESS_POOL  # pylint: disable=W0603
+    if _PROCESS_POOL is not None and _PROCESS_POOL_PID == os.getpid():
+        _PROCESS_POOL.terminate()
+    _PROCESS_POOL = None
+
+
+def _process_pool():
+    """Returns the pool of worker processes of this process, started on
+    first use (a forked child cannot use the pool of its parent)"""
+    global _PROCESS_POOL, _PROCESS_POOL_PID  # pylint: disable=W0603
+    if _PROCESS_POOL is None or _PROCESS_POOL_PID != os.getpid():
+        _PROCESS_POOL = multiprocessing.Pool(HASH_WORKERS or None)
+        _PROCESS_POOL_PID = os.getpid()
+    return _PROCESS_POOL
+
+
+def _run(operation, func, *args):
+    """Runs func in the configured pool and records how long it took"""
+    start = time.time()
+    try:
+        if HASH_POOL == 'thread':
+            return tpool.execute(func, *args)
+        elif HASH_POOL == 'process':
+            result = _process_pool().apply_async(func, args)
+            # wait in an OS thread, not in the hub
+            return tpool.execute(result.get)
+        return func(*args)
+    finally:
+        elapsed = time.time() - start
+        count, total, maximum = _LATENCY.get(operation, (0, 0.0, 0.0))
+        _LATENCY[operation] = (count + 1, total + elapsed,
+                               max(maximum, elapsed))
+
+
+def get_hashing_stats():
+    """
+    Returns where passwords are hashed, the number of workers and the
+    count, mean and maximum latency in milliseconds of the hashes and
+    verifications done by this process.
+    """
+    if HASH_POOL == 'thread':
+        workers = HASH_WORKERS or tpool._nthreads  # pylint: disable=W0212
+    elif HASH_POOL == 'process':
+        workers = HASH_WORKERS or multiprocessing.cpu_count()
+    else:
+        workers = 0
+    stats = {'pool': HASH_POOL or 'inline', 'workers': workers}
+    for operation in ['hash', 'verify']:
+        count, total, maximum = _LATENCY.get(operation, (0, 0.0, 0.0))
+        stats[operation] = {'count': count,
+                            'mean_ms': count and total * 1000.0 / count,
+                            'max_ms': maximum * 1000.0}
+    return stats
+
+
+def _encrypt(raw_password):
+    return sc.encrypt(raw_password)
+
+
+def _verify(raw_password, enc_password):
+    return sc.verify(raw_password, enc_password)
+
 
 def __get_hashed_password(password):
     if password:
@@ -32,6 +148,18 @@ def set_hashed_password(values):
                         type(values))
 
 
+def hash_password(password):
+    """
+    Returns the password to store: its hash, unless hashing is disabled.
+
+    The password is hashed by the calling thread, so that callers with
+    workers of their own (e.g. bulk imports) can use it.
+    """
+    if backends.SHOULD_HASH_PASSWORD:
+        return password and _encrypt(password) or None
+    return password
+
+
 def check_password(raw_password, enc_password):
     """
     Compares raw password and encoded password.
@@ -39,7 +167,7 @@ def check_password(raw_password, enc_password):
     if not raw_password:
         return False
     if backends.SHOULD_HASH_PASSWORD:
-        return sc.verify(raw_password, enc_password)
+        return _run('verify', _verify, raw_password, enc_password)
     else:
         return enc_password == raw_password
 
@@ -57,4 +185,4 @@ def __make_password(raw_password):
 #Refer http://packages.python.org/passlib/lib/passlib.hash.sha512_crypt.html
 #Using the default properties as of now.Salt gets generated automatically.
 def __get_hexdigest(raw_password):
-    return sc.encrypt(raw_password)
+    return _run('hash', _encrypt, raw_password)
@@ -0,0 +1,355 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+In-process token backend.
+
+The tokens live in the memory of the Keystone process, so storing and
+reading them costs no database write and no network round trip. They are
+lost when the process stops, unless a snapshot file is configured: every
+change is then appended to that file, which is replayed on start.
+
+The store is only for a single Keystone process: with workers, each worker
+process would have its own tokens. The snapshot file is locked by the process
+using it, so that a second process (another server, or keystone-manage)
+configured with the same file fails to start rather than overwriting it.
+"""
+
+import ast
+import datetime
+import errno
+import fcntl
+import json
+import logging
+import os
+import time
+
+from keystone import config as keystone_config
+from keystone.common import config
+from keystone.common.timerwheel import TimerWheel
+from keystone.backends.kvs import models
+import keystone.utils as utils
+import keystone.backends.api as top_api
+import keystone.backends.models as top_models
+from keystone.models import RevocationEvent, Token
+
+LOG = logging.getLogger(__name__)
+
+MODEL_PREFIX = 'keystone.backends.kvs.models.'
+API_PREFIX = 'keystone.backends.kvs.api.'
+STORE = None
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+# The snapshot is rewritten with only the live records once it holds more
+# than this many records, and more than twice as many as are live
+COMPACT_MIN_RECORDS = 10000
+
+
+def configure_backend(options):
+    global STORE
+    if keystone_config.CONF.workers:
+        raise ValueError("The kvs backend keeps the tokens in the memory "
+                         "of a single process; it cannot run with workers")
+    if STORE is None:
+        STORE = TokenStore(
+            shards=config.get_option(options, 'shards', type='int',
+                                     default=16),
+            tick=config.get_option(options, 'expiry_tick', type='float',
+                                   default=1.0),
+            snapshot_file=config.get_option(options, 'snapshot_file',
+                                            default=None))
+    register_models(options)
+
+
+def register_models(options):
+    """Register Models and create properties"""
+    supported_kvs_models = ast.literal_eval(options["backend_entities"])
+    for supported_kvs_model in supported_kvs_models:
+        model = utils.import_module(MODEL_PREFIX + supported_kvs_model)
+        top_models.set_value(supported_kvs_model, model)
+        if model.__api__ is not None:
+            model_api = utils.import_module(API_PREFIX + model.__api__)
+            top_api.set_value(model.__api__, model_api.get())
+
+
+def get_stats():
+    """Returns the counters of the token store"""
+    if STORE is None:
+        return {}
+    return STORE.stats()
+
+
+def _timestamp(value):
+    """Seconds since the epoch of a (local) datetime"""
+    return time.mktime(value.timetuple()) + value.microsecond / 1e6
+
+
+def _encode_time(value):
+    return value and value.strftime(TIME_FORMAT)
+
+
+def _decode_time(value):
+    return value and datetime.datetime.strptime(value, TIME_FORMAT)
+
+
+class TokenStore(object):
+    """Tokens in memory, indexed by id and by user and tenant.
+
+    The tokens are spread over shards by id, so that growing the store
+    rehashes one shard at a time rather than all tokens at once. Each token
+    is also indexed under its (user id, tenant id). A timer wheel removes
+    the tokens as they expire, in O(1) per token: a token is gone once it
+    has expired.
+
+    Green threads do not switch within the methods of the store, so they
+    need no locks.
+
+    :param shards: number of dicts the tokens are spread over
+    :param tick: seconds between two runs of the timer wheel
+    :param snapshot_file: file the changes are appended to, and replayed
+        from when the store is created
+    """
+
+    def __init__(self, shards=16, tick=1.0, snapshot_file=None, now=None):
+        # token id -> (user id, tenant id, expires)
+        self.shards = [{} for _shard in range(shards)]
+        # (user id, tenant id) -> set of token ids
+        self.index = {}
+        self.wheel = TimerWheel(tick, now=now)
+        # oldest first, with consecutive ids
+        self.events = []
+        self.last_event_id = 0
+        self.snapshot_file = snapshot_file
+        self.snapshot = None
+        self.records = 0
+        self.expired = 0
+        self.lock = None
+        if snapshot_file:
+            self._lock()
+            self._load(now)
+
+    def _lock(self):
+        """Takes the lock of the snapshot file, which compact() replaces
+        (so the lock is on a file of its own)"""
+        path = self.snapshot_file + '.lock'
+        self.lock = open(path, 'a')
+        try:
+            fcntl.flock(self.lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as exc:
+            self.lock.close()
+            self.lock = None
+            if exc.errno in (errno.EAGAIN, errno.EACCES):
+                raise IOError(exc.errno, "The token snapshot %s is in use by "
+                              "another process" % self.snapshot_file)
+            raise
+
+    def close(self):
+        """Closes the snapshot file and releases its lock"""
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+        if self.lock is not None:
+            self.lock.close()
+            self.lock = None
+
+    def _shard(self, id):
+        return self.shards[hash(id) % len(self.shards)]
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def expire(self, now=None):
+        """Removes the tokens that have expired; returns how many"""
+        now = now or time.time()
+        count = 0
+        for id in self.wheel.advance(now):
+            record = self._shard(id).get(id)
+            if record is None:
+                continue
+            if _timestamp(record[2]) > now:
+                # updated since it was scheduled, or expiring later within
+                # this tick
+                self.wheel.schedule(id, _timestamp(record[2]))
+                continue
+            self._remove(id)
+            count += 1
+        self.expired += count
+        return count
+
+    def get(self, id, now=None):
+        self.expire(now)
+        record = self._shard(id).get(id)
+        if record is None:
+            return None
+        user_id, tenant_id, expires = record
+        return Token(id=id, user_id=user_id, tenant_id=tenant_id,
+                     expires=expires)
+
+    def put(self, id, user_id, tenant_id, expires, now=None):
+        """Stores a token, or replaces the token with that id"""
+        self.expire(now)
+        if id in self._shard(id):
+            self._remove(id)
+        self._shard(id)[id] = (user_id, tenant_id, expires)
+        self.index.setdefault((user_id, tenant_id), set()).add(id)
+        self.wheel.schedule(id, _timestamp(expires))
+        self._append(['t', id, user_id, tenant_id, _encode_time(expires)])
+
+    def delete(self, id, now=None):
+        self.expire(now)
+        if id in self._shard(id):
+            self._remove(id)
+            self._append(['d', id])
+
+    def _remove(self, id):
+        user_id, tenant_id, _expires = self._shard(id).pop(id)
+        ids = self.index[(user_id, tenant_id)]
+        ids.discard(id)
+        if not ids:
+            del self.index[(user_id, tenant_id)]
+
+    def find(self, user_id, tenant_id, now=None):
+        """Returns the id of the token of a user for a tenant (or for no
+        tenant) that expires last, or None"""
+        self.expire(now)
+        ids = self.index.get((user_id, tenant_id))
+        if not ids:
+            return None
+        return max(ids, key=lambda id: self._shard(id)[id][2])
+
+    def ids(self, now=None):
+        self.expire(now)
+        return [id for shard in self.shards for id in shard]
+
+    def add_event(self, type, target_id, created=None):
+        self.last_event_id += 1
+        event = RevocationEvent(id=self.last_event_id, type=type,
+                                target_id=str(target_id),
+                                created=created or datetime.datetime.now())
+        self.events.append(event)
+        self._append(['e', event.id, event.type, event.target_id,
+                      _encode_time(event.created)])
+        return event
+
+    def get_events(self, after, limit):
+        """Returns the events after an event id, their cursor and whether
+        some events after it were deleted (see TokenAPI)"""
+        truncated = False
+        oldest = self.events[0].id if self.events else None
+        if after and (oldest is None or self.last_event_id < after or
+                      oldest > after + 1):
+            truncated = True
+            after = 0
+        start = max(after - oldest + 1, 0) if oldest else 0
+        events = self.events[start:start + limit]
+        cursor = events[-1].id if events else after
+        return list(events), cursor, truncated
+
+    def delete_events(self, before):
+        """Deletes the events created before a time, except the newest"""
+        count = 0
+        while (count < len(self.events) - 1 and
+               self.events[count].created < before):
+            count += 1
+        if count:
+            del self.events[:count]
+            self._append(['p', self.events[0].id])
+        return count
+
+    def stats(self):
+        return {'tokens': len(self),
+                'shards': len(self.shards),
+                'expired': self.expired,
+                'events': len(self.events),
+                'snapshot_records': self.records}
+
+    def _append(self, record):
+        if self.snapshot is None:
+            return
+        self.snapshot.write(json.dumps(record, separators=(',', ':')) +
+                            '\n')
+        self.snapshot.flush()
+        self.records += 1
+        if self.records > max(COMPACT_MIN_RECORDS,
+                              2 * (len(self) + len(self.events))):
+            self.compact()
+
+    def _load(self, now=None):
+        """Replays the snapshot file, then compacts it"""
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file) as snapshot:
+                for line in snapshot:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # the last record, if the process died writing it
+                        LOG.warning("Skipping a truncated record of %s" %
+                                    self.snapshot_file)
+                        continue
+                    self._replay(record, now or time.time())
+        self.compact()
+        LOG.info("Loaded %s tokens from %s" % (len(self),
+                                               self.snapshot_file))
+
+    def _replay(self, record, now):
+        kind = record[0]
+        if kind == 't':
+            _kind, id, user_id, tenant_id, expires = record
+            if id in self._shard(id):
+                self._remove(id)
+            expires = _decode_time(expires)
+            if _timestamp(expires) <= now:
+                return
+            self._shard(id)[id] = (user_id, tenant_id, expires)
+            self.index.setdefault((user_id, tenant_id), set()).add(id)
+            self.wheel.schedule(id, _timestamp(expires))
+        elif kind == 'd':
+            if record[1] in self._shard(record[1]):
+                self._remove(record[1])
+        elif kind == 'e':
+            _kind, id, type, target_id, created = record
+            self.events.append(RevocationEvent(
+                id=id, type=type, target_id=target_id,
+                created=_decode_time(created)))
+            self.last_event_id = id
+        elif kind == 'p':
+            self.events = [event for event in self.events
+                           if event.id >= record[1]]
+
+    def compact(self):
+        """Rewrites the snapshot file with only the live tokens and
+        events"""
+        if self.snapshot is not None:
+            self.snapshot.close()
+        path = self.snapshot_file + '.tmp'
+        with open(path, 'w') as snapshot:
+            for shard in self.shards:
+                for id, (user_id, tenant_id, expires) in shard.iteritems():
+                    snapshot.write(json.dumps(
+                        ['t', id, user_id, tenant_id, _encode_time(expires)],
+                        separators=(',', ':')) + '\n')
+            for event in self.events:
+                snapshot.write(json.dumps(
+                    ['e', event.id, event.type, event.target_id,
+                     _encode_time(event.created)],
+                    separators=(',', ':')) + '\n')
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.rename(path, self.snapshot_file)
+        self.snapshot = open(self.snapshot_file, 'a')
+        self.records = len(self) + len(self.events)
@@ -0,0 +1,73 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2010 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from keystone.backends import kvs
+from keystone.backends.api import BaseTokenAPI
+
+
+# pylint: disable=W0223
+class TokenAPI(BaseTokenAPI):
+    """ Stores the tokens in the TokenStore of the process """
+
+    def __init__(self, *args, **kw):
+        super(TokenAPI, self).__init__(*args, **kw)
+
+    def create(self, token):
+        kvs.STORE.put(token.id, token.user_id,
+                      getattr(token, 'tenant_id', None), token.expires)
+        return kvs.STORE.get(token.id)
+
+    def get(self, id):
+        if id is None:
+            return None
+        return kvs.STORE.get(id)
+
+    def update(self, id, values):
+        token = kvs.STORE.get(id)
+        if token is not None:
+            token.update(values)
+            kvs.STORE.put(token.id, token.user_id, token.tenant_id,
+                          token.expires)
+
+    def delete(self, id):
+        kvs.STORE.delete(id)
+
+    def get_for_user(self, user_id):
+        return self.get_for_user_by_tenant(user_id, None)
+
+    def get_for_user_by_tenant(self, user_id, tenant_id):
+        return self.get(kvs.STORE.find(user_id, tenant_id))
+
+    def get_all(self):
+        return [kvs.STORE.get(id) for id in kvs.STORE.ids()]
+
+    def delete_expired(self, before, limit):
+        # the store removes the tokens as they expire
+        return kvs.STORE.expire()
+
+    def add_revocation_event(self, type, target_id):
+        return kvs.STORE.add_event(type, target_id)
+
+    def get_revocation_events(self, after, limit):
+        return kvs.STORE.get_events(after, limit)
+
+    def delete_revocation_events(self, before):
+        return kvs.STORE.delete_events(before)
+
+
+def get():
+    return TokenAPI()
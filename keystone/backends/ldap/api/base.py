@@ -121,6 +121,11 @@ class BaseLdapAPI(object):
     def get_page_markers(self, marker, limit):
         return self._get_page_markers(marker, limit, self.get_all())
 
+    def get_page_with_markers(self, marker, limit):
+        lst = self.get_all()
+        prev, nxt = self._get_page_markers(marker, limit, lst)
+        return self._get_page(marker, limit, lst), prev, nxt
+
     # pylint: disable=W0141
     @staticmethod
     def _get_page(marker, limit, lst, key=lambda e: e.id):
@@ -106,6 +106,9 @@ class UserAPI(BaseLdapAPI, BaseUserAPI):
     def users_get_page_markers(self, marker, limit):
         return self.get_page_markers(marker, limit)
 
+    def users_get_page_with_markers(self, marker, limit):
+        return self.get_page_with_markers(marker, limit)
+
     def users_get_by_tenant_get_page(self, tenant_id, role_id, marker, limit):
         return self._get_page(marker, limit,
                 self.api.tenant.get_users(tenant_id, role_id))
@@ -19,11 +19,11 @@ import ast
 import logging
 
 from keystone.common import config
+from keystone.common.memcachering import MemcacheRing
 from keystone.backends.memcache import models
 import keystone.utils as utils
 import keystone.backends.api as top_api
 import keystone.backends.models as top_models
-import memcache
 
 MODEL_PREFIX = 'keystone.backends.memcache.models.'
 API_PREFIX = 'keystone.backends.memcache.api.'
@@ -33,19 +33,29 @@ CACHE_TIME = 86400
 
 def configure_backend(options):
     hosts = options['memcache_hosts']
-    global MEMCACHE_SERVER
-    if not MEMCACHE_SERVER:
-        MEMCACHE_SERVER = Memcache_Server(hosts)
-    register_models(options)
+    replicas = config.get_option(
+        options, 'memcache_replicas', type='int', default=1)
     global CACHE_TIME
     CACHE_TIME = config.get_option(
         options, 'cache_time', type='int', default=86400)
+    global MEMCACHE_SERVER
+    if not MEMCACHE_SERVER:
+        MEMCACHE_SERVER = Memcache_Server(hosts, replicas, CACHE_TIME)
+    register_models(options)
 
 
 class Memcache_Server():
-    def __init__(self, hosts):
+    """
+    The memcached servers storing the tokens: a comma separated list of
+    'host:port' or 'host:port:weight' over which the keys are spread by
+    consistent hashing, each key being written to `replicas` of them
+    (see keystone.common.memcachering)
+    """
+    def __init__(self, hosts, replicas=1, cache_time=CACHE_TIME):
         self.hosts = hosts
-        self.server = memcache.Client([self.hosts])
+        # deleted tokens are remembered as long as tokens are kept
+        self.server = MemcacheRing(hosts, replicas=replicas,
+                                   tombstone_time=cache_time)
 
     def set(self, key, value, expiry=CACHE_TIME):
         """
@@ -68,6 +78,46 @@ class Memcache_Server():
         """
         self.server.delete(key.encode('utf-8'))
 
+    def add(self, key, value, expiry=CACHE_TIME):
+        """
+        This method is used to set a value in the
+        memcache server, unless it has one already
+        """
+        return self.server.add(key.encode('utf-8'), value, expiry)
+
+    def incr(self, key):
+        """
+        This method is used to atomically increment a
+        counter; returns None if the counter is not set
+        """
+        return self.server.incr(key.encode('utf-8'))
+
+    def get_multi(self, keys):
+        """
+        This method is used to retrieve many values from
+        the memcache server at once, as a dict
+        """
+        return self.server.get_multi([key.encode('utf-8') for key in keys])
+
+    def set_multi(self, mapping, expiry=None):
+        """
+        This method is used to set many values in the
+        memcache server at once
+        """
+        if expiry is None:
+            expiry = CACHE_TIME
+        return self.server.set_multi(dict((key.encode('utf-8'), value)
+                                          for key, value in mapping.items()),
+                                     expiry)
+
+    def delete_multi(self, keys):
+        """
+        This method is used to delete many values from
+        the memcache server at once
+        """
+        return self.server.delete_multi([key.encode('utf-8')
+                                         for key in keys])
+
 
 def register_models(options):
     """Register Models and create properties"""
@@ -14,60 +14,204 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+import datetime
+import json
+import logging
+
+from keystone.backends import memcache
 from keystone.backends.memcache import MEMCACHE_SERVER
 from keystone.backends.api import BaseTokenAPI
+from keystone.models import RevocationEvent, Token
+
+LOG = logging.getLogger(__name__)
+
+# The counter of the revocation events, each stored under the key
+# EVENT_KEY % its id until it expires from memcache
+EVENT_COUNTER = 'revocation-events'
+EVENT_KEY = 'revocation-event-%d'
+
+# Tokens and events are stored as a version prefix followed by a JSON list
+# of their fields, a fraction of the size of the pickled models. Values
+# without a prefix were pickled by earlier versions, and are still read.
+TOKEN_FORMAT = 'T1:'
+EVENT_FORMAT = 'E1:'
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def _encode_time(value):
+    return value and value.strftime(TIME_FORMAT)
+
+
+def _decode_time(value):
+    return value and datetime.datetime.strptime(value, TIME_FORMAT)
+
+
+def _decode(value, prefix):
+    """ Returns the fields of a value stored with prefix, or None for
+    values of other (later) formats """
+    if not value.startswith(prefix):
+        LOG.warning("Ignoring a value of an unknown format: %s" % value[:3])
+        return None
+    return json.loads(value[len(prefix):])
+
+
+def encode_token(token):
+    return TOKEN_FORMAT + json.dumps(
+        [token.id, token.user_id, getattr(token, 'tenant_id', None),
+         _encode_time(token.expires)], separators=(',', ':'))
+
+
+def decode_token(value):
+    if value is None:
+        return None
+    if not isinstance(value, basestring):
+        # pickled by an earlier version
+        if not hasattr(value, 'tenant_id'):
+            value.tenant_id = None
+        return value
+    fields = _decode(value, TOKEN_FORMAT)
+    if fields is None:
+        return None
+    id, user_id, tenant_id, expires = fields
+    return Token(id=id, user_id=user_id, tenant_id=tenant_id,
+                 expires=_decode_time(expires))
+
+
+def encode_event(event):
+    return EVENT_FORMAT + json.dumps(
+        [event.id, event.type, event.target_id,
+         _encode_time(event.created)], separators=(',', ':'))
+
+
+def decode_event(value):
+    if value is None or not isinstance(value, basestring):
+        return value
+    fields = _decode(value, EVENT_FORMAT)
+    if fields is None:
+        return None
+    id, type, target_id, created = fields
+    return RevocationEvent(id=id, type=type, target_id=target_id,
+                           created=_decode_time(created))
 
 
 # pylint: disable=W0223
 class TokenAPI(BaseTokenAPI):
+    """ Stores each token under its id, and under the key of the latest
+    token of its user for its tenant (or for no tenant), which is kept
+    pointing at a stored token """
+
     def __init__(self, *args, **kw):
         super(TokenAPI, self).__init__(*args, **kw)
 
+    @staticmethod
+    def _user_key(user_id, tenant_id):
+        if tenant_id is not None:
+            return "%s::%s" % (tenant_id, user_id)
+        return "U%s" % user_id
+
     def create(self, token):
         if not hasattr(token, 'tenant_id'):
             token.tenant_id = None
-        if token.tenant_id is not None:
-            tenant_user_key = "%s::%s" % (token.tenant_id, token.user_id)
-        else:
-            tenant_user_key = "U%s" % token.user_id
-
-        MEMCACHE_SERVER.set(token.id, token)
-        MEMCACHE_SERVER.set(tenant_user_key, token)
+        value = encode_token(token)
+        # both keys in one round trip
+        MEMCACHE_SERVER.set_multi({
+            token.id: value,
+            self._user_key(token.user_id, token.tenant_id): value})
+        return token
 
     def get(self, id):
-        token = MEMCACHE_SERVER.get(id)
-        if token is not None and not hasattr(token, 'tenant_id'):
-            token.tenant_id = None
-        return token
+        return decode_token(MEMCACHE_SERVER.get(id))
+
+    def get_many(self, ids):
+        """ Returns the tokens found for ids, by id, in one round trip """
+        ids = set(id for id in ids if id is not None)
+        if not ids:
+            return {}
+        values = MEMCACHE_SERVER.get_multi(ids)
+        tokens = {}
+        for id in ids:
+            token = decode_token(values.get(id.encode('utf-8')))
+            if token is not None:
+                tokens[id] = token
+        return tokens
 
     # pylint: disable=E1103
+    def update(self, id, values):
+        token = self.get(id)
+        if token is None:
+            return
+        user_key = self._user_key(token.user_id, token.tenant_id)
+        latest = self.get(user_key)
+        token.update(values)
+        value = encode_token(token)
+        mapping = {id: value}
+        if latest is None or latest.id == id:
+            mapping[user_key] = value
+        MEMCACHE_SERVER.set_multi(mapping)
+
     def delete(self, id):
         token = self.get(id)
         if token is not None:
-            MEMCACHE_SERVER.delete(id)
-            if token is not None and not hasattr(token, 'tenant_id'):
-                token.tenant_id = None
-            if token.tenant_id is not None:
-                MEMCACHE_SERVER.delete("%s::%s" % (token.tenant_id,
-                                                   token.user_id))
-            else:
-                MEMCACHE_SERVER.delete(token.id)
-                MEMCACHE_SERVER.delete("U%s" % token.user_id)
+            keys = [id]
+            user_key = self._user_key(token.user_id, token.tenant_id)
+            latest = self.get(user_key)
+            # the user's key may already hold a later token
+            if latest is not None and latest.id == id:
+                keys.append(user_key)
+            MEMCACHE_SERVER.delete_multi(keys)
 
     def get_for_user(self, user_id):
-        token = MEMCACHE_SERVER.get("U%s" % user_id)
-        if token is not None and not hasattr(token, 'tenant_id'):
-            token.tenant_id = None
-        return  token
+        return self.get(self._user_key(user_id, None))
 
     def get_for_user_by_tenant(self, user_id, tenant_id):
-        if tenant_id is not None:
-            token = MEMCACHE_SERVER.get("%s::%s" % (tenant_id, user_id))
-        else:
-            token = MEMCACHE_SERVER.get("U%s" % user_id)
-        if token is not None and not hasattr(token, 'tenant_id'):
-            token.tenant_id = None
-        return  token
+        return self.get(self._user_key(user_id, tenant_id))
+
+    def get_validation_views(self, ids):
+        tokens = self.get_many(ids)
+        return dict((id, self._validation_view(token))
+                    for id, token in tokens.items())
+
+    def add_revocation_event(self, type, target_id):
+        event_id = MEMCACHE_SERVER.incr(EVENT_COUNTER)
+        if event_id is None:
+            # first event: start the counter (unless another server just
+            # did, which incr then follows)
+            MEMCACHE_SERVER.add(EVENT_COUNTER, '0', 0)
+            event_id = MEMCACHE_SERVER.incr(EVENT_COUNTER)
+        event = RevocationEvent(id=int(event_id), type=type,
+                                target_id=str(target_id),
+                                created=datetime.datetime.now())
+        MEMCACHE_SERVER.set(EVENT_KEY % event.id, encode_event(event),
+                            memcache.CACHE_TIME)
+        return event
+
+    def get_revocation_events(self, after, limit):
+        newest = int(MEMCACHE_SERVER.get(EVENT_COUNTER) or 0)
+        truncated = False
+        if newest < after:
+            # the counter was lost, and restarted
+            truncated = True
+            after = 0
+        ids = range(after + 1, min(newest, after + limit) + 1)
+        found = MEMCACHE_SERVER.get_multi([EVENT_KEY % id for id in ids])
+        events = [decode_event(found[EVENT_KEY % id]) for id in ids
+                  if EVENT_KEY % id in found]
+        events = [event for event in events if event is not None]
+        # an id is taken before its event is stored, by another server
+        # possibly: the cursor moves past the missing ids followed by old
+        # events, and past the last ones read only if more ids were taken
+        # after them
+        cursor = self.revocation_cursor(
+            after, events, ids[-1] if ids and ids[-1] < newest else None)
+        if after and any(EVENT_KEY % id not in found
+                         for id in range(after + 1, cursor + 1)):
+            # events expire oldest first: these were not read in time
+            truncated = True
+        return events, cursor, truncated
+
+    def delete_revocation_events(self, before):
+        # memcache expires the events after CACHE_TIME seconds
+        return 0
 
 
 def get():
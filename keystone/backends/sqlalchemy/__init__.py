@@ -22,9 +22,12 @@ from sqlalchemy.orm import joinedload, aliased, sessionmaker
 import ast
 import logging
 import os
+import random
 import sys
+import time
 
-from sqlalchemy import create_engine
+from eventlet import corolocal
+from sqlalchemy import create_engine, event, exc
 from sqlalchemy.pool import StaticPool
 
 try:
@@ -43,38 +46,150 @@ logger = logging.getLogger(__name__)  # pylint: disable=C0103
 
 _DRIVER = None
 
+# Connection shared by the sessions of the current request, and time of the
+# last write to the primary database, per green thread
+_REQUEST = corolocal.local()
+
+# Seconds after which pooled connections are replaced when sql_idle_timeout
+# is not set
+DEFAULT_POOL_RECYCLE = 3600
+
+
+class PoolStats(object):
+    """Counts the connection pool events of an engine"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.disconnects = 0
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+
+    # pylint: disable=W0613
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record,
+                     connection_proxy):
+        self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        self.checkins += 1
+
+    def stats(self):
+        """Returns the counters, and the state of the pool if it has one"""
+        stats = {'connects': self.connects,
+                 'checkouts': self.checkouts,
+                 'checkins': self.checkins,
+                 'disconnects': self.disconnects}
+        pool = self.engine.pool
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            if hasattr(pool, name):
+                stats[name] = getattr(pool, name)()
+        return stats
+
 
 class Driver():
     def __init__(self, conf):
         self.session = None
         self._engine = None
+        self.pool_stats = None
+        self.read_sessions = []
+        self.read_pool_stats = []
+        self.conf = conf
         self.connection_str = conf.sql_connection
         model_list = ast.literal_eval(conf.backend_entities)
         self._init_engine(model_list)
         self._init_models(model_list)
         self._init_session_maker()
+        self._init_read_replicas(model_list)
 
     def _init_engine(self, model_list):
         logger.info("Initializing sqlalchemy backend: %s" % \
                     self.connection_str)
+        self._engine = self._create_engine(self.connection_str)
         if self.connection_str == "sqlite://":
-            # initialize in-memory sqlite (i.e. for testing)
-            self._engine = create_engine(
-                self.connection_str,
-                connect_args={'check_same_thread': False},
-                poolclass=StaticPool)
-
             # TODO(dolph): we should be using version control, but
             # we don't have a way to pass our in-memory instance to
             # the versioning api
             self._init_tables(model_list)
         else:
-            # initialize a "real" database
-            self._engine = create_engine(
-                self.connection_str,
-                pool_recycle=3600)
             self._init_version_control()
             self._init_tables(model_list)
+        self.pool_stats = PoolStats(self._engine)
+
+    def _create_engine(self, connection_str):
+        if connection_str == "sqlite://":
+            # initialize in-memory sqlite (i.e. for testing)
+            return create_engine(
+                connection_str,
+                connect_args={'check_same_thread': False},
+                poolclass=StaticPool)
+
+        # initialize a "real" database
+        engine = create_engine(connection_str,
+                               **self._pool_args(self.conf, connection_str))
+        if self.conf.sql_pool_pre_ping:
+            event.listen(engine, 'checkout', self._ping)
+        return engine
+
+    def _init_read_replicas(self, model_list):
+        """Connects to the read replicas given in sql_read_connections,
+        and records the time of each write to the primary database by
+        each green thread"""
+        for connection_str in self.conf.sql_read_connections or []:
+            logger.info("Initializing sqlalchemy read replica: %s" %
+                        connection_str)
+            engine = self._create_engine(connection_str)
+            if connection_str == "sqlite://":
+                # an empty in-memory database (i.e. for testing)
+                models.Base.metadata.create_all(engine, checkfirst=True)
+            read_session = sessionmaker(
+                bind=engine,
+                autocommit=True,
+                expire_on_commit=False)
+            self.read_sessions.append((read_session, engine))
+            self.read_pool_stats.append(PoolStats(engine))
+
+        if self.read_sessions:
+            for name in ('after_flush', 'after_bulk_update',
+                         'after_bulk_delete'):
+                event.listen(self.session, name, self._written)
+
+    @staticmethod
+    def _written(*args):  # pylint: disable=W0613
+        _REQUEST.last_write = time.time()
+
+    @staticmethod
+    def _pool_args(conf, connection_str):
+        """Returns the create_engine() arguments configuring the pool"""
+        args = {'pool_recycle': int(conf.sql_idle_timeout or
+                                    DEFAULT_POOL_RECYCLE)}
+        if not connection_str.startswith('sqlite'):
+            # only the QueuePool of server databases takes these
+            if conf.sql_pool_size is not None:
+                args['pool_size'] = conf.sql_pool_size
+            if conf.sql_max_overflow is not None:
+                args['max_overflow'] = conf.sql_max_overflow
+            if conf.sql_pool_timeout is not None:
+                args['pool_timeout'] = conf.sql_pool_timeout
+        return args
+
+    # pylint: disable=W0613
+    def _ping(self, dbapi_connection, connection_record, connection_proxy):
+        """Checks a connection as it leaves the pool; the pool replaces it
+        (and retries) if the database closed it in the meantime"""
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+        except Exception:  # pylint: disable=W0703
+            self.pool_stats.disconnects += 1
+            raise exc.DisconnectionError()
+        finally:
+            cursor.close()
 
     def _init_version_control(self):
         """Verify the state of the database"""
@@ -117,6 +232,9 @@ class Driver():
         for model in model_list:
             model_class = getattr(models, model)
             tables.append(model_class.__table__)
+        if 'Token' in model_list:
+            # the token API also records the revocation events
+            tables.append(models.RevocationEvent.__table__)
 
         tables_to_create = []
         for table in reversed(models.Base.metadata.sorted_tables):
@@ -135,9 +253,71 @@ class Driver():
             expire_on_commit=False)
 
     def get_session(self):
-        """Creates a pre-configured database session"""
+        """Creates a pre-configured database session
+
+        Within a request scope, all sessions share the connection of the
+        scope instead of checking one out of the pool each."""
+        if getattr(_REQUEST, 'depth', 0):
+            if _REQUEST.connection is None:
+                _REQUEST.connection = self._engine.connect()
+            return self.session(bind=_REQUEST.connection)
         return self.session()
 
+    def get_read_session(self):
+        """Creates a session for read-only queries
+
+        With sql_read_connections, the session reads from a replica,
+        unless the current green thread (i.e. request, or client
+        connection) wrote to the primary database less than
+        sql_read_after_write seconds ago; replicas may not have caught up
+        with such recent writes yet. Writes by other green threads or
+        processes do not move reads to the primary database: the readers
+        that must see them retry on the primary (see read_or_primary)."""
+        if not self.read_sessions or \
+                time.time() - getattr(_REQUEST, 'last_write', 0) < \
+                (self.conf.sql_read_after_write or 0):
+            return self.get_session()
+        if getattr(_REQUEST, 'depth', 0):
+            if _REQUEST.read_connection is None:
+                read_session, engine = random.choice(self.read_sessions)
+                _REQUEST.read_connection = (read_session, engine.connect())
+            read_session, connection = _REQUEST.read_connection
+            return read_session(bind=connection)
+        read_session, _engine = random.choice(self.read_sessions)
+        return read_session()
+
+    def is_replica_session(self, session):
+        """Tells whether a session reads from a replica"""
+        return any(isinstance(session, read_session)
+                   for read_session, _engine in self.read_sessions)
+
+    @staticmethod
+    def open_request_scope():
+        """Opens a request scope for the current green thread; nested
+        scopes reuse the outer one. The connection is only checked out
+        once a session is needed."""
+        _REQUEST.depth = getattr(_REQUEST, 'depth', 0) + 1
+        if _REQUEST.depth == 1:
+            _REQUEST.connection = None
+            _REQUEST.read_connection = None
+
+    @staticmethod
+    def close_request_scope():
+        """Closes the request scope of the current green thread, returning
+        its connection to the pool"""
+        depth = getattr(_REQUEST, 'depth', 0)
+        if depth == 0:
+            return
+        _REQUEST.depth = depth - 1
+        if depth == 1:
+            connection = _REQUEST.connection
+            _REQUEST.connection = None
+            if connection is not None:
+                connection.close()
+            if _REQUEST.read_connection is not None:
+                _REQUEST.read_connection[1].close()
+                _REQUEST.read_connection = None
+
     def reset(self):
         """Unregister models and reset DB engine.
 
@@ -163,6 +343,52 @@ def get_session():
     return _DRIVER.get_session()
 
 
+def get_read_session():
+    global _DRIVER
+    return _DRIVER.get_read_session()
+
+
+def is_replica_session(session):
+    global _DRIVER
+    return _DRIVER.is_replica_session(session)
+
+
+def read_or_primary(query, session=None):
+    """Returns query(session), or query() of a read session; if that
+    session reads from a replica and the query finds nothing, the query
+    is run again on the primary database, which the replica may lag
+    behind"""
+    if session is not None:
+        return query(session)
+    session = get_read_session()
+    result = query(session)
+    if not result and is_replica_session(session):
+        result = query(get_session())
+    return result
+
+
+def open_request_scope():
+    global _DRIVER
+    if _DRIVER:
+        _DRIVER.open_request_scope()
+
+
+def close_request_scope():
+    global _DRIVER
+    if _DRIVER:
+        _DRIVER.close_request_scope()
+
+
+def get_stats():
+    """Returns the connection pool counters of the backend"""
+    global _DRIVER
+    if _DRIVER and _DRIVER.pool_stats:
+        return {'pool': _DRIVER.pool_stats.stats(),
+                'read_pools': [pool_stats.stats()
+                               for pool_stats in _DRIVER.read_pool_stats]}
+    return {}
+
+
 def unregister_models():
     global _DRIVER
     if _DRIVER:
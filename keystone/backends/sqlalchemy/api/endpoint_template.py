@@ -15,7 +15,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from keystone.backends.sqlalchemy import get_session, models, aliased
+from keystone.backends.sqlalchemy import get_session, models
+from keystone.backends.sqlalchemy.pagination import paginate
 from keystone.backends import api
 
 
@@ -82,146 +83,47 @@ class EndpointTemplateAPI(api.BaseEndpointTemplateAPI):
             filter_by(service_id=service_id).all()
 
     def get_by_service_get_page(self, service_id, marker, limit, session=None):
-        if not session:
-            session = get_session()
+        session = session or get_session()
+        query = session.query(models.EndpointTemplates).\
+            filter_by(service_id=service_id)
+        templates, _prev, _next = paginate(query, models.EndpointTemplates.id,
+                                           marker, limit)
+        return templates
 
-        if marker:
-            return session.query(models.EndpointTemplates).\
-                    filter("id>:marker").params(\
-                    marker='%s' % marker).filter_by(\
-                    service_id=service_id).order_by(\
-                    models.EndpointTemplates.id.desc()).limit(int(limit)).all()
-        else:
-            return session.query(models.EndpointTemplates).filter_by(\
-                                service_id=service_id).order_by(\
-                                models.EndpointTemplates.id.desc()).\
-                                limit(int(limit)).all()
-
-    # pylint: disable=R0912
     def get_by_service_get_page_markers(self, service_id, marker, \
         limit, session=None):
-        if not session:
-            session = get_session()
-        first = session.query(models.EndpointTemplates).filter_by(\
-                            service_id=service_id).order_by(\
-                            models.EndpointTemplates.id).first()
-        last = session.query(models.EndpointTemplates).filter_by(\
-                            service_id=service_id).order_by(\
-                            models.EndpointTemplates.id.desc()).first()
-        if first is None:
-            return (None, None)
-        if marker is None:
-            marker = first.id
-        next_page = session.query(models.EndpointTemplates).\
-            filter("id > :marker").\
-            filter_by(service_id=service_id).\
-            params(marker='%s' % marker).\
-            order_by(models.EndpointTemplates.id).\
-            limit(int(limit)).\
-            all()
-        prev_page = session.query(models.EndpointTemplates).\
-            filter("id < :marker").\
-            filter_by(service_id=service_id).\
-            params(marker='%s' % marker).\
-            order_by(models.EndpointTemplates.id.desc()).\
-            limit(int(limit)).\
-            all()
-        if len(next_page) == 0:
-            next_page = last
-        else:
-            for t in next_page:
-                next_page = t
-        if len(prev_page) == 0:
-            prev_page = first
-        else:
-            for t in prev_page:
-                prev_page = t
-        if prev_page.id == marker:
-            prev_page = None
-        else:
-            prev_page = prev_page.id
-        if next_page.id == last.id:
-            next_page = None
-        else:
-            next_page = next_page.id
-        return (prev_page, next_page)
+        session = session or get_session()
+        query = session.query(models.EndpointTemplates).\
+            filter_by(service_id=service_id)
+        _templates, prev, next = paginate(query, models.EndpointTemplates.id,
+                                          marker, limit)
+        return (prev, next)
+
+    def get_page_with_markers(self, marker, limit, session=None):
+        session = session or get_session()
+        return paginate(session.query(models.EndpointTemplates),
+                        models.EndpointTemplates.id, marker, limit)
 
     def get_page(self, marker, limit, session=None):
-        if not session:
-            session = get_session()
+        return self.get_page_with_markers(marker, limit, session)[0]
 
-        if marker:
-            return session.query(models.EndpointTemplates).\
-                    filter("id>:marker").params(\
-                    marker='%s' % marker).order_by(\
-                    models.EndpointTemplates.id.desc()).limit(int(limit)).all()
-        else:
-            return session.query(models.EndpointTemplates).order_by(\
-                                models.EndpointTemplates.id.desc()).\
-                                limit(int(limit)).all()
-
-    # pylint: disable=R0912
     def get_page_markers(self, marker, limit, session=None):
-        if not session:
-            session = get_session()
-        first = session.query(models.EndpointTemplates).order_by(\
-                            models.EndpointTemplates.id).first()
-        last = session.query(models.EndpointTemplates).order_by(\
-                            models.EndpointTemplates.id.desc()).first()
-        if first is None:
-            return (None, None)
-        if marker is None:
-            marker = first.id
-        next_page = session.query(models.EndpointTemplates).\
-            filter("id > :marker").\
-            params(marker='%s' % marker).\
-            order_by(models.EndpointTemplates.id).\
-            limit(int(limit)).\
-            all()
-        prev_page = session.query(models.EndpointTemplates).\
-            filter("id < :marker").\
-            params(marker='%s' % marker).\
-            order_by(models.EndpointTemplates.id.desc()).\
-            limit(int(limit)).\
-            all()
-        if len(next_page) == 0:
-            next_page = last
-        else:
-            for t in next_page:
-                next_page = t
-        if len(prev_page) == 0:
-            prev_page = first
-        else:
-            for t in prev_page:
-                prev_page = t
-        if prev_page.id == marker:
-            prev_page = None
-        else:
-            prev_page = prev_page.id
-        if next_page.id == last.id:
-            next_page = None
-        else:
-            next_page = next_page.id
-        return (prev_page, next_page)
-
-    def endpoint_get_by_tenant_get_page(self, tenant_id, marker, limit,
-            session=None):
-        if not session:
-            session = get_session()
+        return self.get_page_with_markers(marker, limit, session)[1:]
 
+    @staticmethod
+    def _tenant_endpoints_query(tenant_id, session):
         if hasattr(api.TENANT, 'uid_to_id'):
             tenant_id = api.TENANT.uid_to_id(tenant_id)
 
-        if marker:
-            results = session.query(models.Endpoints).\
-                filter(models.Endpoints.tenant_id == tenant_id).\
-                filter("id >= :marker").params(
-                marker='%s' % marker).order_by(
-                models.Endpoints.id).limit(int(limit)).all()
-        else:
-            results = session.query(models.Endpoints).\
-                filter(models.Endpoints.tenant_id == tenant_id).\
-                order_by(models.Endpoints.id).limit(int(limit)).all()
+        return session.query(models.Endpoints).\
+            filter(models.Endpoints.tenant_id == tenant_id)
+
+    def endpoint_get_by_tenant_get_page(self, tenant_id, marker, limit,
+            session=None):
+        session = session or get_session()
+        results, _prev, _next = paginate(
+            EndpointTemplateAPI._tenant_endpoints_query(tenant_id, session),
+            models.Endpoints.id, marker, limit)
 
         if hasattr(api.TENANT, 'id_to_uid'):
             for result in results:
@@ -229,59 +131,13 @@ class EndpointTemplateAPI(api.BaseEndpointTemplateAPI):
 
         return results
 
-    # pylint: disable=R0912
     def endpoint_get_by_tenant_get_page_markers(self, tenant_id, marker, limit,
             session=None):
-        if not session:
-            session = get_session()
-
-        if hasattr(api.TENANT, 'uid_to_id'):
-            tenant_id = api.TENANT.uid_to_id(tenant_id)
-
-        tba = aliased(models.Endpoints)
-        first = session.query(tba).\
-            filter(tba.tenant_id == tenant_id).\
-            order_by(tba.id).first()
-        last = session.query(tba).\
-            filter(tba.tenant_id == tenant_id).\
-            order_by(tba.id.desc()).first()
-        if first is None:
-            return (None, None)
-        if marker is None:
-            marker = first.id
-        next_page = session.query(tba).\
-            filter(tba.tenant_id == tenant_id).\
-            filter("id>=:marker").params(
-            marker='%s' % marker).order_by(
-            tba.id).limit(int(limit)).all()
-
-        prev_page = session.query(tba).\
-                        filter(tba.tenant_id == tenant_id).\
-                        filter("id < :marker").params(
-                        marker='%s' % marker).order_by(
-                        tba.id).limit(int(limit) + 1).all()
-        next_len = len(next_page)
-        prev_len = len(prev_page)
-
-        if next_len == 0:
-            next_page = last
-        else:
-            for t in next_page:
-                next_page = t
-        if prev_len == 0:
-            prev_page = first
-        else:
-            for t in prev_page:
-                prev_page = t
-        if first.id == marker:
-            prev_page = None
-        else:
-            prev_page = prev_page.id
-        if marker == last.id:
-            next_page = None
-        else:
-            next_page = next_page.id
-        return (prev_page, next_page)
+        session = session or get_session()
+        _results, prev, next = paginate(
+            EndpointTemplateAPI._tenant_endpoints_query(tenant_id, session),
+            models.Endpoints.id, marker, limit)
+        return (prev, next)
 
     def endpoint_add(self, values):
         if hasattr(api.TENANT, 'uid_to_id'):
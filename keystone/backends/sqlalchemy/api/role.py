@@ -15,7 +15,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from keystone.backends.sqlalchemy import get_session, models
+from keystone.backends.sqlalchemy import get_session, get_read_session, \
+    models
+from keystone.backends.sqlalchemy.pagination import paginate
 from keystone.backends import api
 from keystone.models import Role, UserRoleAssociation
 
@@ -60,6 +62,43 @@ class RoleAPI(api.BaseRoleAPI):
     def to_ura_model_list(refs):
         return [RoleAPI.to_ura_model(ref) for ref in refs]
 
+    @staticmethod
+    def _with_uids(query):
+        """ Adds the uids of the user and tenant of each grant to a query of
+        grants, so its rows need no translating afterwards
+
+        Filter the grants before calling this; filter_by() would apply to
+        the joined tables afterwards. """
+        grant = models.UserRoleAssociation
+        if hasattr(api.USER, 'uid_to_id'):
+            query = query.outerjoin(
+                (models.User, models.User.id == grant.user_id)).\
+                add_column(models.User.uid)
+        else:
+            query = query.add_column(grant.user_id)
+        if hasattr(api.TENANT, 'uid_to_id'):
+            query = query.outerjoin(
+                (models.Tenant, models.Tenant.id == grant.tenant_id)).\
+                add_column(models.Tenant.uid)
+        else:
+            query = query.add_column(grant.tenant_id)
+        return query
+
+    @staticmethod
+    def to_ura_model_with_uids(row):
+        """ Returns Keystone model object based on a row of a query made by
+        _with_uids() """
+        if row:
+            ref, user_id, tenant_id = row
+            return UserRoleAssociation(id=ref.id,
+                                       role_id=str(ref.role_id),
+                                       user_id=user_id,
+                                       tenant_id=tenant_id)
+
+    @staticmethod
+    def to_ura_model_list_with_uids(rows):
+        return [RoleAPI.to_ura_model_with_uids(row) for row in rows]
+
     # pylint: disable=W0221
     def create(self, values):
         data = values.copy()
@@ -92,13 +131,13 @@ class RoleAPI(api.BaseRoleAPI):
         if id is None:
             return None
 
-        session = session or get_session()
+        session = session or get_read_session()
         return RoleAPI.to_model(
             session.query(models.Role).filter_by(id=id).first())
 
     def get_by_name(self, name, session=None):
         if not session:
-            session = get_session()
+            session = get_read_session()
         return RoleAPI.to_model(
             session.query(models.Role).filter_by(name=name).first())
 
@@ -114,128 +153,39 @@ class RoleAPI(api.BaseRoleAPI):
             session = get_session()
         return RoleAPI.to_model_list(session.query(models.Role).all())
 
-    def get_page(self, marker, limit, session=None):
-        if not session:
-            session = get_session()
+    def get_page_with_markers(self, marker, limit, session=None):
+        session = session or get_session()
+        roles, prev, next = paginate(session.query(models.Role),
+                                     models.Role.id, marker, limit)
+        return RoleAPI.to_model_list(roles), prev, next
 
-        if marker:
-            results = session.query(models.Role).filter("id>:marker").params(
-                    marker='%s' % marker).order_by(
-                    models.Role.id.desc()).limit(int(limit)).all()
-        else:
-            results = session.query(models.Role).order_by(
-                                models.Role.id.desc()).limit(int(limit)).all()
-        return RoleAPI.to_model_list(results)
+    def get_page(self, marker, limit, session=None):
+        return self.get_page_with_markers(marker, limit, session)[0]
 
-    # pylint: disable=R0912
     def get_page_markers(self, marker, limit, session=None):
-        if not session:
-            session = get_session()
-        first = session.query(models.Role).order_by(
-                            models.Role.id).first()
-        last = session.query(models.Role).order_by(
-                            models.Role.id.desc()).first()
-        if first is None:
-            return (None, None)
-        if marker is None:
-            marker = first.id
-        next_page = session.query(models.Role).filter("id > :marker").params(
-                marker='%s' % marker).order_by(
-                models.Role.id).limit(int(limit)).all()
-        prev_page = session.query(models.Role).filter("id < :marker").params(
-                marker='%s' % marker).order_by(
-                models.Role.id.desc()).limit(int(limit)).all()
-        if not next_page:
-            next_page = last
-        else:
-            next_page = next_page[-1]
-        if not prev_page:
-            prev_page = first
-        else:
-            prev_page = prev_page[-1]
-        if prev_page.id == marker:
-            prev_page = None
-        else:
-            prev_page = prev_page.id
-        if next_page.id == last.id:
-            next_page = None
-        else:
-            next_page = next_page.id
-        return (prev_page, next_page)
+        return self.get_page_with_markers(marker, limit, session)[1:]
 
     def get_by_service_get_page(self, service_id, marker, limit, session=None):
-        if not session:
-            session = get_session()
-
-        if marker:
-            results = session.query(models.Role).filter("id>:marker").params(
-                    marker='%s' % marker).filter_by(
-                    service_id=service_id).order_by(
-                    models.Role.id.desc()).limit(int(limit)).all()
-        else:
-            results = session.query(models.Role).filter_by(
-                    service_id=service_id).order_by(
-                                models.Role.id.desc()).limit(int(limit)).all()
-        return RoleAPI.to_model_list(results)
+        session = session or get_session()
+        query = session.query(models.Role).filter_by(service_id=service_id)
+        roles, _prev, _next = paginate(query, models.Role.id, marker, limit)
+        return RoleAPI.to_model_list(roles)
 
-    # pylint: disable=R0912
     def get_by_service_get_page_markers(self,
             service_id, marker, limit, session=None):
-        if not session:
-            session = get_session()
-        first = session.query(models.Role).filter_by(
-                    service_id=service_id).order_by(
-                    models.Role.id).first()
-        last = session.query(models.Role).filter_by(
-                    service_id=service_id).order_by(
-                    models.Role.id.desc()).first()
-        if first is None:
-            return (None, None)
-        if marker is None:
-            marker = first.id
-        next_page = session.query(models.Role).filter("id > :marker").params(
-                        marker='%s' % marker).filter_by(
-                        service_id=service_id).order_by(
-                        models.Role.id).limit(int(limit)).all()
-        prev_page = session.query(models.Role).filter("id < :marker").params(
-                        marker='%s' % marker).filter_by(
-                        service_id=service_id).order_by(
-                        models.Role.id.desc()).limit(int(limit)).all()
-        if not next_page:
-            next_page = last
-        else:
-            next_page = next_page[-1]
-        if not prev_page:
-            prev_page = first
-        else:
-            prev_page = prev_page[-1]
-        if prev_page.id == marker:
-            prev_page = None
-        else:
-            prev_page = prev_page.id
-        if next_page.id == last.id:
-            next_page = None
-        else:
-            next_page = next_page.id
-        return (prev_page, next_page)
+        session = session or get_session()
+        query = session.query(models.Role).filter_by(service_id=service_id)
+        _roles, prev, next = paginate(query, models.Role.id, marker, limit)
+        return (prev, next)
 
-    #
-    # Role Grants start here
-    #
     def rolegrant_get(self, id, session=None):
         if not session:
             session = get_session()
 
-        result = session.query(models.UserRoleAssociation).filter_by(id=id).\
-            first()
-
-        if result:
-            if hasattr(api.USER, 'uid_to_id'):
-                result.user_id = api.USER.id_to_uid(result.user_id)
-            if hasattr(api.TENANT, 'uid_to_id'):
-                result.tenant_id = api.TENANT.id_to_uid(result.tenant_id)
+        query = session.query(models.UserRoleAssociation).filter_by(id=id)
 
-        return RoleAPI.to_ura_model(result)
+        return RoleAPI.to_ura_model_with_uids(
+            RoleAPI._with_uids(query).first())
 
     def list_role_grants(self, role_id=None, user_id=None, tenant_id=None,
             session=None):
@@ -267,15 +217,8 @@ class RoleAPI(api.BaseRoleAPI):
         elif tenant_id is not None:
             query = query.filter_by(tenant_id=tenant_id)
 
-        results = query.all()
-
-        for result in results:
-            if hasattr(api.USER, 'uid_to_id'):
-                result.user_id = api.USER.id_to_uid(result.user_id)
-            if hasattr(api.TENANT, 'uid_to_id'):
-                result.tenant_id = api.TENANT.id_to_uid(result.tenant_id)
-
-        return RoleAPI.to_ura_model_list(results)
+        return RoleAPI.to_ura_model_list_with_uids(
+            RoleAPI._with_uids(query).all())
 
     def rolegrant_delete(self, id, session=None):
         if not session:
@@ -286,150 +229,78 @@ class RoleAPI(api.BaseRoleAPI):
                     filter_by(id=id).first()
             session.delete(rolegrant)
 
-    # pylint: disable=R0912
-    def rolegrant_get_page_markers(self, user_id, tenant_id, marker,
-            limit, session=None):
-        if not session:
-            session = get_session()
-
+    @staticmethod
+    def _rolegrants_query(user_id, tenant_id, session):
+        """ Returns a query of the grants of a user in a tenant (or its
+        global grants), with uids """
         if hasattr(api.USER, 'uid_to_id'):
             user_id = api.USER.uid_to_id(user_id)
         if hasattr(api.TENANT, 'uid_to_id'):
             tenant_id = api.TENANT.uid_to_id(tenant_id)
 
-        query = session.query(models.UserRoleAssociation).filter_by(
-                user_id=user_id)
+        grant = models.UserRoleAssociation
+        query = session.query(grant).filter_by(user_id=user_id)
         if tenant_id:
             query = query.filter_by(tenant_id=tenant_id)
         else:
-            query = query.filter("tenant_id is null")
-        first = query.order_by(models.UserRoleAssociation.id).first()
-        last = query.order_by(models.UserRoleAssociation.id.desc()).first()
-        if first is None:
-            return (None, None)
-        if marker is None:
-            marker = first.id
-        next_page = query.\
-            filter("id > :marker").\
-            params(marker='%s' % marker).\
-            order_by(models.UserRoleAssociation.id).\
-            limit(int(limit)).\
-            all()
-        prev_page = query.\
-            filter("id < :marker").\
-            params(marker='%s' % marker).\
-            order_by(models.UserRoleAssociation.id.desc()).\
-            limit(int(limit)).\
-            all()
-
-        if not next_page:
-            next_page = last
-        else:
-            next_page = next_page[-1]
-        if not prev_page:
-            prev_page = first
-        else:
-            prev_page = prev_page[-1]
-        if prev_page.id == marker:
-            prev_page = None
-        else:
-            prev_page = prev_page.id
-        if next_page.id == last.id:
-            next_page = None
-        else:
-            next_page = next_page.id
-        return (prev_page, next_page)
+            query = query.filter(grant.tenant_id == None)
+        return RoleAPI._with_uids(query)
+
+    def rolegrant_get_page_markers(self, user_id, tenant_id, marker,
+            limit, session=None):
+        session = session or get_session()
+        _rows, prev, next = paginate(
+            RoleAPI._rolegrants_query(user_id, tenant_id, session),
+            models.UserRoleAssociation.id, marker, limit)
+        return (prev, next)
 
     def rolegrant_get_page(self, marker, limit, user_id, tenant_id,
                            session=None):
-        if not session:
-            session = get_session()
-
-        if hasattr(api.USER, 'uid_to_id'):
-            user_id = api.USER.uid_to_id(user_id)
-        if hasattr(api.TENANT, 'uid_to_id'):
-            tenant_id = api.TENANT.uid_to_id(tenant_id)
-
-        query = session.query(models.UserRoleAssociation).\
-                filter_by(user_id=user_id)
-        if tenant_id:
-            query = query.filter_by(tenant_id=tenant_id)
-        else:
-            query = query.filter("tenant_id is null")
-        if marker:
-            results = query.filter("id>:marker").params(
-                    marker='%s' % marker).order_by(
-                    models.UserRoleAssociation.id.desc()).limit(
-                    int(limit)).all()
-        else:
-            results = query.order_by(
-                    models.UserRoleAssociation.id.desc()).limit(
-                    int(limit)).all()
-
-        for result in results:
-            if hasattr(api.USER, 'uid_to_id'):
-                result.user_id = api.USER.id_to_uid(result.user_id)
-            if hasattr(api.TENANT, 'uid_to_id'):
-                result.tenant_id = api.TENANT.id_to_uid(result.tenant_id)
-
-        return RoleAPI.to_ura_model_list(results)
+        session = session or get_session()
+        rows, _prev, _next = paginate(
+            RoleAPI._rolegrants_query(user_id, tenant_id, session),
+            models.UserRoleAssociation.id, marker, limit)
+        return RoleAPI.to_ura_model_list_with_uids(rows)
 
     def list_global_roles_for_user(self, user_id, session=None):
         if not session:
-            session = get_session()
+            session = get_read_session()
 
         if hasattr(api.USER, 'uid_to_id'):
             user_id = api.USER.uid_to_id(user_id)
 
-        results = session.query(models.UserRoleAssociation).\
-            filter_by(user_id=user_id).filter("tenant_id is null").all()
-
-        for result in results:
-            result['role_id'] = str(result['role_id'])
-            if hasattr(api.USER, 'uid_to_id'):
-                result.user_id = api.USER.id_to_uid(result.user_id)
-            if hasattr(api.TENANT, 'uid_to_id'):
-                result.tenant_id = api.TENANT.id_to_uid(result.tenant_id)
+        query = session.query(models.UserRoleAssociation).\
+            filter_by(user_id=user_id).\
+            filter(models.UserRoleAssociation.tenant_id == None)
 
-        return RoleAPI.to_ura_model_list(results)
+        return RoleAPI.to_ura_model_list_with_uids(
+            RoleAPI._with_uids(query).all())
 
     def list_tenant_roles_for_user(self, user_id, tenant_id, session=None):
         if not session:
-            session = get_session()
+            session = get_read_session()
 
         if hasattr(api.USER, 'uid_to_id'):
             user_id = api.USER.uid_to_id(user_id)
         if hasattr(api.TENANT, 'uid_to_id'):
             tenant_id = api.TENANT.uid_to_id(tenant_id)
 
-        results = session.query(models.UserRoleAssociation).\
-                filter_by(user_id=user_id).filter_by(tenant_id=tenant_id).all()
-
-        for result in results:
-            result['role_id'] = str(result['role_id'])
-            if hasattr(api.USER, 'uid_to_id'):
-                result.user_id = api.USER.id_to_uid(result.user_id)
-            if hasattr(api.TENANT, 'uid_to_id'):
-                result.tenant_id = api.TENANT.id_to_uid(result.tenant_id)
+        query = session.query(models.UserRoleAssociation).\
+                filter_by(user_id=user_id).filter_by(tenant_id=tenant_id)
 
-        return RoleAPI.to_ura_model_list(results)
+        return RoleAPI.to_ura_model_list_with_uids(
+            RoleAPI._with_uids(query).all())
 
     def rolegrant_list_by_role(self, role_id, session=None):
         """ Get a list of all (global and tenant) grants for this role """
         if not session:
             session = get_session()
 
-        results = session.query(models.UserRoleAssociation).\
-            filter_by(role_id=role_id).all()
-
-        for result in results:
-            result['role_id'] = str(result['role_id'])
-            if hasattr(api.USER, 'uid_to_id'):
-                result.user_id = api.USER.id_to_uid(result.user_id)
-            if hasattr(api.TENANT, 'uid_to_id'):
-                result.tenant_id = api.TENANT.id_to_uid(result.tenant_id)
+        query = session.query(models.UserRoleAssociation).\
+            filter_by(role_id=role_id)
 
-        return RoleAPI.to_ura_model_list(results)
+        return RoleAPI.to_ura_model_list_with_uids(
+            RoleAPI._with_uids(query).all())
 
     def rolegrant_get_by_ids(self, user_id, role_id, tenant_id, session=None):
         if not session:
@@ -440,23 +311,15 @@ class RoleAPI(api.BaseRoleAPI):
         if hasattr(api.TENANT, 'uid_to_id'):
             tenant_id = api.TENANT.uid_to_id(tenant_id)
 
+        query = session.query(models.UserRoleAssociation).\
+            filter_by(user_id=user_id).filter_by(role_id=role_id)
         if tenant_id is None:
-            result = session.query(models.UserRoleAssociation).\
-                filter_by(user_id=user_id).filter("tenant_id is null").\
-                filter_by(role_id=role_id).first()
+            query = query.filter(models.UserRoleAssociation.tenant_id == None)
         else:
-            result = session.query(models.UserRoleAssociation).\
-                filter_by(user_id=user_id).filter_by(tenant_id=tenant_id).\
-                filter_by(role_id=role_id).first()
-
-        if result:
-            result['role_id'] = str(result['role_id'])
-            if hasattr(api.USER, 'uid_to_id'):
-                result.user_id = api.USER.id_to_uid(result.user_id)
-            if hasattr(api.TENANT, 'uid_to_id'):
-                result.tenant_id = api.TENANT.id_to_uid(result.tenant_id)
-
-        return RoleAPI.to_ura_model(result)
+            query = query.filter_by(tenant_id=tenant_id)
+
+        return RoleAPI.to_ura_model_with_uids(
+            RoleAPI._with_uids(query).first())
 
 
 def get():
@@ -16,6 +16,7 @@
 #    under the License.
 
 from keystone.backends.sqlalchemy import get_session, models
+from keystone.backends.sqlalchemy.pagination import paginate
 from keystone.backends import api
 from keystone.models import Service
 
@@ -129,57 +130,17 @@ class ServiceAPI(api.BaseServiceAPI):
             session = get_session()
         return ServiceAPI.to_model_list(session.query(models.Service).all())
 
-    def get_page(self, marker, limit, session=None):
+    def get_page_with_markers(self, marker, limit, session=None):
         if not session:
             session = get_session()
-        if marker:
-            return session.query(models.Service).filter("id>:marker").params(
-                    marker='%s' % marker).order_by(
-                    models.Service.id.desc()).limit(int(limit)).all()
-        else:
-            return session.query(models.Service).order_by(
-                                models.Service.id.desc()).limit(
-                                int(limit)).all()
+        return paginate(session.query(models.Service), models.Service.id,
+                        marker, limit)
 
-    @staticmethod
-    def get_page_markers(marker, limit, session=None):
-        if not session:
-            session = get_session()
-        first = session.query(models.Service).order_by(
-                            models.Service.id).first()
-        last = session.query(models.Service).order_by(
-                            models.Service.id.desc()).first()
-        if first is None:
-            return (None, None)
-        if marker is None:
-            marker = first.id
-        next_page = session.query(models.Service).\
-                        filter("id > :marker").params(
-                        marker='%s' % marker).order_by(
-                        models.Service.id).limit(int(limit)).all()
-        prev_page = session.query(models.Service).\
-                        filter("id < :marker").params(
-                        marker='%s' % marker).order_by(
-                        models.Service.id.desc()).limit(int(limit)).all()
-        if len(next_page) == 0:
-            next_page = last
-        else:
-            for t in next_page:
-                next_page = t
-        if len(prev_page) == 0:
-            prev_page = first
-        else:
-            for t in prev_page:
-                prev_page = t
-        if prev_page.id == marker:
-            prev_page = None
-        else:
-            prev_page = prev_page.id
-        if next_page.id == last.id:
-            next_page = None
-        else:
-            next_page = next_page.id
-        return (prev_page, next_page)
+    def get_page(self, marker, limit, session=None):
+        return self.get_page_with_markers(marker, limit, session)[0]
+
+    def get_page_markers(self, marker, limit, session=None):
+        return self.get_page_with_markers(marker, limit, session)[1:]
 
     def delete(self, id, session=None):
         if not session:
@@ -17,13 +17,24 @@
 
 import uuid
 
-from keystone.backends.sqlalchemy import get_session, models, aliased
+from sqlalchemy import or_
+
+from keystone import config
+from keystone.backends.sqlalchemy import get_session, get_read_session, \
+    read_or_primary, models, aliased
+from keystone.backends.sqlalchemy.pagination import paginate
 from keystone.backends import api
+from keystone.common.cache import UidMap
 from keystone.models import Tenant
 
+CONF = config.CONF
+
 
 # pylint: disable=E1103,W0221
 class TenantAPI(api.BaseTenantAPI):
+    # uid <-> id pairs of the tenants seen by this process
+    uids = UidMap(0)
+
     def __init__(self, *args, **kw):
         super(TenantAPI, self).__init__(*args, **kw)
 
@@ -53,6 +64,7 @@ class TenantAPI(api.BaseTenantAPI):
     def to_model(ref):
         """ Returns Keystone model object based on SQLAlchemy model"""
         if ref:
+            TenantAPI.uids.add(ref.uid, ref.id)
             return Tenant(id=ref.uid, name=ref.name, description=ref.desc,
                 enabled=bool(ref.enabled))
 
@@ -84,7 +96,7 @@ class TenantAPI(api.BaseTenantAPI):
         if id is None:
             return None
 
-        session = session or get_session()
+        session = session or get_read_session()
 
         result = session.query(models.Tenant).filter_by(uid=id).first()
 
@@ -103,7 +115,7 @@ class TenantAPI(api.BaseTenantAPI):
         if id is None:
             return None
 
-        session = session or get_session()
+        session = session or get_read_session()
 
         return session.query(models.Tenant).filter_by(id=id).first()
 
@@ -112,21 +124,36 @@ class TenantAPI(api.BaseTenantAPI):
         if id is None:
             return None
 
-        session = session or get_session()
-        tenant = session.query(models.Tenant).filter_by(id=id).first()
-        return tenant.uid if tenant else None
+        uid = TenantAPI.uids.get_uid(id)
+        if uid is not None:
+            return uid
+
+        # a tenant created by another process may not be on the replica yet
+        tenant = read_or_primary(lambda session: session.query(models.Tenant).
+                                 filter_by(id=id).first(), session)
+        if tenant is None:
+            return None
+        TenantAPI.uids.add(tenant.uid, tenant.id)
+        return tenant.uid
 
     @staticmethod
     def uid_to_id(uid, session=None):
         if uid is None:
             return None
 
-        session = session or get_session()
-        tenant = session.query(models.Tenant).filter_by(uid=uid).first()
-        return tenant.id if tenant else None
+        id = TenantAPI.uids.get_id(uid)
+        if id is not None:
+            return id
+
+        tenant = read_or_primary(lambda session: session.query(models.Tenant).
+                                 filter_by(uid=uid).first(), session)
+        if tenant is None:
+            return None
+        TenantAPI.uids.add(tenant.uid, tenant.id)
+        return tenant.id
 
     def get_by_name(self, name, session=None):
-        session = session or get_session()
+        session = session or get_read_session()
 
         result = session.query(models.Tenant).filter_by(name=name).first()
 
@@ -140,152 +167,52 @@ class TenantAPI(api.BaseTenantAPI):
 
         return TenantAPI.to_model_list(results)
 
-    def list_for_user_get_page(self, user_id, marker, limit, session=None):
-        if not session:
-            session = get_session()
-
+    def _list_for_user_query(self, user_id, session):
+        """ Returns a query of the tenants a user has roles in, or belongs
+        to by default """
         user = api.USER.get(user_id)
         if hasattr(api.USER, 'uid_to_id'):
             backend_user_id = api.USER.uid_to_id(user_id)
         else:
             backend_user_id = user_id
 
-        ura = aliased(models.UserRoleAssociation)
-        tenant = aliased(models.Tenant)
-        q1 = session.query(tenant).join((ura, ura.tenant_id == tenant.id)).\
-            filter(ura.user_id == backend_user_id)
+        granted = session.query(models.UserRoleAssociation.tenant_id).\
+            filter(models.UserRoleAssociation.user_id == backend_user_id)
+        criteria = models.Tenant.id.in_(granted.subquery())
         if 'tenant_id' in user:
             if hasattr(api.TENANT, 'uid_to_id'):
                 backend_tenant_id = api.TENANT.uid_to_id(user.tenant_id)
             else:
                 backend_tenant_id = user.tenant_id
-            q2 = session.query(tenant).filter(tenant.id == backend_tenant_id)
-            q3 = q1.union(q2)
-        else:
-            q3 = q1
-        if marker:
-            results = q3.filter("tenant.id>:marker").params(
-                    marker='%s' % marker).order_by(
-                    tenant.id.desc()).limit(int(limit)).all()
-        else:
-            results = q3.order_by(tenant.id.desc()).limit(int(limit)).all()
+            criteria = or_(criteria, models.Tenant.id == backend_tenant_id)
+        return session.query(models.Tenant).filter(criteria)
 
-        return TenantAPI.to_model_list(results)
+    def list_for_user_get_page(self, user_id, marker, limit, session=None):
+        session = session or get_session()
+        tenants, _prev, _next = paginate(
+            self._list_for_user_query(user_id, session), models.Tenant.id,
+            marker, limit)
+        return TenantAPI.to_model_list(tenants)
 
-    # pylint: disable=R0912
     def list_for_user_get_page_markers(self, user_id, marker, limit,
             session=None):
-        if not session:
-            session = get_session()
-
-        user = api.USER.get(user_id)
-        if hasattr(api.USER, 'uid_to_id'):
-            backend_user_id = api.USER.uid_to_id(user_id)
-        else:
-            backend_user_id = user_id
+        session = session or get_session()
+        _tenants, prev, next = paginate(
+            self._list_for_user_query(user_id, session), models.Tenant.id,
+            marker, limit)
+        return (prev, next)
 
-        ura = aliased(models.UserRoleAssociation)
-        tenant = aliased(models.Tenant)
-        q1 = session.query(tenant).join((ura, ura.tenant_id == tenant.id)).\
-            filter(ura.user_id == backend_user_id)
-        if 'tenant_id' in user:
-            if hasattr(api.TENANT, 'uid_to_id'):
-                backend_tenant_id = api.TENANT.uid_to_id(user.tenant_id)
-            else:
-                backend_tenant_id = user.tenant_id
-            q2 = session.query(tenant).filter(tenant.id == backend_tenant_id)
-            q3 = q1.union(q2)
-        else:
-            q3 = q1
-
-        first = q3.order_by(tenant.id).first()
-        last = q3.order_by(tenant.id.desc()).first()
-        if first is None:
-            return (None, None)
-        if marker is None:
-            marker = first.id
-        next_page = q3.filter(tenant.id > marker).order_by(
-                        tenant.id).limit(int(limit)).all()
-        prev_page = q3.filter(tenant.id > marker).order_by(
-                        tenant.id.desc()).limit(int(limit)).all()
-        if len(next_page) == 0:
-            next_page = last
-        else:
-            for t in next_page:
-                next_page = t
-        if len(prev_page) == 0:
-            prev_page = first
-        else:
-            for t in prev_page:
-                prev_page = t
-        if prev_page.id == marker:
-            prev_page = None
-        else:
-            prev_page = prev_page.id
-        if next_page.id == last.id:
-            next_page = None
-        else:
-            next_page = next_page.id
-        return (prev_page, next_page)
+    def get_page_with_markers(self, marker, limit, session=None):
+        session = session or get_session()
+        tenants, prev, next = paginate(session.query(models.Tenant),
+                                       models.Tenant.id, marker, limit)
+        return TenantAPI.to_model_list(tenants), prev, next
 
     def get_page(self, marker, limit, session=None):
-        if not session:
-            session = get_session()
+        return self.get_page_with_markers(marker, limit, session)[0]
 
-        if marker:
-            tenants = session.query(models.Tenant).\
-                    filter("id>:marker").params(
-                    marker='%s' % marker).order_by(
-                    models.Tenant.id.desc()).limit(int(limit)).all()
-        else:
-            tenants = session.query(models.Tenant).order_by(
-                    models.Tenant.id.desc()).limit(int(limit)).all()
-
-        return self.to_model_list(tenants)
-
-    # pylint: disable=R0912
     def get_page_markers(self, marker, limit, session=None):
-        if not session:
-            session = get_session()
-        first = session.query(models.Tenant).order_by(
-                            models.Tenant.id).first()
-        last = session.query(models.Tenant).order_by(
-                            models.Tenant.id.desc()).first()
-        if first is None:
-            return (None, None)
-        if marker is None:
-            marker = first.id
-        next_page = session.query(models.Tenant).\
-            filter("id > :marker").\
-            params(marker='%s' % marker).\
-            order_by(models.Tenant.id).\
-            limit(int(limit)).\
-            all()
-        prev_page = session.query(models.Tenant).\
-            filter("id < :marker").\
-            params(marker='%s' % marker).\
-            order_by(models.Tenant.id.desc()).\
-            limit(int(limit)).\
-            all()
-        if len(next_page) == 0:
-            next_page = last
-        else:
-            for t in next_page:
-                next_page = t
-        if len(prev_page) == 0:
-            prev_page = first
-        else:
-            for t in prev_page:
-                prev_page = t
-        if prev_page.id == marker:
-            prev_page = None
-        else:
-            prev_page = prev_page.id
-        if next_page.id == last.id:
-            next_page = None
-        else:
-            next_page = next_page.id
-        return (prev_page, next_page)
+        return self.get_page_with_markers(marker, limit, session)[1:]
 
     def is_empty(self, id, session=None):
         if not session:
@@ -315,6 +242,9 @@ class TenantAPI(api.BaseTenantAPI):
         data = values.copy()
         TenantAPI.transpose(data)
 
+        if 'uid' in data:
+            TenantAPI.uids.remove(uid=id, id=pkid)
+
         with session.begin():
             tenant_ref = self._get_by_id(pkid, session)
             tenant_ref.update(data)
@@ -329,12 +259,14 @@ class TenantAPI(api.BaseTenantAPI):
             raise fault.ForbiddenFault("You may not delete a tenant that "
                                        "contains users")
 
+        uid = id
         if hasattr(api.TENANT, 'uid_to_id'):
             id = self.uid_to_id(id)
 
         with session.begin():
             tenant_ref = self._get_by_id(id, session)
             session.delete(tenant_ref)
+        TenantAPI.uids.remove(uid=uid, id=id)
 
     def get_all_endpoints(self, tenant_id, session=None):
         if not session:
@@ -374,4 +306,7 @@ class TenantAPI(api.BaseTenantAPI):
 
 
 def get():
+    sqla = CONF['keystone.backends.sqlalchemy']
+    # a fresh map per configured backend, as the ids may have changed
+    TenantAPI.uids = UidMap(sqla.uid_cache_max_entries, sqla.uid_cache_ttl)
     return TenantAPI()
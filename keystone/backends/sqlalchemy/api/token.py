@@ -15,9 +15,29 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from keystone.backends.sqlalchemy import get_session, models
+import datetime
+import logging
+import re
+import time
+
+from sqlalchemy import and_, or_, exc, func, Index, MetaData, Table
+from sqlalchemy.orm import mapper
+
+from keystone import config
+from keystone.backends.sqlalchemy import get_session, get_read_session, \
+    is_replica_session, read_or_primary, models, aliased
+from keystone.backends.sqlalchemy.api.role import RoleAPI
+from keystone.backends.sqlalchemy.api.tenant import TenantAPI
+from keystone.backends.sqlalchemy.api.user import UserAPI
 from keystone.backends import api
-from keystone.models import Token
+from keystone.models import RevocationEvent, Token, User
+
+CONF = config.CONF
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+# Token ids per IN clause (keeps queries below the bind parameter limits of
+# the databases)
+IN_CLAUSE_SIZE = 200
 
 
 # pylint: disable=E1103,W0221
@@ -63,10 +83,25 @@ class TokenAPI(api.BaseTokenAPI):
     def to_model_list(refs):
         return [TokenAPI.to_model(ref) for ref in refs]
 
+    # pylint: disable=W0613
+    def _token_models(self, session, expired=False):
+        """ Returns the models of the tables holding tokens, newest first
+
+        :param expired: include tables that can only hold expired tokens
+        """
+        return [models.Token]
+
+    # pylint: disable=W0613
+    def _token_model_for(self, expires, session):
+        """ Returns the model of the table a token expiring at expires
+        belongs in """
+        return models.Token
+
     def create(self, values):
         data = values.copy()
         TokenAPI.transpose(data)
-        token_ref = models.Token()
+        token_ref = self._token_model_for(data.get('expires'),
+                                          get_session())()
         token_ref.update(data)
         token_ref.save()
         return TokenAPI.to_model(token_ref)
@@ -76,26 +111,35 @@ class TokenAPI(api.BaseTokenAPI):
 
         return TokenAPI.to_model(result)
 
-    @staticmethod
-    def _get(id, session=None):
+    def _get(self, id, session=None):
         if id is None:
             return None
 
-        session = session or get_session()
-
-        result = session.query(models.Token).filter_by(id=id).first()
+        def query(session):
+            for model in self._token_models(session):
+                result = session.query(model).filter_by(id=id).first()
+                if result is not None:
+                    return result
 
-        return result
+        # a token created by another process may not be on the replica yet
+        return read_or_primary(query, session)
 
-    @staticmethod
-    def update(id, values, session=None):
+    def update(self, id, values, session=None):
         if not session:
             session = get_session()
 
         TokenAPI.transpose(values)
 
         with session.begin():
-            ref = session.query(models.Token).filter_by(id=id).first()
+            ref = self._get(id, session)
+            model = self._token_model_for(values.get('expires', ref.expires),
+                                          session)
+            if not isinstance(ref, model):
+                # the new expiry belongs in another table
+                session.delete(ref)
+                data = dict(ref)
+                ref = model()
+                ref.update(data)
             ref.update(values)
             ref.save(session=session)
 
@@ -108,42 +152,385 @@ class TokenAPI(api.BaseTokenAPI):
             session.delete(token_ref)
 
     def get_for_user(self, user_id, session=None):
-        if not session:
-            session = get_session()
-
         if hasattr(api.USER, 'uid_to_id'):
             user_id = api.USER.uid_to_id(user_id)
 
-        result = session.query(models.Token).filter_by(
-            user_id=user_id, tenant_id=None).order_by("expires desc").first()
-
-        return TokenAPI.to_model(result)
+        return TokenAPI.to_model(read_or_primary(
+            lambda session: self._find(session, user_id, None), session))
 
     def get_for_user_by_tenant(self, user_id, tenant_id, session=None):
-        if not session:
-            session = get_session()
-
         if hasattr(api.USER, 'uid_to_id'):
             user_id = api.USER.uid_to_id(user_id)
 
         if hasattr(api.TENANT, 'uid_to_id'):
             tenant_id = api.TENANT.uid_to_id(tenant_id)
 
-        result = session.query(models.Token).\
-            filter_by(user_id=user_id, tenant_id=tenant_id).\
-            order_by("expires desc").\
-            first()
-
-        return TokenAPI.to_model(result)
+        return TokenAPI.to_model(read_or_primary(
+            lambda session: self._find(session, user_id, tenant_id),
+            session))
+
+    def _find(self, session, user_id, tenant_id):
+        """ Returns the newest token of a user for a tenant (or None) """
+        for model in self._token_models(session):
+            # (user_id, tenant_id [IS NULL], expires desc) walks the
+            # ix_tokens_user_tenant_expires index backwards
+            result = session.query(model).\
+                filter(model.user_id == user_id).\
+                filter(model.tenant_id == tenant_id).\
+                order_by(model.expires.desc()).\
+                first()
+            if result is not None:
+                return result
 
     def get_all(self, session=None):
         if not session:
             session = get_session()
 
-        results = session.query(models.Token).all()
+        results = []
+        for model in self._token_models(session, expired=True):
+            results.extend(session.query(model).all())
 
         return TokenAPI.to_model_list(results)
 
+    def delete_expired(self, before, limit, session=None):
+        """ Deletes up to limit tokens that expired before the given time.
+        Each table is purged in its own short transaction, which only
+        locks the rows it deletes. """
+        session = session or get_session()
+
+        deleted = 0
+        for model in self._token_models(session, expired=True):
+            if deleted >= limit:
+                break
+            deleted += self._delete_expired_rows(session, model, before,
+                                                 limit - deleted)
+        return deleted
+
+    @staticmethod
+    def _delete_expired_rows(session, model, before, limit):
+        with session.begin():
+            # the ix_tokens_expires index finds the expired rows
+            ids = [id for (id,) in session.query(model.id).
+                   filter(model.expires < before).
+                   limit(limit)]
+            for i in range(0, len(ids), IN_CLAUSE_SIZE):
+                session.query(model).\
+                    filter(model.id.in_(ids[i:i + IN_CLAUSE_SIZE])).\
+                    delete(synchronize_session=False)
+        return len(ids)
+
+    @staticmethod
+    def _event_to_model(ref):
+        return RevocationEvent(id=ref.id, type=ref.type,
+                               target_id=ref.target_id, created=ref.created)
+
+    def add_revocation_event(self, type, target_id, session=None):
+        ref = models.RevocationEvent()
+        ref.update({'type': type, 'target_id': str(target_id),
+                    'created': datetime.datetime.now()})
+        ref.save(session=session or get_session())
+        return TokenAPI._event_to_model(ref)
+
+    def get_revocation_events(self, after, limit, session=None):
+        # read from the primary database: a replica lagging behind would
+        # make readers skip the events it has not received yet
+        session = session or get_session()
+        model = models.RevocationEvent
+        truncated = False
+        if after:
+            # events are deleted oldest first, and the newest one is never
+            # deleted: the events after the last one read were deleted only
+            # if it was (or if the events were lost altogether)
+            if session.query(model.id).filter(model.id == after).\
+                    first() is None:
+                truncated = True
+                after = 0
+        refs = session.query(model).\
+            filter(model.id > after).\
+            order_by(model.id).\
+            limit(limit).\
+            all()
+        events = [TokenAPI._event_to_model(ref) for ref in refs]
+        # ids are assigned when the events are inserted, and become visible
+        # when they are committed, which may be in another order
+        return events, self.revocation_cursor(after, events), truncated
+
+    def delete_revocation_events(self, before, session=None):
+        session = session or get_session()
+        model = models.RevocationEvent
+        with session.begin():
+            newest = session.query(func.max(model.id)).scalar()
+            if newest is None:
+                return 0
+            return session.query(model).\
+                filter(model.created < before).\
+                filter(model.id < newest).\
+                delete(synchronize_session=False)
+
+    @staticmethod
+    def _is_sql_identity():
+        """ True if users, tenants and roles also live in this backend """
+        return (isinstance(api.USER, UserAPI) and
+                isinstance(api.TENANT, TenantAPI) and
+                isinstance(api.ROLE, RoleAPI))
+
+    def get_validation_view(self, id, session=None):
+        """ Loads the token, its user, both tenants and all of the user's
+        global and token-scoped role grants in a single joined query """
+        if not TokenAPI._is_sql_identity():
+            return super(TokenAPI, self).get_validation_view(id)
+
+        if id is None:
+            return None
+
+        return read_or_primary(
+            lambda session: self._get_validation_views([id], session).get(id),
+            session)
+
+    def get_validation_views(self, ids, session=None):
+        """ Loads the validation views of many tokens with the same joined
+        query as get_validation_view, IN_CLAUSE_SIZE tokens at a time """
+        if not TokenAPI._is_sql_identity():
+            return super(TokenAPI, self).get_validation_views(ids)
+
+        def load(ids, session):
+            views = {}
+            for i in range(0, len(ids), IN_CLAUSE_SIZE):
+                views.update(self._get_validation_views(
+                    ids[i:i + IN_CLAUSE_SIZE], session))
+            return views
+
+        ids = sorted(set(id for id in ids if id is not None))
+        if session is not None:
+            return load(ids, session)
+        session = get_read_session()
+        views = load(ids, session)
+        missing = [id for id in ids if id not in views]
+        if missing and is_replica_session(session):
+            # tokens created by other processes may not be on the replica
+            # yet
+            views.update(load(missing, get_session()))
+        return views
+
+    def _get_validation_views(self, ids, session=None):
+        session = session or get_read_session()
+
+        views = {}
+        for model in self._token_models(session):
+            missing = [id for id in ids if id not in views]
+            if not missing:
+                break
+            views.update(TokenAPI._query_validation_views(missing, session,
+                                                          model))
+        return views
+
+    @staticmethod
+    def _query_validation_views(ids, session, token_model):
+        user_tenant = aliased(models.Tenant)
+        token_tenant = aliased(models.Tenant)
+        grant = aliased(models.UserRoleAssociation)
+        # global grants, plus the grants on the tenant the token is scoped to
+        grant_scope = or_(grant.tenant_id == None,
+                          grant.tenant_id == token_model.tenant_id)
+        rows = session.query(token_model, models.User, user_tenant,
+                             token_tenant, grant, models.Role).\
+            outerjoin((models.User, models.User.id == token_model.user_id)).\
+            outerjoin((user_tenant, user_tenant.id == models.User.tenant_id)).\
+            outerjoin((token_tenant,
+                       token_tenant.id == token_model.tenant_id)).\
+            outerjoin((grant, and_(grant.user_id == models.User.id,
+                                   grant_scope))).\
+            outerjoin((models.Role, models.Role.id == grant.role_id)).\
+            filter(token_model.id.in_(ids)).\
+            order_by(token_model.id, grant.id).\
+            all()
+
+        views = {}
+        for row in rows:
+            dtoken, duser, dutenant, dttenant, dgrant, drole = row
+            view = views.get(dtoken.id)
+            if view is None:
+                view = views[dtoken.id] = TokenAPI._new_validation_view(
+                    dtoken, duser, dutenant, dttenant)
+            if dgrant is None or drole is None:
+                continue
+            role = RoleAPI.to_model(drole)
+            if dgrant.tenant_id is None:
+                view['global_roles'].append(role)
+            elif dttenant is not None:
+                role.tenant_id = dttenant.uid
+                view['tenant_roles'].append(role)
+        return views
+
+    @staticmethod
+    def _new_validation_view(dtoken, duser, dutenant, dttenant):
+        token = Token(id=dtoken.id,
+                      user_id=duser.uid if duser else None,
+                      expires=dtoken.expires,
+                      tenant_id=dttenant.uid if dttenant else None)
+        user = None
+        if duser:
+            user = User(id=duser.uid, password=duser.password,
+                        name=duser.name,
+                        tenant_id=dutenant.uid if dutenant else None,
+                        email=duser.email, enabled=bool(duser.enabled))
+
+        return {'token': token,
+                'user': user,
+                'user_tenant': TenantAPI.to_model(dutenant),
+                'token_tenant': TenantAPI.to_model(dttenant),
+                'tenant_roles': [],
+                'global_roles': []}
+
+
+# Bucket tables are named after the hour their bucket ends
+BUCKET_PREFIX = 'tokens_'
+BUCKET_FORMAT = '%Y%m%d%H'
+BUCKET_TABLE = re.compile(r'^%s(\d{10})$' % BUCKET_PREFIX)
+EPOCH = datetime.datetime(1970, 1, 1)
+# Seconds between two listings of the bucket tables on lookup misses
+BUCKET_RELIST_INTERVAL = 1
+
+BUCKET_METADATA = MetaData()
+BUCKET_MODELS = {}
+
+
+def bucket_model(name):
+    """ Returns the model class mapped to the bucket table name """
+    model = BUCKET_MODELS.get(name)
+    if model is None:
+        columns = [column.copy() for column in models.Token.__table__.c]
+        table = Table(name, BUCKET_METADATA, *columns)
+        for index in models.Token.__table__.indexes:
+            # index names are unique per database
+            Index(index.name.replace('tokens', name, 1),
+                  *[table.c[column.name] for column in index.columns])
+        model = type('Token_%s' % name, (models.KeystoneBase,),
+                     {'__table__': table})
+        mapper(model, table)
+        BUCKET_MODELS[name] = model
+    return model
+
+
+# pylint: disable=E1103,W0221
+class BucketedTokenAPI(TokenAPI):
+    """ Stores tokens in tables holding the tokens that expire in the same
+    time bucket (token_bucket_hours long).
+
+    Once a bucket has ended, all of its tokens have expired, so
+    delete_expired drops the whole table instead of deleting its rows.
+    Lookups search the buckets that have not ended yet, newest first,
+    and then the tokens table, which still holds the tokens stored before
+    bucketing was enabled.
+    """
+
+    def __init__(self, bucket_hours, *args, **kw):
+        super(BucketedTokenAPI, self).__init__(*args, **kw)
+        self.bucket_seconds = bucket_hours * 3600
+        self.bucket_names = None
+        self.listed = 0
+
+    def bucket_name(self, expires):
+        """ Returns the name of the bucket table for an expiry time """
+        delta = expires - EPOCH
+        seconds = delta.days * 86400 + delta.seconds
+        end = (seconds // self.bucket_seconds + 1) * self.bucket_seconds
+        return BUCKET_PREFIX + (EPOCH + datetime.timedelta(
+            seconds=end)).strftime(BUCKET_FORMAT)
+
+    @staticmethod
+    def bucket_end(name):
+        """ Returns the time the bucket of a bucket table name ends """
+        return datetime.datetime.strptime(
+            BUCKET_TABLE.match(name).group(1), BUCKET_FORMAT)
+
+    def _list_buckets(self, session):
+        engine = session.bind.engine
+        self.bucket_names = sorted(
+            (name for name in engine.table_names()
+             if BUCKET_TABLE.match(name)), reverse=True)
+        self.listed = time.time()
+
+    def _relist_buckets(self, session):
+        """ Lists the buckets again, unless that was just done; returns
+        whether the buckets were listed """
+        if time.time() - self.listed < BUCKET_RELIST_INTERVAL:
+            return False
+        self._list_buckets(session)
+        return True
+
+    def _token_models(self, session, expired=False):
+        if self.bucket_names is None or expired:
+            self._list_buckets(session)
+        # buckets ending after the current hour may hold unexpired tokens
+        current = BUCKET_PREFIX + datetime.datetime.now().strftime(
+            BUCKET_FORMAT)
+        return [bucket_model(name) for name in self.bucket_names
+                if expired or name > current] + [models.Token]
+
+    def _token_model_for(self, expires, session):
+        if expires is None:
+            return models.Token
+        name = self.bucket_name(expires)
+        model = bucket_model(name)
+        if self.bucket_names is None:
+            self._list_buckets(session)
+        if name not in self.bucket_names:
+            table = model.__table__
+            try:
+                table.create(session.bind, checkfirst=True)
+            except exc.SQLAlchemyError:
+                # created by another process in the meantime
+                if not table.exists(session.bind):
+                    raise
+            self.bucket_names = sorted(self.bucket_names + [name],
+                                       reverse=True)
+        return model
+
+    def _get(self, id, session=None):
+        session = session or get_session()
+        result = super(BucketedTokenAPI, self)._get(id, session)
+        if result is None and id is not None and \
+                self._relist_buckets(session):
+            # the token may be in a bucket created by another process
+            result = super(BucketedTokenAPI, self)._get(id, session)
+        return result
+
+    def _get_validation_views(self, ids, session=None):
+        session = session or get_session()
+        views = super(BucketedTokenAPI, self)._get_validation_views(
+            ids, session)
+        missing = [id for id in ids if id not in views]
+        if missing and self._relist_buckets(session):
+            views.update(super(BucketedTokenAPI, self).
+                         _get_validation_views(missing, session))
+        return views
+
+    def delete_expired(self, before, limit, session=None):
+        """ Drops the buckets that ended before the given time, or deletes
+        expired rows (up to limit) if there were none """
+        session = session or get_session()
+
+        self._list_buckets(session)
+        dropped = 0
+        for name in reversed(self.bucket_names[:]):
+            if self.bucket_end(name) > before:
+                break
+            model = bucket_model(name)
+            count = session.query(model).count()
+            model.__table__.drop(session.bind, checkfirst=True)
+            self.bucket_names.remove(name)
+            logger.info("Dropped token bucket %s (%s tokens)" % (name, count))
+            dropped += count
+        if dropped:
+            return dropped
+
+        return super(BucketedTokenAPI, self).delete_expired(before, limit,
+                                                            session)
+
 
 def get():
+    sqla = CONF['keystone.backends.sqlalchemy']
+    if sqla.token_bucket_hours:
+        return BucketedTokenAPI(sqla.token_bucket_hours)
     return TokenAPI()
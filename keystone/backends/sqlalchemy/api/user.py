@@ -17,15 +17,23 @@
 
 import uuid
 
+from keystone import config
 import keystone.backends.backendutils as utils
-from keystone.backends.sqlalchemy import get_session, models, aliased, \
-    joinedload
+from keystone.backends.sqlalchemy import get_session, get_read_session, \
+    read_or_primary, models, joinedload
+from keystone.backends.sqlalchemy.pagination import paginate
 from keystone.backends import api
+from keystone.common.cache import UidMap
 from keystone.models import User
 
+CONF = config.CONF
+
 
 # pylint: disable=E1103,W0221,W0223
 class UserAPI(api.BaseUserAPI):
+    # uid <-> id pairs of the users seen by this process
+    uids = UidMap(0)
+
     def __init__(self, *args, **kw):
         super(UserAPI, self).__init__(*args, **kw)
 
@@ -45,6 +53,7 @@ class UserAPI(api.BaseUserAPI):
     def to_model(ref):
         """ Returns Keystone model object based on SQLAlchemy model"""
         if ref:
+            UserAPI.uids.add(ref.uid, ref.id)
             if hasattr(api.TENANT, 'uid_to_id'):
                 if 'tenant_id' in ref:
                     ref['tenant_id'] = api.TENANT.id_to_uid(ref['tenant_id'])
@@ -83,7 +92,7 @@ class UserAPI(api.BaseUserAPI):
         if id is None:
             return None
 
-        session = session or get_session()
+        session = session or get_read_session()
 
         result = session.query(models.User).filter_by(uid=str(id)).first()
 
@@ -99,7 +108,7 @@ class UserAPI(api.BaseUserAPI):
         if id is None:
             return None
 
-        session = session or get_session()
+        session = session or get_read_session()
 
         # TODO(dolph): user ID's are NOT strings... why is this is being cast?
         return session.query(models.User).filter_by(id=str(id)).first()
@@ -109,22 +118,37 @@ class UserAPI(api.BaseUserAPI):
         if id is None:
             return None
 
-        session = session or get_session()
-        user = session.query(models.User).filter_by(id=str(id)).first()
-        return user.uid if user else None
+        uid = UserAPI.uids.get_uid(id)
+        if uid is not None:
+            return uid
+
+        # a user created by another process may not be on the replica yet
+        user = read_or_primary(lambda session: session.query(models.User).
+                               filter_by(id=str(id)).first(), session)
+        if user is None:
+            return None
+        UserAPI.uids.add(user.uid, user.id)
+        return user.uid
 
     @staticmethod
     def uid_to_id(uid, session=None):
         if uid is None:
             return None
 
-        session = session or get_session()
-        user = session.query(models.User).filter_by(uid=str(uid)).first()
-        return user.id if user else None
+        id = UserAPI.uids.get_id(uid)
+        if id is not None:
+            return id
+
+        user = read_or_primary(lambda session: session.query(models.User).
+                               filter_by(uid=str(uid)).first(), session)
+        if user is None:
+            return None
+        UserAPI.uids.add(user.uid, user.id)
+        return user.id
 
     def get_by_name(self, name, session=None):
         if not session:
-            session = get_session()
+            session = get_read_session()
 
         result = session.query(models.User).filter_by(name=name).first()
 
@@ -138,58 +162,17 @@ class UserAPI(api.BaseUserAPI):
 
         return UserAPI.to_model(result)
 
-    def get_page(self, marker, limit, session=None):
-        if not session:
-            session = get_session()
-
-        if marker:
-            results = session.query(models.User).filter("id>:marker").params(
-                    marker='%s' % marker).order_by(
-                    models.User.id.desc()).limit(int(limit)).all()
-        else:
-            results = session.query(models.User).order_by(
-                                models.User.id.desc()).limit(int(limit)).all()
+    def get_page_with_markers(self, marker, limit, session=None):
+        session = session or get_session()
+        users, prev, next = paginate(session.query(models.User),
+                                     models.User.id, marker, limit)
+        return UserAPI.to_model_list(users), prev, next
 
-        return UserAPI.to_model_list(results)
+    def get_page(self, marker, limit, session=None):
+        return self.get_page_with_markers(marker, limit, session)[0]
 
-    # pylint: disable=R0912
     def get_page_markers(self, marker, limit, session=None):
-        if not session:
-            session = get_session()
-
-        first = session.query(models.User).order_by(
-                            models.User.id).first()
-        last = session.query(models.User).order_by(
-                            models.User.id.desc()).first()
-        if first is None:
-            return (None, None)
-        if marker is None:
-            marker = first.id
-        next_page = session.query(models.User).filter("id > :marker").params(
-                        marker='%s' % marker).order_by(
-                        models.User.id).limit(int(limit)).all()
-        prev_page = session.query(models.User).filter("id < :marker").params(
-                        marker='%s' % marker).order_by(
-                        models.User.id.desc()).limit(int(limit)).all()
-        if len(next_page) == 0:
-            next_page = last
-        else:
-            for t in next_page:
-                next_page = t
-        if len(prev_page) == 0:
-            prev_page = first
-        else:
-            for t in prev_page:
-                prev_page = t
-        if prev_page.id == marker:
-            prev_page = None
-        else:
-            prev_page = prev_page.id
-        if next_page.id == last.id:
-            next_page = None
-        else:
-            next_page = next_page.id
-        return (prev_page, next_page)
+        return self.get_page_with_markers(marker, limit, session)[1:]
 
     def user_roles_by_tenant(self, user_id, tenant_id, session=None):
         if not session:
@@ -220,6 +203,8 @@ class UserAPI(api.BaseUserAPI):
 
         with session.begin():
             user_ref = session.query(models.User).filter_by(uid=id).first()
+            if 'uid' in values:
+                UserAPI.uids.remove(uid=id, id=user_ref.id)
             utils.set_hashed_password(values)
             user_ref.update(values)
             user_ref.save(session=session)
@@ -231,6 +216,7 @@ class UserAPI(api.BaseUserAPI):
         with session.begin():
             user_ref = session.query(models.User).filter_by(uid=id).first()
             session.delete(user_ref)
+            UserAPI.uids.remove(uid=id, id=user_ref.id)
 
     def get_by_tenant(self, id, tenant_id, session=None):
         if not session:
@@ -289,102 +275,36 @@ class UserAPI(api.BaseUserAPI):
         return user_rolegrant
 
     def users_get_page(self, marker, limit, session=None):
-        if not session:
-            session = get_session()
+        return self.get_page(marker, limit, session)
 
-        user = aliased(models.User)
-        if marker:
-            results = session.query(user).\
-                                filter("id>=:marker").params(
-                                marker='%s' % marker).order_by(
-                                "id").limit(int(limit)).all()
-        else:
-            results = session.query(user).\
-                                order_by("id").limit(int(limit)).all()
-
-        return UserAPI.to_model_list(results)
-
-    # pylint: disable=R0912
     def users_get_page_markers(self, marker, limit, session=None):
-        if not session:
-            session = get_session()
+        return self.get_page_markers(marker, limit, session)
 
-        user = aliased(models.User)
-        first = session.query(user).\
-                        order_by(user.id).first()
-        last = session.query(user).\
-                            order_by(user.id.desc()).first()
-        if first is None:
-            return (None, None)
-        if marker is None:
-            marker = first.id
-        next_page = session.query(user).\
-                        filter("id > :marker").params(
-                        marker='%s' % marker).order_by(user.id).\
-                        limit(int(limit)).all()
-        prev_page = session.query(user).\
-                        filter("id < :marker").params(
-                        marker='%s' % marker).order_by(
-                        user.id.desc()).limit(int(limit)).all()
-        next_len = len(next_page)
-        prev_len = len(prev_page)
-
-        if next_len == 0:
-            next_page = last
-        else:
-            for t in next_page:
-                next_page = t
-        if prev_len == 0:
-            prev_page = first
-        else:
-            for t in prev_page:
-                prev_page = t
-        if first.id == marker:
-            prev_page = None
-        else:
-            prev_page = prev_page.id
-        if marker == last.id:
-            next_page = None
-        else:
-            next_page = next_page.id
-        return (prev_page, next_page)
-
-    def users_get_by_tenant_get_page(self, tenant_id, role_id, marker, limit,
-            session=None):
-        # This is broken.  If a user has more than one role per project
-        # shit hits the fan because we're limiting the wrong model.
-        # Also the user lookup is nasty and potentially injectiable.
-        if not session:
-            session = get_session()
+    def users_get_page_with_markers(self, marker, limit, session=None):
+        return self.get_page_with_markers(marker, limit, session)
 
+    @staticmethod
+    def _tenant_users_query(tenant_id, role_id, session):
+        """ Returns a query of the users with roles in a tenant (optionally
+        a given role), and the backend id of the tenant """
         if hasattr(api.TENANT, 'uid_to_id'):
             tenant_id = api.TENANT.uid_to_id(tenant_id)
 
-        user = aliased(models.UserRoleAssociation)
-        query = session.query(user).\
-            filter("tenant_id = :tenant_id").\
-            params(tenant_id='%s' % tenant_id)
-
+        grants = session.query(models.UserRoleAssociation.user_id).\
+            filter(models.UserRoleAssociation.tenant_id == tenant_id)
         if role_id:
-            query = query.filter(
-                user.role_id == role_id)
-
-        if marker:
-            rv = query.filter("id>=:marker").\
-                         params(marker='%s' % marker).\
-                         order_by("id").\
-                         limit(int(limit)).\
-                         all()
-        else:
-            rv = query.\
-                         order_by("id").\
-                         limit(int(limit)).\
-                         all()
+            grants = grants.filter(
+                models.UserRoleAssociation.role_id == role_id)
+        query = session.query(models.User).\
+            filter(models.User.id.in_(grants.subquery()))
+        return query, tenant_id
 
-        user_ids = set([str(assoc.user_id) for assoc in rv])
-        users = session.query(models.User).\
-                      filter("id in ('%s')" % "','".join(user_ids)).\
-                      all()
+    def users_get_by_tenant_get_page(self, tenant_id, role_id, marker, limit,
+            session=None):
+        session = session or get_session()
+        query, tenant_id = UserAPI._tenant_users_query(tenant_id, role_id,
+                                                       session)
+        users, _prev, _next = paginate(query, models.User.id, marker, limit)
 
         for usr in users:
             usr.tenant_roles = set()
@@ -394,59 +314,13 @@ class UserAPI(api.BaseUserAPI):
 
         return UserAPI.to_model_list(users)
 
-    # pylint: disable=R0912
     def users_get_by_tenant_get_page_markers(self, tenant_id, \
             role_id, marker, limit, session=None):
-        if not session:
-            session = get_session()
-
-        if hasattr(api.TENANT, 'uid_to_id'):
-            tenant_id = api.TENANT.uid_to_id(tenant_id)
-
-        user = aliased(models.UserRoleAssociation)
-        query = session.query(user).\
-                        filter(user.tenant_id == tenant_id)
-        if role_id:
-            query = query.filter(
-                user.role_id == role_id)
-        first = query.\
-            order_by(user.id).first()
-        last = query.\
-            order_by(user.id.desc()).first()
-        if first is None:
-            return (None, None)
-        if marker is None:
-            marker = first.id
-        next_page = query.\
-            filter("id > :marker").params(
-            marker='%s' % marker).order_by(user.id).\
-            limit(int(limit)).all()
-        prev_page = query.\
-            filter("id < :marker").params(
-            marker='%s' % marker).order_by(
-            user.id.desc()).limit(int(limit)).all()
-        next_len = len(next_page)
-        prev_len = len(prev_page)
-
-        if next_len == 0:
-            next_page = last
-        else:
-            for t in next_page:
-                next_page = t
-        if prev_len == 0:
-            prev_page = first
-        else:
-            for t in prev_page:
-                prev_page = t
-        if first.id == marker:
-            prev_page = None
-        else:
-            prev_page = prev_page.id
-        if marker == last.id:
-            next_page = None
-        else:
-            next_page = next_page.id
-        return (prev_page, next_page)
+        session = session or get_session()
+        query, _tenant_id = UserAPI._tenant_users_query(tenant_id, role_id,
+                                                        session)
+        _users, prev, next = paginate(query, models.User.id, marker, limit)
+        return (prev, next)
 
     def check_password(self, user_id, password):
         user = self.get(user_id)
@@ -455,4 +329,7 @@ class UserAPI(api.BaseUserAPI):
 
 
 def get():
+    sqla = CONF['keystone.backends.sqlalchemy']
+    # a fresh map per configured backend, as the ids may have changed
+    UserAPI.uids = UidMap(sqla.uid_cache_max_entries, sqla.uid_cache_ttl)
     return UserAPI()
@@ -0,0 +1,384 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Bulk import and export of the SQL backend.
+
+Records are dicts with an 'object' type (one of OBJECTS) and the fields
+listed for that object type in FIELDS. They refer to each other by name
+(e.g. a user's 'tenant' is the name of its tenant), except endpoints, which
+refer to the 'id' of their endpoint template. Files hold one record per
+line, either as JSON or as CSV rows of the object type followed by the
+fields in FIELDS order.
+
+Importing buffers batch_size records, then inserts them in OBJECTS order,
+so records may refer to records of an earlier object type in the same
+batch. Names are resolved to IDs with in-memory maps, passwords are hashed
+by a pool of worker processes and the records of each object type of a
+batch are inserted by a single executemany in their own transaction.
+
+Exporting streams the tables in OBJECTS order, a page at a time, so that its
+output can be imported in a fresh database. Users are exported with their
+password hash, which is imported as is.
+"""
+
+import csv
+import json
+import logging
+import multiprocessing
+import uuid
+
+from keystone.backends import backendutils
+import keystone.backends as backends
+from keystone.backends.sqlalchemy import get_session, models
+from keystone.backends.sqlalchemy.pagination import paginate
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+OBJECTS = ['tenant', 'user', 'service', 'role', 'grant', 'credentials',
+           'endpoint_template', 'endpoint']
+
+FIELDS = {
+    'tenant': ['name', 'id', 'description', 'enabled'],
+    'user': ['name', 'password', 'tenant', 'email', 'enabled', 'id',
+             'password_hash'],
+    'service': ['name', 'type', 'description', 'owner'],
+    'role': ['name', 'service', 'description'],
+    'grant': ['role', 'user', 'tenant'],
+    'credentials': ['user', 'type', 'key', 'secret', 'tenant'],
+    'endpoint_template': ['service', 'region', 'public_url', 'admin_url',
+                          'internal_url', 'enabled', 'is_global', 'id',
+                          'version_id', 'version_list', 'version_info'],
+    'endpoint': ['tenant', 'endpoint_template'],
+}
+
+# models whose rows are referred to by name
+NAMED = {
+    'tenant': models.Tenant,
+    'user': models.User,
+    'service': models.Service,
+    'role': models.Role,
+}
+
+MODELS = dict(NAMED, grant=models.UserRoleAssociation,
+              credentials=models.Credentials,
+              endpoint_template=models.EndpointTemplates,
+              endpoint=models.Endpoints)
+
+BOOLEANS = ['enabled', 'is_global']
+
+
+def _to_bool(value, default=True):
+    if value is None or value == '':
+        return default
+    return value in [1, 'true', 'True', True]
+
+
+class Importer(object):
+    """Inserts records in batches.
+
+    :param session: the session to insert with (a new one by default)
+    :param batch_size: number of records inserted at once
+    :param workers: number of processes hashing passwords (the number of
+        CPUs by default); with 0, passwords are hashed by this process
+    """
+
+    def __init__(self, session=None, batch_size=1000, workers=None):
+        self.session = session or get_session()
+        self.batch_size = batch_size
+        self.workers = workers
+        self.pool = None
+        self.pending = dict((obj, []) for obj in OBJECTS)
+        self.buffered = 0
+        self.ids = {}
+        self.counts = dict((obj, 0) for obj in OBJECTS)
+
+    def add(self, record):
+        """Buffers a record, inserting the buffer once it is full"""
+        if record.get('object') not in OBJECTS:
+            raise ValueError("Unsupported object type %s" %
+                             record.get('object'))
+        self.pending[record['object']].append(record)
+        self.buffered += 1
+        if self.buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Inserts the buffered records"""
+        for obj in OBJECTS:
+            records = self.pending[obj]
+            if records:
+                self._insert(obj, records)
+                self.pending[obj] = []
+        self.buffered = 0
+
+    def close(self):
+        """Inserts the remaining records and returns how many records of
+        each object type were inserted"""
+        try:
+            self.flush()
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+        return self.counts
+
+    def import_records(self, records):
+        for record in records:
+            self.add(record)
+        return self.close()
+
+    def _insert(self, obj, records):
+        rows = [getattr(self, '_%s_row' % obj)(record) for record in records]
+        if obj == 'user':
+            self._hash_passwords(records, rows)
+
+        # executemany compiles the statement from the keys of the first
+        # row, so rows with other keys (e.g. with or without an id) go in
+        # statements of their own
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        with self.session.begin():
+            for group in groups.values():
+                self.session.execute(MODELS[obj].__table__.insert(), group)
+
+        if obj in NAMED:
+            self._map_ids(obj, [row['name'] for row in rows])
+        self.counts[obj] += len(rows)
+        logger.debug("Imported %s %s records" % (len(rows), obj))
+
+    def _hash_passwords(self, records, rows):
+        indexes = [i for i, record in enumerate(records)
+                   if record.get('password') and
+                   not record.get('password_hash')]
+        passwords = [records[i]['password'] for i in indexes]
+        if not passwords or not backends.SHOULD_HASH_PASSWORD:
+            hashes = passwords
+        elif self.workers == 0:
+            hashes = [backendutils.hash_password(password)
+                      for password in passwords]
+        else:
+            if self.pool is None:
+                self.pool = multiprocessing.Pool(self.workers)
+            hashes = self.pool.map(backendutils.hash_password, passwords,
+                                   max(1, len(passwords) // 64))
+        for i, password in zip(indexes, hashes):
+            rows[i]['password'] = password
+
+    def _names(self, obj):
+        """Returns the name -> id map of an object type, loaded from the
+        database on first use"""
+        if obj not in self.ids:
+            model = NAMED[obj]
+            self.ids[obj] = dict(self.session.query(model.name, model.id))
+        return self.ids[obj]
+
+    def _map_ids(self, obj, names):
+        model = NAMED[obj]
+        self._names(obj).update(self.session.query(model.name, model.id).
+                                filter(model.name.in_(names)))
+
+    def _id(self, obj, name, required=True):
+        if not name:
+            if required:
+                raise ValueError("No %s specified" % obj)
+            return None
+        try:
+            return self._names(obj)[name]
+        except KeyError:
+            raise IndexError("%s %s not found" % (obj.capitalize(), name))
+
+    def _tenant_row(self, record):
+        return {'uid': record.get('id') or uuid.uuid4().hex,
+                'name': record['name'],
+                'desc': record.get('description') or None,
+                'enabled': _to_bool(record.get('enabled'))}
+
+    def _user_row(self, record):
+        return {'uid': record.get('id') or uuid.uuid4().hex,
+                'name': record['name'],
+                'password': record.get('password_hash') or None,
+                'email': record.get('email') or None,
+                'enabled': _to_bool(record.get('enabled')),
+                'tenant_id': self._id('tenant', record.get('tenant'),
+                                      required=False)}
+
+    def _service_row(self, record):
+        return {'name': record['name'],
+                'type': record.get('type') or None,
+                'desc': record.get('description') or None,
+                'owner_id': self._id('user', record.get('owner'),
+                                     required=False)}
+
+    def _role_row(self, record):
+        service = record.get('service')
+        names = record['name'].split(':')
+        if len(names) == 2:
+            service = names[0] or service
+        return {'name': record['name'],
+                'desc': record.get('description') or None,
+                'service_id': self._id('service', service, required=False)}
+
+    def _grant_row(self, record):
+        return {'role_id': self._id('role', record.get('role')),
+                'user_id': self._id('user', record.get('user')),
+                'tenant_id': self._id('tenant', record.get('tenant'),
+                                      required=False)}
+
+    def _credentials_row(self, record):
+        return {'user_id': self._id('user', record.get('user')),
+                'tenant_id': self._id('tenant', record.get('tenant'),
+                                      required=False),
+                'type': record.get('type'),
+                'key': record.get('key'),
+                'secret': record.get('secret')}
+
+    def _endpoint_template_row(self, record):
+        row = {'service_id': self._id('service', record.get('service')),
+               'enabled': _to_bool(record.get('enabled')),
+               'is_global': _to_bool(record.get('is_global'))}
+        for field in ['region', 'public_url', 'admin_url', 'internal_url',
+                      'version_id', 'version_list', 'version_info']:
+            row[field] = record.get(field) or None
+        if record.get('id'):
+            row['id'] = int(record['id'])
+        return row
+
+    def _endpoint_row(self, record):
+        return {'tenant_id': self._id('tenant', record.get('tenant')),
+                'endpoint_template_id': int(record['endpoint_template'])}
+
+
+def _rows(session, model, batch_size):
+    """Yields the rows of a table, reading batch_size rows at a time"""
+    marker = None
+    while True:
+        rows, _prev, marker = paginate(session.query(model), model.id,
+                                       marker, batch_size)
+        for row in rows:
+            yield row
+        if marker is None:
+            return
+
+
+# pylint: disable=R0914
+def export_records(session=None, batch_size=1000):
+    """Yields the records of the database, in OBJECTS order"""
+    session = session or get_session()
+    names = dict((obj, {None: None}) for obj in NAMED)
+
+    for tenant in _rows(session, models.Tenant, batch_size):
+        names['tenant'][tenant.id] = tenant.name
+        yield {'object': 'tenant', 'name': tenant.name, 'id': tenant.uid,
+               'description': tenant.desc, 'enabled': bool(tenant.enabled)}
+
+    for user in _rows(session, models.User, batch_size):
+        names['user'][user.id] = user.name
+        yield {'object': 'user', 'name': user.name, 'id': user.uid,
+               'password_hash': user.password, 'email': user.email,
+               'enabled': bool(user.enabled),
+               'tenant': names['tenant'].get(user.tenant_id)}
+
+    for service in _rows(session, models.Service, batch_size):
+        names['service'][service.id] = service.name
+        yield {'object': 'service', 'name': service.name,
+               'type': service.type, 'description': service.desc,
+               'owner': names['user'].get(service.owner_id)}
+
+    for role in _rows(session, models.Role, batch_size):
+        names['role'][role.id] = role.name
+        yield {'object': 'role', 'name': role.name,
+               'service': names['service'].get(role.service_id),
+               'description': role.desc}
+
+    for grant in _rows(session, models.UserRoleAssociation, batch_size):
+        yield {'object': 'grant', 'role': names['role'].get(grant.role_id),
+               'user': names['user'].get(grant.user_id),
+               'tenant': names['tenant'].get(grant.tenant_id)}
+
+    for credentials in _rows(session, models.Credentials, batch_size):
+        yield {'object': 'credentials',
+               'user': names['user'].get(credentials.user_id),
+               'type': credentials.type, 'key': credentials.key,
+               'secret': credentials.secret,
+               'tenant': names['tenant'].get(credentials.tenant_id)}
+
+    for template in _rows(session, models.EndpointTemplates, batch_size):
+        record = {'object': 'endpoint_template',
+                  'service': names['service'].get(template.service_id),
+                  'enabled': bool(template.enabled),
+                  'is_global': bool(template.is_global),
+                  'id': template.id}
+        for field in ['region', 'public_url', 'admin_url', 'internal_url',
+                      'version_id', 'version_list', 'version_info']:
+            record[field] = getattr(template, field)
+        yield record
+
+    for endpoint in _rows(session, models.Endpoints, batch_size):
+        yield {'object': 'endpoint',
+               'tenant': names['tenant'].get(endpoint.tenant_id),
+               'endpoint_template': endpoint.endpoint_template_id}
+
+
+def read_records(lines, format='json'):
+    """Yields the records of an import file, given its lines"""
+    if format == 'csv':
+        for row in csv.reader(lines):
+            if not row or row[0].startswith('#'):
+                continue
+            fields = FIELDS.get(row[0])
+            if fields is None:
+                raise ValueError("Unsupported object type %s" % row[0])
+            record = dict(zip(fields, [value or None for value in row[1:]]))
+            record['object'] = row[0]
+            yield record
+    else:
+        for line in lines:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield json.loads(line)
+
+
+def write_records(records, out, format='json'):
+    """Writes records to out, one per line"""
+    if format == 'csv':
+        writer = csv.writer(out)
+        for record in records:
+            row = [record['object']]
+            for field in FIELDS[record['object']]:
+                value = record.get(field)
+                if value is None:
+                    value = ''
+                elif field in BOOLEANS:
+                    value = str(bool(value)).lower()
+                elif isinstance(value, unicode):
+                    value = value.encode('utf-8')
+                row.append(value)
+            writer.writerow(row)
+    else:
+        for record in records:
+            out.write(json.dumps(record, sort_keys=True))
+            out.write('\n')
+
+
+def guess_format(path):
+    """Returns the file format of a path, from its extension"""
+    if path.endswith('.csv'):
+        return 'csv'
+    return 'json'
@@ -0,0 +1,43 @@
+"""
+Adds indexes for looking up tokens by user and tenant, and by expiry
+
+Authenticating looks up the latest token of a user for a tenant (or for no
+tenant) ordered by expiry, which is a full scan of tokens without these.
+"""
+# pylint: disable=C0103,R0801
+
+
+import sqlalchemy
+
+
+meta = sqlalchemy.MetaData()
+
+
+# define the previous state of tokens
+
+token = {}
+token['id'] = sqlalchemy.Column('id', sqlalchemy.String(255),
+    primary_key=True, unique=True)
+token['user_id'] = sqlalchemy.Column('user_id', sqlalchemy.Integer)
+token['tenant_id'] = sqlalchemy.Column('tenant_id', sqlalchemy.Integer)
+token['expires'] = sqlalchemy.Column('expires', sqlalchemy.DateTime)
+tokens = sqlalchemy.Table('tokens', meta, *token.values())
+
+
+user_tenant_expires = sqlalchemy.Index('ix_tokens_user_tenant_expires',
+    token['user_id'], token['tenant_id'], token['expires'])
+expires = sqlalchemy.Index('ix_tokens_expires', token['expires'])
+
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+
+    user_tenant_expires.create(migrate_engine)
+    expires.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta.bind = migrate_engine
+
+    expires.drop(migrate_engine)
+    user_tenant_expires.drop(migrate_engine)
@@ -0,0 +1,36 @@
+"""
+Adds the revocation_events table
+
+Revoking a token, or disabling a user or tenant, records an event that
+services read (GET /v2.0/revocation-events) to evict their cached tokens.
+"""
+# pylint: disable=C0103,R0801
+
+
+import sqlalchemy
+
+
+meta = sqlalchemy.MetaData()
+
+
+event = {}
+event['id'] = sqlalchemy.Column('id', sqlalchemy.Integer,
+    primary_key=True, autoincrement=True)
+event['type'] = sqlalchemy.Column('type', sqlalchemy.String(20))
+event['target_id'] = sqlalchemy.Column('target_id', sqlalchemy.String(255))
+event['created'] = sqlalchemy.Column('created', sqlalchemy.DateTime,
+    index=True)
+events = sqlalchemy.Table('revocation_events', meta, *event.values(),
+    sqlite_autoincrement=True)
+
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+
+    events.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta.bind = migrate_engine
+
+    events.drop(migrate_engine)
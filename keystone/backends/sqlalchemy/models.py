@@ -15,7 +15,7 @@
 # limitations under the License.
 
 from sqlalchemy import Column, String, Integer, ForeignKey, \
-    UniqueConstraint, Boolean, DateTime
+    UniqueConstraint, Boolean, DateTime, Index
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, object_mapper
@@ -169,6 +169,23 @@ class Token(Base, KeystoneBase):
     user_id = Column(Integer)
     tenant_id = Column(Integer)
     expires = Column(DateTime)
+    # serves lookups by user, with or without (IS NULL) a tenant, newest
+    # first, as well as purging expired tokens
+    __table_args__ = (
+        Index('ix_tokens_user_tenant_expires', "user_id", "tenant_id",
+              "expires"),
+        Index('ix_tokens_expires', "expires"), {})
+
+
+class RevocationEvent(Base, KeystoneBase):
+    # stored with (and by the API of) tokens, see TokenAPI
+    __tablename__ = 'revocation_events'
+    # ids are never reused, even once the newest events are deleted
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    type = Column(String(20))  # ('token', 'user', 'tenant')
+    target_id = Column(String(255))
+    created = Column(DateTime, index=True)
+    __table_args__ = {'sqlite_autoincrement': True}
 
 
 class EndpointTemplates(Base, KeystoneBase):
@@ -0,0 +1,82 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Keyset pagination of SQLAlchemy queries.
+
+A page holds the rows following the marker (the key of the last row of the
+previous page) in key order, so fetching it is a range scan of the index on
+the key, however deep the page is. The page, and the markers of the pages
+before and after it, come from a single query:
+
+    SELECT rows.*,
+           (SELECT key FROM ... WHERE key <= :marker
+            ORDER BY key DESC LIMIT 1 OFFSET :limit) AS prev_marker
+    FROM ... WHERE key > :marker ORDER BY key LIMIT :limit + 1
+
+The extra row tells whether there is a next page. The scalar subquery walks
+back over the previous page to find the row before it, whose key is the
+marker of the previous page.
+
+The first page has no marker; the previous page of the second page is the
+listing without a marker, so its prev marker is None.
+"""
+
+
+def paginate(query, key, marker, limit):
+    """Returns a page of a query and the markers of the pages around it.
+
+    :param query: the query to paginate, filtered but not ordered
+    :param key: unique column to order and page by, of the query's first
+        entity (e.g. models.Tenant.id)
+    :param marker: key of the row the page follows (None or empty for the
+        first page)
+    :param limit: number of rows per page
+    :returns: (rows, prev_marker, next_marker), where rows are the rows
+        of the query; a marker is None when there is no such page
+    """
+    limit = int(limit)
+    prev_marker = None
+    if marker:
+        prev_marker = query.filter(key <= marker).\
+            order_by(key.desc()).\
+            limit(1).\
+            offset(limit).\
+            with_entities(key).\
+            statement.correlate(None).as_scalar()
+        query = query.filter(key > marker).add_column(prev_marker)
+
+    rows = query.order_by(key).limit(limit + 1).all()
+
+    if marker:
+        if rows:
+            prev_marker = rows[0][-1]
+        else:
+            prev_marker = None
+        rows = [row[:-1] if len(row) > 2 else row[0] for row in rows]
+
+    next_marker = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_marker = _key_of(rows[-1], key)
+    return rows, prev_marker, next_marker
+
+
+def _key_of(row, key):
+    if isinstance(row, tuple):
+        row = row[0]
+    return getattr(row, key.key)
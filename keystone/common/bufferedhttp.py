@@ -28,11 +28,13 @@ BufferedHTTPResponse.
 
 from urllib import quote
 import logging
+import socket
 import time
 
+from eventlet import semaphore
 # pylint: disable=E0611
-from eventlet.green.httplib import CONTINUE, HTTPConnection, HTTPMessage, \
-    HTTPResponse, HTTPSConnection, _UNKNOWN
+from eventlet.green.httplib import CONTINUE, HTTPConnection, HTTPException, \
+    HTTPMessage, HTTPResponse, HTTPSConnection, _UNKNOWN
 
 DEFAULT_TIMEOUT = 30
 
@@ -180,3 +182,106 @@ def http_connect_raw(ipaddr, port, method, path, headers=None,
     # pylint: disable=E1103
     conn.endheaders()
     return conn
+
+
+# pylint: disable=R0902
+class HTTPConnectionPool(object):
+    """
+    Pool of keep-alive connections to a single host.
+
+    At most max_size requests are in flight at once; further callers wait
+    for a connection to be returned. Connections that stayed idle for more
+    than idle_timeout seconds are closed instead of reused. If a reused
+    connection turns out to be broken (typically because the server closed
+    it while it was idle), the request is retried once on a new connection.
+
+    The pool is safe to share between eventlet green threads.
+
+    :param host: host name or address to connect to
+    :param port: port to connect to
+    :param ssl: set True if SSL should be used (default: False)
+    :param key_file: Private key file (not needed if cert_file has private key)
+    :param cert_file: Certificate file (Keystore)
+    :param timeout: socket timeout of the connections
+    :param max_size: maximum number of connections to the host
+    :param idle_timeout: seconds after which idle connections are closed
+    """
+
+    def __init__(self, host, port, ssl=False, key_file=None, cert_file=None,
+                 timeout=None, max_size=10, idle_timeout=60):
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self.key_file = key_file
+        self.cert_file = cert_file
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.created = 0
+        # (time the connection was returned, connection), oldest first
+        self._idle = []
+        self._semaphore = semaphore.Semaphore(max_size)
+
+    def _connect(self):
+        self.created += 1
+        if self.ssl:
+            return HTTPSConnection('%s:%s' % (self.host, self.port),
+                                   key_file=self.key_file,
+                                   cert_file=self.cert_file,
+                                   timeout=self.timeout)
+        return BufferedHTTPConnection('%s:%s' % (self.host, self.port),
+                                      timeout=self.timeout)
+
+    def _get(self):
+        """Returns (connection, reused), preferring the most recent idle
+        connection and closing those that have been idle for too long"""
+        expired = time.time() - self.idle_timeout
+        while self._idle and self._idle[0][0] <= expired:
+            self._idle.pop(0)[1].close()
+        if self._idle:
+            return self._idle.pop()[1], True
+        return self._connect(), False
+
+    @staticmethod
+    def _send(conn, method, path, body, headers):
+        conn.request(method, path, body, headers)
+        resp = conn.getresponse()
+        return resp, resp.read()
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        Sends a request over a pooled connection.
+
+        :param method: HTTP method to request ('GET', 'PUT', 'POST', etc.)
+        :param path: request path, including any query string
+        :param body: request body
+        :param headers: dictionary of headers
+        :returns: (response, data) - the response and its body, already read
+        """
+        headers = headers or {}
+        with self._semaphore:
+            conn, reused = self._get()
+            try:
+                try:
+                    resp, data = self._send(conn, method, path, body, headers)
+                except (socket.error, HTTPException):
+                    if not reused:
+                        raise
+                    logger.debug("Pooled connection to %s:%s is broken, "
+                                 "reconnecting" % (self.host, self.port))
+                    conn.close()
+                    conn = self._connect()
+                    resp, data = self._send(conn, method, path, body, headers)
+            except Exception:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._idle.append((time.time(), conn))
+            return resp, data
+
+    def close(self):
+        """Closes all idle connections"""
+        while self._idle:
+            self._idle.pop()[1].close()
@@ -0,0 +1,283 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Bounded in-process LRU cache with per-entry expiry and tag based invalidation.
+
+Entries are evicted in least-recently-used order once either the maximum
+number of entries or the maximum total size (in bytes) is exceeded. Each
+entry can carry a list of tags (e.g. "user:<id>"); invalidate(tag) drops all
+entries carrying that tag, which lets callers evict everything derived from
+an object when that object changes.
+
+Values computed from a backend can race with invalidations: a green thread
+may read old data, yield, and store it after the data was changed and the
+cache invalidated. To prevent that, read ``generation`` before computing the
+value and pass it to set(); the value is then dropped if anything was
+invalidated in the meantime.
+
+The cache does no I/O, so it is safe to share between eventlet green threads.
+A lock guards it against native threads as well.
+"""
+
+import cPickle as pickle
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+class _Entry(object):
+    """A cache entry and its place in the LRU list."""
+
+    __slots__ = ['key', 'value', 'expires', 'size', 'tags', 'prev', 'next']
+
+    def __init__(self, key, value, expires, size, tags):
+        self.key = key
+        self.value = value
+        self.expires = expires
+        self.size = size
+        self.tags = tags
+        self.prev = None
+        self.next = None
+
+
+def estimate_size(value):
+    """Approximates the memory used by a value using its pickled size."""
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except (pickle.PicklingError, TypeError):
+        return sys.getsizeof(value)
+
+
+class LRUCache(object):
+    """Size and count bounded LRU cache with TTLs and tag invalidation.
+
+    :param max_entries: maximum number of entries kept (0 disables caching)
+    :param max_bytes: maximum total size of all entries (None for no limit)
+    :param ttl: default lifetime of an entry in seconds (None for no expiry)
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._tags = {}
+        # Sentinel of the circular LRU list; head.next is the most recently
+        # used entry, head.prev the least recently used one.
+        self._head = _Entry(None, None, None, 0, ())
+        self._head.prev = self._head.next = self._head
+        self.size = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key, count=True):
+        """Returns the cached value for key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires is not None and \
+                    entry.expires <= time.time():
+                self._remove(entry)
+                entry = None
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return None
+            self._unlink(entry)
+            self._link(entry)
+            if count:
+                self.hits += 1
+            return entry.value
+
+    def set(self, key, value, ttl=None, size=None, tags=None,
+            generation=None):
+        """Stores value under key.
+
+        :param ttl: lifetime in seconds, overriding the cache default
+        :param size: size of the value in bytes, estimated if not given
+        :param tags: list of tags to invalidate the entry by
+        :param generation: value of ``generation`` read before the value
+            was computed; the value is not stored if it has changed since
+        """
+        if not self.enabled:
+            return
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is not None and ttl <= 0:
+            return
+        if size is None:
+            size = estimate_size(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            return
+        expires = time.time() + ttl if ttl is not None else None
+        entry = _Entry(key, value, expires, size, tuple(tags or ()))
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            old = self._entries.get(key)
+            if old is not None:
+                self._remove(old)
+            self._entries[key] = entry
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(key)
+            self._link(entry)
+            self.size += size
+            while len(self._entries) > self.max_entries or \
+                    (self.max_bytes and self.size > self.max_bytes):
+                self._remove(self._head.prev)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Removes key from the cache; returns True if it was present."""
+        with self._lock:
+            self.generation += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            self._remove(entry)
+            return True
+
+    def invalidate(self, *tags):
+        """Removes all entries carrying any of the given tags.
+
+        :returns: number of entries removed
+        """
+        count = 0
+        with self._lock:
+            self.generation += 1
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    entry = self._entries.get(key)
+                    if entry is not None:
+                        self._remove(entry)
+                        count += 1
+        if count:
+            logger.debug("Invalidated %s cache entries for %s" % (count,
+                                                                  tags))
+        return count
+
+    def clear(self):
+        """Removes all entries (the counters are kept)."""
+        with self._lock:
+            self.generation += 1
+            self._entries = {}
+            self._tags = {}
+            self._head.prev = self._head.next = self._head
+            self.size = 0
+
+    def stats(self):
+        """Returns a dict of counters suitable for monitoring."""
+        return {'entries': len(self._entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes}
+
+    def _link(self, entry):
+        entry.prev = self._head
+        entry.next = self._head.next
+        self._head.next.prev = entry
+        self._head.next = entry
+
+    @staticmethod
+    def _unlink(entry):
+        entry.prev.next = entry.next
+        entry.next.prev = entry.prev
+        entry.prev = entry.next = None
+
+    def _remove(self, entry):
+        self._unlink(entry)
+        del self._entries[entry.key]
+        self.size -= entry.size
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(entry.key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class UidMap(object):
+    """Bounded two-way map between the public uid of a row and its primary
+    key id, e.g. of users and tenants in the SQL backend.
+
+    Both directions are LRUCaches, so the map holds at most max_entries
+    pairs; ttl bounds how long a pair deleted by another process is used.
+
+    :param max_entries: maximum number of pairs kept (0 disables the map)
+    :param ttl: lifetime of a pair in seconds (None for no expiry)
+    """
+
+    def __init__(self, max_entries=10000, ttl=None):
+        self._ids = LRUCache(max_entries=max_entries, ttl=ttl)
+        self._uids = LRUCache(max_entries=max_entries, ttl=ttl)
+
+    @property
+    def enabled(self):
+        return self._ids.enabled
+
+    def add(self, uid, id):  # pylint: disable=W0622
+        """Remembers that uid and id refer to the same row"""
+        if uid is not None and id is not None:
+            self._ids.set(str(uid), id)
+            self._uids.set(str(id), uid)
+
+    def get_id(self, uid):
+        """Returns the id of uid, or None if not known"""
+        return self._ids.get(str(uid))
+
+    def get_uid(self, id):  # pylint: disable=W0622
+        """Returns the uid of id, or None if not known"""
+        return self._uids.get(str(id))
+
+    def remove(self, uid=None, id=None):  # pylint: disable=W0622
+        """Forgets the pair of uid and/or id"""
+        if uid is not None:
+            id = self._ids.get(str(uid), count=False) if id is None else id
+            self._ids.delete(str(uid))
+        if id is not None:
+            uid = self._uids.get(str(id), count=False) if uid is None else uid
+            self._uids.delete(str(id))
+            if uid is not None:
+                self._ids.delete(str(uid))
+
+    def clear(self):
+        self._ids.clear()
+        self._uids.clear()
+
+    def stats(self):
+        """Returns the counters of both directions"""
+        return {'uid_to_id': self._ids.stats(),
+                'id_to_uid': self._uids.stats()}
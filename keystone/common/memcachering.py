@@ -0,0 +1,300 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Memcache client for a set of memcached servers.
+
+Keys are spread over the servers with consistent hashing: every server owns a
+number of points on a hash ring, and a key is stored on the first server
+found clockwise from the hash of the key. When a server goes away, only the
+keys it owned move (to the next server on the ring); all other keys stay
+where they are. A server given a weight owns that many times more points,
+and so that share of the keys.
+
+With replicas, each key is also written to the next servers on the ring,
+so that the keys of a failed server are not lost. While a server is down,
+the writes of its keys go to the next live server on the ring instead, so
+once it is back it holds older values than that server. Values are
+therefore stored with a version (the time they were written, so the clocks
+of the clients must agree), deletes write a versioned tombstone, and reads
+ask one server more than there are replicas and return the latest version.
+This covers the failure of any one server. Counters (incr, add) are not
+versioned, and are kept on the first server only.
+
+Each server has a pool of python-memcached clients, shared by all green
+threads, so connections are reused between requests instead of being opened
+for every one of them.
+"""
+
+import bisect
+import hashlib
+import logging
+import time
+
+from eventlet import pools
+import memcache
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+# Points per server on the hash ring
+POINTS_PER_SERVER = 100
+
+# Marks the values stored with their version
+VERSIONED = '\x00v1'
+
+# Seconds the tombstones of deleted keys are kept
+TOMBSTONE_TIME = 86400
+
+
+def _new_version():
+    return time.time()
+
+
+def _wrap(value, version=None):
+    """Returns value as stored, with its version (None for a tombstone)"""
+    return (VERSIONED, version or _new_version(), value)
+
+
+def _unwrap(stored):
+    """Returns the version and the value of a stored value; values stored
+    without a version are older than all others"""
+    if isinstance(stored, tuple) and len(stored) == 3 and \
+            stored[0] == VERSIONED:
+        return stored[1], stored[2]
+    return 0, stored
+
+
+def parse_weighted_hosts(hosts):
+    """Returns a list of ('host:port', weight) from a comma separated string
+    (or a list) of 'host:port' or 'host:port:weight'"""
+    if isinstance(hosts, basestring):
+        hosts = hosts.split(',')
+    weighted = []
+    for host in hosts:
+        host = host.strip()
+        if not host:
+            continue
+        weight = 1
+        if host.count(':') == 2:
+            host, weight = host.rsplit(':', 1)
+            weight = int(weight)
+            if weight < 1:
+                raise ValueError("Bad memcache server weight: %s" % weight)
+        weighted.append((host, weight))
+    return weighted
+
+
+def parse_hosts(hosts):
+    """Returns a list of 'host:port' strings from a comma separated string
+    (or a list)"""
+    return [host for host, _weight in parse_weighted_hosts(hosts)]
+
+
+def _hash(value):
+    return long(hashlib.md5(value).hexdigest()[:8], 16)
+
+
+class MemcacheRing(object):
+    """Consistent hashing memcache client with pooled connections.
+
+    :param hosts: list (or comma separated string) of 'host:port' or
+        'host:port:weight' servers
+    :param pool_size: maximum number of connections per server
+    :param dead_retry: seconds before a failed server is tried again
+    :param socket_timeout: timeout of memcache socket operations
+    :param replicas: number of servers each key is written to
+    :param tombstone_time: seconds deleted keys are remembered, which should
+        be as long as the values are kept
+    """
+
+    def __init__(self, hosts, pool_size=10, dead_retry=30,
+                 socket_timeout=3, replicas=1, tombstone_time=TOMBSTONE_TIME):
+        weighted = parse_weighted_hosts(hosts)
+        self.hosts = [host for host, _weight in weighted]
+        if not self.hosts:
+            raise ValueError("No memcache servers given")
+        if replicas < 1:
+            raise ValueError("Bad number of memcache replicas: %s" %
+                             replicas)
+        self.pool_size = pool_size
+        self.dead_retry = dead_retry
+        self.socket_timeout = socket_timeout
+        self.replicas = min(replicas, len(self.hosts))
+        # one more, which holds the latest values while a replica is down
+        self.read_count = min(replicas + 1, len(self.hosts))
+        self.tombstone_time = tombstone_time
+        points = sorted((_hash('%s-%s' % (host, i)), host)
+                        for host, weight in weighted
+                        for i in range(POINTS_PER_SERVER * weight))
+        self._ring = [point for point, _host in points]
+        self._ring_hosts = [host for _point, host in points]
+        self._pools = {}
+        self._dead = {}
+
+    def _new_client(self, host):
+        return memcache.Client([host], dead_retry=self.dead_retry,
+                               socket_timeout=self.socket_timeout)
+
+    def _pool(self, host):
+        pool = self._pools.get(host)
+        if pool is None:
+            pool = self._pools[host] = pools.Pool(
+                max_size=self.pool_size,
+                create=lambda: self._new_client(host))
+        return pool
+
+    def _hosts_for(self, key):
+        """Yields the distinct servers on the ring, starting with the one
+        that owns key"""
+        start = bisect.bisect(self._ring, _hash(key))
+        seen = set()
+        count = len(self._ring)
+        for i in xrange(count):
+            host = self._ring_hosts[(start + i) % count]
+            if host not in seen:
+                seen.add(host)
+                yield host
+                if len(seen) == len(self.hosts):
+                    return
+
+    def _live_hosts_for(self, key):
+        now = time.time()
+        for host in self._hosts_for(key):
+            if self._dead.get(host, 0) <= now:
+                yield host
+
+    def _client_call(self, host, method, *args):
+        """Calls a client method on a server; returns whether the server
+        answered, and the result
+
+        python-memcached does not raise on connection failures, it marks the
+        server dead and returns a failure value instead. In that case the
+        server is skipped for dead_retry seconds.
+        """
+        with self._pool(host).item() as client:
+            result = getattr(client, method)(*args)
+            server = client.servers[0]
+            if not server.deaduntil:
+                return True, result
+            server.deaduntil = 0
+        logger.warning("memcache server %s is unavailable" % host)
+        self._dead[host] = time.time() + self.dead_retry
+        return False, None
+
+    def _call(self, key, method, *args):
+        """Calls a client method on the first live server for key"""
+        for host in self._live_hosts_for(key):
+            answered, result = self._client_call(host, method, key, *args)
+            if answered:
+                return result
+        return None
+
+    def _replicated(self, key, count, method, *args):
+        """Calls a client method on the first count live servers for key;
+        yields their results"""
+        answered = 0
+        for host in self._live_hosts_for(key):
+            ok, result = self._client_call(host, method, key, *args)
+            if ok:
+                yield result
+                answered += 1
+                if answered == count:
+                    return
+
+    def _batched(self, keys, count, method, select, *args):
+        """Calls a multi-key client method for keys on the first count live
+        servers of each key, with one call per server and round; yields the
+        keys and the result of each call
+
+        The first argument of each call is select(keys of the call).
+        """
+        answered = dict((key, 0) for key in keys)
+        tried = dict((key, set()) for key in keys)
+        while True:
+            batches = {}
+            for key in keys:
+                if answered[key] == count:
+                    continue
+                for host in self._live_hosts_for(key):
+                    if host not in tried[key]:
+                        tried[key].add(host)
+                        batches.setdefault(host, []).append(key)
+                        break
+            if not batches:
+                return
+            for host, batch in batches.items():
+                ok, result = self._client_call(host, method, select(batch),
+                                               *args)
+                if ok:
+                    for key in batch:
+                        answered[key] += 1
+                    yield batch, result
+
+    def get(self, key):
+        latest = (-1, None)
+        for stored in self._replicated(key, self.read_count, 'get'):
+            if stored is not None:
+                latest = max(latest, _unwrap(stored), key=lambda v: v[0])
+        return latest[1]
+
+    def set(self, key, val, time=0):  # pylint: disable=W0621
+        results = list(self._replicated(key, self.replicas, 'set',
+                                        _wrap(val), time))
+        return bool(results) and all(results) or 0
+
+    def delete(self, key):
+        results = list(self._replicated(key, self.replicas, 'set',
+                                        _wrap(None), self.tombstone_time))
+        return bool(results) and all(results) or 0
+
+    def add(self, key, val, time=0):  # pylint: disable=W0621
+        return self._call(key, 'add', val, time)
+
+    def incr(self, key, delta=1):
+        return self._call(key, 'incr', delta)
+
+    def get_multi(self, keys):
+        """Returns the values found for keys, as a dict"""
+        latest = {}
+        for _keys, result in self._batched(set(keys), self.read_count,
+                                           'get_multi', list):
+            for key, stored in result.items():
+                version, value = _unwrap(stored)
+                if key not in latest or version > latest[key][0]:
+                    latest[key] = (version, value)
+        return dict((key, value) for key, (_version, value)
+                    in latest.items() if value is not None)
+
+    def _set_multi(self, mapping, time):  # pylint: disable=W0621
+        stored = set()
+        select = lambda keys: dict((key, mapping[key]) for key in keys)
+        for keys, failed in self._batched(set(mapping), self.replicas,
+                                          'set_multi', select, time):
+            stored.update(key for key in keys if key not in failed)
+        return [key for key in mapping if key not in stored]
+
+    def set_multi(self, mapping, time=0):  # pylint: disable=W0621
+        """Sets many values; returns the keys that were not stored"""
+        version = _new_version()
+        return self._set_multi(dict((key, _wrap(val, version))
+                                    for key, val in mapping.items()), time)
+
+    def delete_multi(self, keys):
+        tombstone = _wrap(None)
+        failed = self._set_multi(dict((key, tombstone) for key in keys),
+                                 self.tombstone_time)
+        return not failed and 1 or 0
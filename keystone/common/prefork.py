@@ -0,0 +1,184 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Pre-fork worker processes.
+
+A single eventlet process uses one core at most. The Supervisor forks
+worker processes after the listening sockets have been bound, so that all
+workers accept connections on the same sockets, and the kernel spreads the
+connections over them.
+
+The supervisor restarts workers that die. On SIGHUP, it calls its reload
+function (e.g. to re-read the configuration), starts a new set of workers
+and sends SIGTERM to the old ones. A worker receiving SIGTERM stops
+accepting connections, finishes the requests in progress and exits. On
+SIGTERM or SIGINT, the supervisor stops all workers the same way and exits
+once they have.
+"""
+
+import errno
+import logging
+import os
+import signal
+import sys
+import time
+
+import eventlet
+import eventlet.hubs
+
+LOG = logging.getLogger(__name__)
+
+# Seconds a stopping worker waits for its requests to complete
+DRAIN_TIMEOUT = 60
+
+# Workers dying sooner than this after being forked are restarted only
+# after this many seconds, so that a worker failing on start does not make
+# the supervisor fork continuously
+RESTART_DELAY = 1
+
+
+class Supervisor(object):
+    """Forks workers and keeps them running.
+
+    :param serve: called in each worker with the worker's slot (0 to
+        workers - 1); starts serving and returns the started servers, which
+        must have stop() and wait() methods
+    :param workers: number of worker processes
+    :param reload: called by the supervisor on SIGHUP, before starting the
+        new workers
+    """
+
+    def __init__(self, serve, workers, reload=None):
+        self.serve = serve
+        self.workers = workers
+        self.reload = reload
+        self.generation = 0
+        # pid -> (generation, slot, time forked) of the running workers
+        self.children = {}
+        self.running = True
+        self.reload_requested = False
+
+    def run(self):
+        """Runs the workers until SIGTERM or SIGINT"""
+        signal.signal(signal.SIGTERM, self._stop_handler)
+        signal.signal(signal.SIGINT, self._stop_handler)
+        signal.signal(signal.SIGHUP, self._reload_handler)
+
+        while self.running:
+            if self.reload_requested:
+                self._reload()
+            self._fork_missing()
+            self._wait_child()
+
+        LOG.info("Stopping %s workers" % len(self.children))
+        self._signal_all(signal.SIGTERM)
+        while self.children:
+            self._wait_child()
+
+    def _stop_handler(self, signum, frame):
+        self.running = False
+
+    def _reload_handler(self, signum, frame):
+        self.reload_requested = True
+
+    def _reload(self):
+        self.reload_requested = False
+        LOG.info("Reloading workers")
+        if self.reload is not None:
+            try:
+                self.reload()
+            except Exception:  # pylint: disable=W0703
+                LOG.exception("Reload failed; keeping the current workers")
+                return
+        self.generation += 1
+        # the new workers start before the old ones stop accepting
+        self._fork_missing()
+        self._signal_all(signal.SIGTERM, lambda gen: gen < self.generation)
+
+    def _signal_all(self, signum, generations=lambda gen: True):
+        for pid, (generation, _slot, _forked) in self.children.items():
+            if generations(generation):
+                try:
+                    os.kill(pid, signum)
+                except OSError as exc:
+                    if exc.errno != errno.ESRCH:
+                        raise
+
+    def _fork_missing(self):
+        used = set(slot for generation, slot, _forked
+                   in self.children.values()
+                   if generation == self.generation)
+        for slot in range(self.workers):
+            if slot not in used:
+                self._fork(slot)
+
+    def _fork(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                self._run_worker(slot)
+            except BaseException:  # pylint: disable=W0703
+                LOG.exception("Worker %s failed" % slot)
+                status = 1
+            # never return into the supervisor's code
+            os._exit(status)  # pylint: disable=W0212
+        LOG.info("Started worker %s (pid %s)" % (slot, pid))
+        self.children[pid] = (self.generation, slot, time.time())
+
+    def _wait_child(self):
+        """Waits for a worker to exit (or a signal to arrive)"""
+        try:
+            pid, status = os.wait()
+        except OSError as exc:
+            if exc.errno in (errno.EINTR, errno.ECHILD):
+                return
+            raise
+        if pid not in self.children:
+            return
+        generation, slot, forked = self.children.pop(pid)
+        if self.running and generation == self.generation:
+            LOG.error("Worker %s (pid %s) died with status %s" % (slot, pid,
+                                                                  status))
+            if time.time() - forked < RESTART_DELAY:
+                time.sleep(RESTART_DELAY)
+        else:
+            LOG.info("Worker %s (pid %s) stopped" % (slot, pid))
+
+    def _run_worker(self, slot):
+        """Serves until SIGTERM, then drains the requests in progress"""
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(1))
+        # the supervisor handles these
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        # the event hub of the supervisor, if any, is not to be shared
+        eventlet.hubs.use_hub()
+        supervisor = os.getppid()
+        servers = self.serve(slot)
+        # orphaned workers stop too (e.g. if the supervisor was killed)
+        while not stopping and os.getppid() == supervisor:
+            eventlet.sleep(0.1)
+
+        for server in servers:
+            server.stop()
+        with eventlet.Timeout(DRAIN_TIMEOUT, False):
+            for server in servers:
+                server.wait()
+        sys.stdout.flush()
@@ -0,0 +1,297 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Self-contained signed tokens.
+
+A signed token carries its claims (the id of the stored token, the user,
+tenant, roles and expiry) and an RSA signature of them (PKCS #1 v1.5 with
+SHA-256)::
+
+    KS2.<key id>.<base64 JSON claims>.<base64 signature>
+
+Keystone signs with a private key that never leaves its servers, and
+publishes the certificate of that key (to admins, see
+SigningKeys.published) so that services can verify tokens without calling
+Keystone for each of them, but cannot issue tokens. The key id is derived
+from the certificate. To replace the key, sign with the new key and keep
+publishing the certificates of the previous keys until the tokens they
+signed have expired; a certificate is not accepted past its expiry.
+
+Signing runs the openssl command line tool with the private key, once per
+distinct claims (RSA PKCS #1 v1.5 signatures are deterministic, so a token
+reused for the same claims keeps its signature); verifying only needs the
+public key, and is done in process.
+"""
+
+import base64
+import calendar
+import hashlib
+import json
+import time
+
+from eventlet.green import subprocess
+
+from keystone.common.cache import LRUCache
+
+PREFIX = 'KS2'
+
+# DER encoding of the DigestInfo of a SHA-256 digest, less the digest
+SHA256_DIGEST_INFO = '3031300d060960864801650304020105000420'.decode('hex')
+
+
+class InvalidToken(Exception):
+    """Raised for tokens that are not signed tokens, or whose signature is
+    not valid"""
+    pass
+
+
+class SigningError(Exception):
+    """Raised when openssl cannot sign, or read a key or certificate"""
+    pass
+
+
+def _encode(data):
+    return base64.urlsafe_b64encode(data).rstrip('=')
+
+
+def _decode(data):
+    data = str(data)
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _equal(a, b):
+    """Compares two strings in a time that does not depend on where they
+    differ"""
+    if len(a) != len(b):
+        return False
+    result = 0
+    for x, y in zip(a, b):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+
+def _openssl(args, data):
+    """Runs openssl with data as its input, and returns its output"""
+    try:
+        process = subprocess.Popen(['openssl'] + args,
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+    except OSError as exc:
+        raise SigningError("Unable to run openssl: %s" % exc)
+    output, error = process.communicate(data)
+    if process.returncode:
+        raise SigningError("openssl %s failed: %s" % (args[0],
+                                                      error.strip()))
+    return output
+
+
+def _pem_body(pem, label):
+    """Returns the DER data of the first PEM block with label"""
+    begin = '-----BEGIN %s-----' % label
+    end = '-----END %s-----' % label
+    try:
+        start = pem.index(begin) + len(begin)
+        return base64.b64decode(''.join(pem[start:pem.index(end, start)]
+                                        .split()))
+    except (TypeError, ValueError):
+        raise SigningError("No %s found" % label)
+
+
+def _der_element(data, offset=0):
+    """Returns the tag, the content and the end of the DER element at
+    offset"""
+    tag, length = ord(data[offset]), ord(data[offset + 1])
+    offset += 2
+    if length & 0x80:
+        count = length & 0x7f
+        length = int(data[offset:offset + count].encode('hex'), 16)
+        offset += count
+    if offset + length > len(data):
+        raise SigningError("Truncated DER element")
+    return tag, data[offset:offset + length], offset + length
+
+
+def _rsa_public_key(der):
+    """Returns the modulus and exponent of a DER SubjectPublicKeyInfo"""
+    try:
+        _tag, info, _end = _der_element(der)
+        _tag, _algorithm, end = _der_element(info)
+        _tag, bits, _end = _der_element(info, end)
+        # a bit string, whose first byte counts the unused bits (none)
+        _tag, key, _end = _der_element(bits[1:])
+        _tag, modulus, end = _der_element(key)
+        _tag, exponent, _end = _der_element(key, end)
+    except IndexError:
+        raise SigningError("Malformed public key")
+    return int(modulus.encode('hex'), 16), int(exponent.encode('hex'), 16)
+
+
+def is_signed(token):
+    """Tells signed tokens from other (e.g. UUID) tokens"""
+    return bool(token) and token.startswith(PREFIX + '.') and \
+        token.count('.') == 3
+
+
+def key_id(token):
+    """Returns the id of the key that signed a token"""
+    if not is_signed(token):
+        raise InvalidToken("Not a signed token")
+    return token.split('.')[1]
+
+
+def _unsigned(claims, key_id):
+    """Returns the part of a token carrying claims that is signed"""
+    return '%s.%s.%s' % (PREFIX, key_id,
+        _encode(json.dumps(claims, sort_keys=True, separators=(',', ':'))))
+
+
+def _sign(unsigned, keyfile):
+    signature = _openssl(['dgst', '-sha256', '-sign', keyfile], unsigned)
+    return '%s.%s' % (unsigned, _encode(signature))
+
+
+def sign(claims, key_id, keyfile):
+    """Returns a signed token carrying claims (a JSON serializable dict),
+    signed with the PEM private key in keyfile"""
+    return _sign(_unsigned(claims, key_id), keyfile)
+
+
+class Certificate(object):
+    """A PEM certificate of a signing key, which verifies the tokens the key
+    signed
+
+    :param pem: the certificate, in PEM format
+    """
+
+    def __init__(self, pem):
+        self.pem = str(pem).strip() + '\n'
+        der = _pem_body(self.pem, 'CERTIFICATE')
+        self.key_id = hashlib.sha256(der).hexdigest()[:16]
+        output = _openssl(['x509', '-noout', '-enddate', '-pubkey'],
+                          self.pem)
+        self.modulus, self.exponent = _rsa_public_key(
+            _pem_body(output, 'PUBLIC KEY'))
+        # notAfter=Oct 20 08:18:22 2026 GMT
+        end = output.split('\n', 1)[0].split('=', 1)[1]
+        self.expires = calendar.timegm(time.strptime(
+            ' '.join(end.split()), '%b %d %H:%M:%S %Y %Z'))
+
+    def is_issued_by(self, cafile):
+        """Tells whether a certificate authority in cafile issued the
+        certificate"""
+        try:
+            output = _openssl(['verify', '-CAfile', cafile], self.pem)
+        except SigningError:
+            return False
+        return output.strip().endswith(': OK')
+
+    def verify(self, token, now=None):
+        """Returns the claims of a token signed with the key of the
+        certificate
+
+        :raises: InvalidToken if the signature does not match, or the
+            certificate expired
+        """
+        if key_id(token) != self.key_id:
+            raise InvalidToken("Signed with another key")
+        if self.expires <= (now or time.time()):
+            raise InvalidToken("Signing certificate expired")
+        signed, signature = str(token).rsplit('.', 1)
+        try:
+            signature = int(_decode(signature).encode('hex') or '0', 16)
+            if signature >= self.modulus:
+                raise InvalidToken("Bad signature")
+            # the length of the modulus in bytes
+            size = (len(bin(self.modulus)) - 2 + 7) // 8
+            encoded = '%x' % pow(signature, self.exponent, self.modulus)
+            encoded = ('0' * (2 * size - len(encoded)) + encoded).decode('hex')
+            digest_info = SHA256_DIGEST_INFO + hashlib.sha256(signed).digest()
+            expected = '\x00\x01' + '\xff' * (size - 3 - len(digest_info)) + \
+                '\x00' + digest_info
+            if not _equal(encoded, expected):
+                raise InvalidToken("Bad signature")
+            return json.loads(_decode(signed.split('.')[2]))
+        except (TypeError, ValueError):
+            raise InvalidToken("Malformed token")
+
+
+class SigningKeys(object):
+    """The key signing new tokens, and the certificates verifying tokens
+
+    :param keyfile: the PEM private key that signs new tokens
+    :param certfile: the PEM certificate of that key
+    :param certfiles: the PEM certificates of previous keys, whose tokens
+        are still accepted
+    :param max_signed: number of signed tokens kept to be returned again
+        for the same claims without running openssl (0 signs every time)
+    """
+
+    def __init__(self, keyfile, certfile, certfiles=None, max_signed=1000):
+        if not keyfile or not certfile:
+            raise ValueError("A token signing key and its certificate are "
+                             "required")
+        self.keyfile = keyfile
+        self.signed = LRUCache(max_entries=max_signed)
+        self.certificates = {}
+        for path in [certfile] + list(certfiles or []):
+            with open(path) as pem:
+                certificate = Certificate(pem.read())
+            self.certificates[certificate.key_id] = certificate
+            if path == certfile:
+                self.key_id = certificate.key_id
+        # fails now rather than for each token if they do not match
+        try:
+            self.verify(self.sign({}))
+        except InvalidToken:
+            raise ValueError("The token signing key does not match %s" %
+                             certfile)
+
+    def get(self, key_id, now=None):
+        """Returns the certificate of a key that may be in use, or None"""
+        certificate = self.certificates.get(key_id)
+        if certificate is None or certificate.expires <= (now or time.time()):
+            return None
+        return certificate
+
+    def published(self, now=None):
+        """Returns the key id, certificate and expiry of the keys that may
+        be in use"""
+        now = now or time.time()
+        return [(certificate.key_id, certificate.pem, certificate.expires)
+                for certificate in self.certificates.values()
+                if certificate.expires > now]
+
+    def sign(self, claims):
+        """Returns a token carrying claims, signed with the current key"""
+        unsigned = _unsigned(claims, self.key_id)
+        token = self.signed.get(unsigned)
+        if token is None:
+            token = _sign(unsigned, self.keyfile)
+            self.signed.set(unsigned, token)
+        return token
+
+    def verify(self, token, now=None):
+        """Returns the claims of a token signed with one of the keys
+
+        :raises: InvalidToken if the token was not signed with a key in use
+        """
+        certificate = self.get(key_id(token), now)
+        if certificate is None:
+            raise InvalidToken("Unknown signing key")
+        return certificate.verify(token, now)
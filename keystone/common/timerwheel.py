@@ -0,0 +1,106 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Hierarchical timer wheel.
+
+Time is counted in ticks. Level 0 has one slot per tick for the next
+2 ** bits ticks; each higher level has slots covering 2 ** bits slots of
+the level below it. A key is placed in the lowest level whose range covers
+its expiry, and moved down a level (cascaded) when the wheel reaches its
+slot. Scheduling a key and collecting the expired keys of a tick are O(1),
+cascading adds O(levels) per key over its lifetime.
+
+Keys are not removed when they are rescheduled or no longer needed: the
+owner of the keys checks the keys returned by advance() against its own
+records, and ignores the ones that are stale.
+"""
+
+import time
+
+
+class TimerWheel(object):
+    """Expiry of keys in O(1) amortized.
+
+    :param tick: seconds per tick
+    :param bits: log2 of the number of slots per level
+    :param levels: number of levels; keys expiring later than
+        2 ** (bits * levels) ticks from now are rescheduled until they are
+        in range
+    :param now: the current time, in seconds since the epoch
+    """
+
+    def __init__(self, tick=1.0, bits=8, levels=4, now=None):
+        self.tick = float(tick)
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.levels = levels
+        self.current = self._tick(time.time() if now is None else now)
+        self.wheels = [[{} for _slot in range(1 << bits)]
+                       for _level in range(levels)]
+        # keys in the wheel, including the stale ones
+        self.count = 0
+
+    def _tick(self, when):
+        return int(when // self.tick)
+
+    def _place(self, key, expires):
+        """Returns False if key was in the slot already"""
+        delta = expires - self.current
+        for level in range(self.levels):
+            if delta < 1 << (self.bits * (level + 1)):
+                break
+        shift = self.bits * level
+        slot = self.wheels[level][(expires >> shift) & self.mask]
+        added = key not in slot
+        slot[key] = expires
+        return added
+
+    def schedule(self, key, when):
+        """Makes key expire at when (seconds since the epoch); returns the
+        tick it expires at"""
+        # the current tick has been collected already
+        expires = max(self._tick(when), self.current + 1)
+        if self._place(key, expires):
+            self.count += 1
+        return expires
+
+    def advance(self, now=None):
+        """Moves the wheel to now, and returns the keys that expired"""
+        target = self._tick(time.time() if now is None else now)
+        expired = []
+        while self.current < target:
+            if not self.count:
+                self.current = target
+                break
+            self.current += 1
+            for level in range(1, self.levels):
+                shift = self.bits * level
+                if self.current & ((1 << shift) - 1):
+                    break
+                slots = self.wheels[level]
+                slot = (self.current >> shift) & self.mask
+                entries, slots[slot] = slots[slot], {}
+                for key, expires in entries.iteritems():
+                    if not self._place(key, expires):
+                        self.count -= 1
+            slots = self.wheels[0]
+            slot = self.current & self.mask
+            entries, slots[slot] = slots[slot], {}
+            self.count -= len(entries)
+            expired.extend(entries)
+        return expired
@@ -24,6 +24,8 @@ Utility methods for working with WSGI servers
 
 import json
 import logging
+import socket as pysocket
+import struct
 import sys
 import datetime
 import ssl
@@ -36,6 +38,9 @@ import webob.dec
 
 LOG = logging.getLogger(__name__)
 
+# The servers started by this process (see get_server_stats)
+_SERVERS = []
+
 
 def find_console_handler(logger):
     """Returns a stream handler, if any"""
@@ -82,6 +87,35 @@ class WritableLogger(object):
         self.logger.log(self.level, msg.strip("\n"))
 
 
+class StopServing(Exception):
+    """Raised in the green thread of a listener to stop it"""
+    pass
+
+
+class Listener(object):
+    """Wraps a listening socket for eventlet.wsgi.server.
+
+    Once StopServing is raised in accept(), the server stops accepting
+    connections and exits after the requests in progress have completed
+    (eventlet closes the connections it considers idle when it exits, which
+    includes connections with a request in progress)."""
+
+    def __init__(self, socket, pool):
+        self.socket = socket
+        self.pool = pool
+
+    def accept(self):
+        try:
+            return self.socket.accept()
+        except StopServing:
+            self.pool.waitall()
+            # ends the accept loop of eventlet.wsgi.server
+            raise SystemExit()
+
+    def __getattr__(self, name):
+        return getattr(self.socket, name)
+
+
 def run_server(application, port):
     """Run a WSGI server with the given application."""
     LOG.debug("Running WSGI server on 0.0.0.0:%s" % port)
@@ -89,34 +123,104 @@ def run_server(application, port):
     eventlet.wsgi.server(sock, application)
 
 
+def _accept_queue(socket):
+    """Returns the number of connections waiting to be accepted on a
+    listening socket and the limit of that queue, or (None, None) where the
+    kernel does not tell (Linux reports them in TCP_INFO)"""
+    try:
+        info = socket.getsockopt(pysocket.IPPROTO_TCP, pysocket.TCP_INFO, 32)
+        # tcpi_unacked and tcpi_sacked, after 8 bytes and 4 integers
+        return struct.unpack('8B6I', info[:32])[12:14]
+    except (AttributeError, pysocket.error, struct.error):
+        return None, None
+
+
+def get_server_stats():
+    """Returns the use of the green thread pool and of the accept queue of
+    each server started by this process"""
+    stats = {}
+    for server in _SERVERS:
+        stats.update(server.get_stats())
+    return stats
+
+
 class Server(object):
     """Server class to manage multiple WSGI sockets and applications."""
     started = False
 
-    def __init__(self, application=None, port=None, threads=1000):
+    def __init__(self, application=None, port=None, threads=1000,
+                 keepalive=True, socket_timeout=None):
+        """
+        :param threads: the maximum number of requests served at once; the
+            connections accepted beyond that wait in the accept queue
+        :param keepalive: whether a connection can serve several requests
+        :param socket_timeout: seconds a client connection may stay idle,
+            or None to wait indefinitely
+        """
         self.application = application
         self.port = port
+        self.keepalive = keepalive
+        self.socket_timeout = socket_timeout
+        # green threads handling requests
         self.pool = eventlet.GreenPool(threads)
+        # green threads accepting connections
+        self.listeners = []
         self.socket_info = {}
         self.threads = {}
 
     def start(self, application=None, port=None, host='0.0.0.0', key=None,
-            backlog=128):
-        """Run a WSGI server with the given application."""
+            backlog=128, socket=None):
+        """Run a WSGI server with the given application.
+
+        :param socket: a listening socket to accept connections on (by
+            default, one is bound to host and port)
+        """
         if application is not None:
             self.application = application
         if port is not None:
             self.port = port
         LOG.debug("start server '%s' on %s:%s" % (key, host, self.port))
-        socket = eventlet.listen((host, self.port), backlog=backlog)
-        thread = self.pool.spawn(self._run, self.application, socket)
+        if socket is None:
+            socket = eventlet.listen((host, self.port), backlog=backlog)
+        self._spawn(self.application, socket, key)
+
+    def _spawn(self, application, socket, key):
+        thread = eventlet.spawn(self._run, application, socket)
+        self.listeners.append(thread)
+        self.socket_info[key or "%s:%s" % socket.getsockname()[:2]] = socket
+        if self not in _SERVERS:
+            _SERVERS.append(self)
         if key:
-            self.socket_info[key] = socket
             self.threads[key] = thread
 
+    def stop(self):
+        """Stops accepting connections. The requests in progress run to
+        completion; wait() returns once they have."""
+        for thread in self.listeners:
+            thread.kill(StopServing)
+        if self in _SERVERS:
+            _SERVERS.remove(self)
+
+    def get_stats(self):
+        """Returns the use of the green thread pool and of the accept queue
+        of each socket of the server"""
+        stats = {}
+        for key, socket in self.socket_info.items():
+            queued, backlog = _accept_queue(socket)
+            stats[key] = {'pool_size': self.pool.size,
+                          'busy': self.pool.running(),
+                          'free': self.pool.free(),
+                          'queued_accepts': queued,
+                          'backlog': backlog,
+                          'keepalive': self.keepalive,
+                          'socket_timeout': self.socket_timeout}
+        return stats
+
     def wait(self):
         """Wait until all servers have completed running."""
         try:
+            for thread in self.listeners:
+                thread.wait()
             self.pool.waitall()
         except KeyboardInterrupt:
             pass
@@ -125,7 +229,9 @@ class Server(object):
         """Start a WSGI server in a new green thread."""
         LOG.debug("_run called")
         eventlet_logger = logging.getLogger('eventlet.wsgi.server')
-        eventlet.wsgi.server(socket, application, custom_pool=self.pool,
+        eventlet.wsgi.server(Listener(socket, self.pool), application,
+                custom_pool=self.pool, keepalive=self.keepalive,
+                socket_timeout=self.socket_timeout,
                 log=WritableLogger(eventlet_logger, logging.root.level))
 
 
@@ -134,10 +240,11 @@ class SslServer(Server):
     # pylint: disable=W0221,R0913
     def start(self, application, port, host='0.0.0.0', backlog=128,
               certfile=None, keyfile=None, ca_certs=None,
-              cert_required='True', key=None):
+              cert_required='True', key=None, socket=None):
         """Run a 2-way SSL WSGI server with the given application."""
         LOG.debug("start SSL server '%s' on %s:%s" % (key, host, port))
-        socket = eventlet.listen((host, port), backlog=backlog)
+        if socket is None:
+            socket = eventlet.listen((host, port), backlog=backlog)
         if cert_required == 'True':
             cert_reqs = ssl.CERT_REQUIRED
         else:
@@ -146,10 +253,7 @@ class SslServer(Server):
                                       keyfile=keyfile,
                                       server_side=True, cert_reqs=cert_reqs,
                                       ca_certs=ca_certs)
-        thread = self.pool.spawn(self._run, application, sslsocket)
-        if key:
-            self.socket_info[key] = sslsocket
-            self.threads[key] = thread
+        self._spawn(application, sslsocket, key)
 
 
 class Middleware(object):
@@ -125,6 +125,16 @@ def register_cli_bool(*args, **kw):
     return CONF.register_cli_opt(cfg.BoolOpt(*args, **kw), group=group)
 
 
+def register_int(*args, **kw):
+    group = _ensure_group(kw)
+    return CONF.register_opt(cfg.IntOpt(*args, **kw), group=group)
+
+
+def register_cli_int(*args, **kw):
+    group = _ensure_group(kw)
+    return CONF.register_cli_opt(cfg.IntOpt(*args, **kw), group=group)
+
+
 def register_list(*args, **kw):
     group = _ensure_group(kw)
     return CONF.register_opt(cfg.ListOpt(*args, **kw), group=group)
@@ -153,6 +163,14 @@ register_bool("service_ssl")
 register_str("admin_host")
 register_str("admin_port")
 register_bool("admin_ssl")
+for prefix in ["service", "admin"]:
+    register_int("%s_pool_size" % prefix, default=1000)
+    register_int("%s_backlog" % prefix, default=128)
+    register_bool("%s_keepalive" % prefix, default=True)
+    register_int("%s_client_socket_timeout" % prefix, default=0)
+register_int("max_header_line", default=8192)
+register_cli_int("workers", short="w", default=0,
+                 help="Number of worker processes serving the APIs")
 register_str("bind_host")
 register_str("bind_port")
 register_str("certfile")
@@ -162,13 +180,43 @@ register_bool("cert_required")
 register_str("keystone_admin_role")
 register_str("keystone_service_admin_role")
 register_bool("hash_password")
+register_str("password_hash_pool")
+register_int("password_hash_workers", default=0)
 register_str("backends")
 register_str("global_service_id")
 register_bool("disable_tokens_in_url")
+register_int("validate_cache_max_entries", default=0)
+register_int("validate_cache_max_bytes", default=10 * 1024 * 1024)
+register_int("validate_cache_ttl", default=300)
+register_int("catalog_cache_max_entries", default=0)
+register_int("catalog_cache_ttl", default=300)
+register_int("password_cache_max_entries", default=0)
+register_int("password_cache_ttl", default=60)
+register_int("token_reaper_interval", default=0)
+register_str("token_format", default="uuid")
+register_str("token_signing_keyfile")
+register_str("token_signing_certfile")
+register_list("token_signing_certfiles")
+register_int("token_reaper_batch_size", default=1000)
+register_int("revocation_event_ttl", default=86400)
 
 register_str("sql_connection", group="keystone.backends.sqlalchemy")
 register_str("backend_entities", group="keystone.backends.sqlalchemy")
 register_str("sql_idle_timeout", group="keystone.backends.sqlalchemy")
+register_int("sql_pool_size", group="keystone.backends.sqlalchemy")
+register_int("sql_max_overflow", group="keystone.backends.sqlalchemy")
+register_int("sql_pool_timeout", group="keystone.backends.sqlalchemy")
+register_bool("sql_pool_pre_ping", group="keystone.backends.sqlalchemy",
+              default=False)
+register_list("sql_read_connections", group="keystone.backends.sqlalchemy")
+register_int("sql_read_after_write", group="keystone.backends.sqlalchemy",
+             default=5)
+register_int("token_bucket_hours", group="keystone.backends.sqlalchemy",
+             default=0)
+register_int("uid_cache_max_entries", group="keystone.backends.sqlalchemy",
+             default=0)
+register_int("uid_cache_ttl", group="keystone.backends.sqlalchemy",
+             default=300)
 # May need to initialize other backends, too.
 register_str("ldap_url", group="keystone.backends.ldap")
 register_str("ldap_user", group="keystone.backends.ldap")
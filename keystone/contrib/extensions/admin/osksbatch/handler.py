@@ -0,0 +1,41 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Router & Controller for handling Batch Token Validation
+
+"""
+import logging
+
+from keystone.common import wsgi
+from keystone.controllers.token import TokenController
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+class BatchValidationController(wsgi.Controller):
+    """Controller for validating several tokens in one request"""
+
+    # pylint: disable=W0231
+    def __init__(self):
+        self.token_controller = TokenController()
+
+        logger.info("Initializing Batch Token Validation extension")
+
+    def handle_validate_request(self, req):
+        return self.token_controller.validate_tokens(req=req)
@@ -0,0 +1,46 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Stats Controller
+
+"""
+import logging
+
+from keystone import utils
+from keystone.controllers.base_controller import BaseController
+from keystone.logic import service
+from keystone.logic.types.stats import Stats
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+class StatsController(BaseController):
+    """Controller for the counters of the serving process (admin only)"""
+
+    def __init__(self):
+        self.identity_service = service.IdentityService()
+
+    @utils.wrap_error
+    def get_stats(self, req):
+        admin_token = utils.get_auth_token(req)
+        stats = Stats({
+            'servers': self.identity_service.get_server_stats(admin_token),
+            'caches': self.identity_service.get_cache_stats(admin_token),
+            'backends': self.identity_service.get_backend_stats(admin_token)})
+        return utils.send_result(200, req, stats)
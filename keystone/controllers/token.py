@@ -103,6 +103,20 @@ class TokenController(BaseController):
         return self.identity_service.validate_token(
                 utils.get_auth_token(req), token_id, belongs_to, service_ids)
 
+    @utils.wrap_error
+    def validate_tokens(self, req):
+        """Validates the list of tokens in the request body"""
+        token_ids = utils.get_normalized_request_content(auth.TokenIds, req)
+        belongs_to = req.GET.get('belongsTo')
+        service_ids = None
+        if extension_reader.is_extension_supported('hpidm'):
+            # service IDs are only relevant if hpidm extension is enabled
+            service_ids = req.GET.get('HP-IDM-serviceId')
+        result = self.identity_service.validate_tokens(
+                utils.get_auth_token(req), token_ids.token_ids, belongs_to,
+                service_ids)
+        return utils.send_result(200, req, result)
+
     @utils.wrap_error
     def validate_token(self, req, token_id):
         if CONF.disable_tokens_in_url:
@@ -120,6 +134,21 @@ class TokenController(BaseController):
             self._validate_token(req, token_id)
             return utils.send_result(200, req)
 
+    @utils.wrap_error
+    def get_signing_certificates(self, req):
+        """Returns the certificates that verify signed tokens"""
+        return utils.send_result(200, req,
+                self.identity_service.get_signing_certificates(
+                        utils.get_auth_token(req)))
+
+    @utils.wrap_error
+    def get_revocation_events(self, req):
+        """Returns the revocation events recorded after the since cursor"""
+        return utils.send_result(200, req,
+                self.identity_service.get_revocation_events(
+                        utils.get_auth_token(req), req.GET.get('since', 0),
+                        req.GET.get('limit', 1000)))
+
     @utils.wrap_error
     def delete_token(self, req, token_id):
         if CONF.disable_tokens_in_url:
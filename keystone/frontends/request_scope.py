@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright (c) 2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Request Scope Middleware
+
+Wraps each request in a backend request scope: all backend calls made while
+handling the request share the same resources. With the sqlalchemy backend,
+the request checks a single connection out of the pool, on its first query,
+and returns it once the response is ready, instead of checking a connection
+in and out for every backend call.
+
+"""
+
+import logging
+
+from keystone import backends
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+PROTOCOL_NAME = "Request Scope"
+
+
+class RequestScopeFilter(object):
+    """Middleware filter scoping backend resources to a request"""
+
+    def __init__(self, app, conf):
+        msg = "Starting the %s component" % PROTOCOL_NAME
+        logger.info(msg)
+        self.app = app
+        self.conf = conf
+
+    def __call__(self, env, start_response):
+        backends.open_request_scope()
+        try:
+            return self.app(env, start_response)
+        finally:
+            backends.close_request_scope()
+
+
+def filter_factory(global_conf, **local_conf):
+    """Returns a WSGI filter app for use with paste.deploy."""
+    conf = global_conf.copy()
+    conf.update(local_conf)
+
+    def ext_filter(app):
+        return RequestScopeFilter(app, conf)
+    return ext_filter
@@ -0,0 +1,218 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compiled service catalogs.
+
+Rendering the service catalog of an auth response means loading the global
+and tenant endpoint templates, grouping them by service and substituting the
+tenant id into their URLs. A ServiceCatalog holds the result of that work for
+one tenant (or for unscoped tokens), so responses only pick the URL kinds the
+caller is allowed to see.
+
+CatalogCompiler keeps the compiled catalogs. Changes to endpoint templates or
+services drop all of them, while changes to the endpoints of a tenant only
+drop the catalog of that tenant. A catalog is compiled completely before it
+is published, and it is not published at all if a change was recorded while
+it was being compiled, so green threads never see a half-built or outdated
+catalog.
+"""
+
+import logging
+
+from keystone.common.cache import LRUCache
+from keystone.logic.types import fault
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+URL_KINDS = ('admin', 'internal', 'public')
+
+
+class CatalogEndpoint(object):
+    """An endpoint with its URLs resolved for a tenant.
+
+    :param urls: dict mapping URL kinds ('public', ...) to (url, tenant_url)
+        tuples; tenant_url tells whether %tenant_id% was substituted
+    """
+
+    __slots__ = ['id', 'region', 'version_id', 'urls']
+
+    def __init__(self, id, region, version_id, urls):
+        self.id = id
+        self.region = region
+        self.version_id = version_id
+        self.urls = urls
+
+
+class CatalogService(object):
+    """A service and its endpoints, in endpoint template order."""
+
+    __slots__ = ['id', 'name', 'type', 'endpoints']
+
+    def __init__(self, id, name, type, endpoints=None):
+        self.id = id
+        self.name = name
+        self.type = type
+        self.endpoints = endpoints or []
+
+
+class ServiceCatalog(object):
+    """An immutable service catalog compiled for one tenant.
+
+    tenant_id is None for the catalog of unscoped tokens, which leaves out
+    all URLs that contain %tenant_id%.
+    """
+
+    def __init__(self, tenant_id, services):
+        self.tenant_id = tenant_id
+        self.services = tuple(services)
+        self._selections = {}
+
+    @staticmethod
+    def compile(tenant_id, endpoint_templates, get_service):
+        """Builds the catalog of a tenant from its endpoint templates
+
+        :param endpoint_templates: the global and tenant endpoint templates
+        :param get_service: function returning the service for an id
+        """
+        services = []
+        services_by_id = {}
+        for template in endpoint_templates:
+            urls = {}
+            for url_kind in URL_KINDS:
+                url = getattr(template, url_kind + "_url")
+                if not url:
+                    continue
+                if '%tenant_id%' in url:
+                    # Don't return tenant endpoints if token not scoped
+                    # to a tenant
+                    if tenant_id:
+                        urls[url_kind] = (url.replace('%tenant_id%',
+                                                      str(tenant_id)), True)
+                else:
+                    urls[url_kind] = (url, False)
+            if not urls:
+                continue
+
+            service = services_by_id.get(template.service_id)
+            if service is None:
+                dservice = get_service(template.service_id)
+                if dservice:
+                    service = CatalogService(template.service_id,
+                                             dservice.name, dservice.type)
+                else:
+                    # only fails responses that would list this service
+                    service = CatalogService(template.service_id, None, None)
+                services_by_id[template.service_id] = service
+                services.append(service)
+            version_id = getattr(template, 'version_id', None)
+            service.endpoints.append(CatalogEndpoint(
+                str(template.id), template.region,
+                str(version_id) if version_id else None, urls))
+        return ServiceCatalog(tenant_id, services)
+
+    def select(self, url_types):
+        """Returns the services with the URL kinds in url_types
+
+        The result is a list of (service, endpoints) tuples, where endpoints
+        is a list of endpoints, each given as a list of (attribute, value)
+        pairs ready to be rendered. Services without any matching endpoint
+        are left out. Results are kept per url_types, since the catalog
+        never changes.
+        """
+        key = tuple(url_types)
+        selection = self._selections.get(key)
+        if selection is not None:
+            return selection
+
+        selection = []
+        for service in self.services:
+            endpoints = []
+            for endpoint in service.endpoints:
+                attributes = []
+                if endpoint.region:
+                    attributes.append(("region", endpoint.region))
+                include_this_endpoint = False
+                tenant_url = False
+                for url_kind in url_types:
+                    if url_kind in endpoint.urls:
+                        url, is_tenant_url = endpoint.urls[url_kind]
+                        attributes.append((url_kind + "URL", url))
+                        tenant_url = tenant_url or is_tenant_url
+                        include_this_endpoint = True
+                if not include_this_endpoint:
+                    continue
+                if tenant_url:
+                    attributes.append(("tenantId", str(self.tenant_id)))
+                attributes.append(("id", endpoint.id))
+                if endpoint.version_id:
+                    attributes.append(("versionId", endpoint.version_id))
+                endpoints.append(attributes)
+            if endpoints:
+                if service.name is None:
+                    raise fault.ItemNotFoundFault(
+                        "The service could not be found for" +
+                        str(service.id))
+                selection.append((service, endpoints))
+        self._selections[key] = selection
+        return selection
+
+
+class CatalogCompiler(object):
+    """Compiles and keeps the service catalogs of tenants.
+
+    :param load_endpoint_templates: function returning the global and
+        tenant endpoint templates for a tenant id (or None)
+    :param get_service: function returning the service for an id
+    :param max_entries: number of catalogs kept (0 compiles every time)
+    :param ttl: lifetime of a compiled catalog in seconds
+    """
+
+    def __init__(self, load_endpoint_templates, get_service, max_entries=0,
+                 ttl=None):
+        self.load_endpoint_templates = load_endpoint_templates
+        self.get_service = get_service
+        self.catalogs = LRUCache(max_entries=max_entries, ttl=ttl)
+
+    @property
+    def generation(self):
+        """Incremented on every invalidation"""
+        return self.catalogs.generation
+
+    def get(self, tenant_id):
+        """Returns the compiled catalog for a tenant (None for global)"""
+        catalog = self.catalogs.get(tenant_id)
+        if catalog is not None:
+            return catalog
+
+        generation = self.catalogs.generation
+        catalog = ServiceCatalog.compile(
+            tenant_id, self.load_endpoint_templates(tenant_id),
+            self.get_service)
+        self.catalogs.set(tenant_id, catalog, generation=generation)
+        return catalog
+
+    def invalidate(self, tenant_id=None):
+        """Drops the catalog of a tenant, or all catalogs if None"""
+        if tenant_id is None:
+            logger.debug("Recompiling all service catalogs")
+            self.catalogs.clear()
+        else:
+            self.catalogs.delete(tenant_id)
+
+    def stats(self):
+        return self.catalogs.stats()
@@ -0,0 +1,120 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Deletes expired tokens.
+
+Nothing else removes tokens once they have expired, so without the reaper
+the tokens table only grows. Tokens are deleted in batches of batch_size,
+and other green threads get to run between two batches, so a server running
+the reaper keeps answering requests while it works.
+
+The reaper also deletes the revocation events older than event_ttl
+seconds.
+"""
+
+from datetime import datetime, timedelta
+import logging
+
+import eventlet
+
+from keystone import config
+from keystone.managers.token import Manager as TokenManager
+
+CONF = config.CONF
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+REAPER = None
+
+
+class TokenReaper(object):
+    """Deletes expired tokens, once or every interval seconds.
+
+    :param token_manager: the token manager to delete tokens with
+    :param batch_size: number of tokens deleted per backend call
+    :param interval: seconds between two runs of the green thread
+    :param event_ttl: seconds the revocation events are kept
+    """
+
+    def __init__(self, token_manager, batch_size=1000, interval=3600,
+                 event_ttl=86400):
+        self.token_manager = token_manager
+        self.batch_size = batch_size
+        self.interval = interval
+        self.event_ttl = event_ttl
+        self.thread = None
+
+    def reap(self, before=None):
+        """Deletes the tokens that expired before the given time (now by
+        default) and returns how many were deleted"""
+        before = before or datetime.now()
+        total = 0
+        while True:
+            deleted = self.token_manager.delete_expired(before,
+                                                        self.batch_size)
+            if not deleted:
+                break
+            total += deleted
+            eventlet.sleep(0)
+        return total
+
+    def reap_revocation_events(self, now=None):
+        """Deletes the revocation events older than event_ttl seconds and
+        returns how many were deleted"""
+        before = (now or datetime.now()) - timedelta(seconds=self.event_ttl)
+        return self.token_manager.delete_revocation_events(before)
+
+    def _run(self):
+        while True:
+            try:
+                deleted = self.reap()
+                logger.info("Deleted %s expired tokens" % deleted)
+            except NotImplementedError:
+                logger.warning("The token backend cannot delete expired "
+                               "tokens; stopping the token reaper")
+                return
+            except Exception:  # pylint: disable=W0703
+                logger.exception("Failed to delete expired tokens")
+            try:
+                deleted = self.reap_revocation_events()
+                logger.info("Deleted %s revocation events" % deleted)
+            except Exception:  # pylint: disable=W0703
+                logger.exception("Failed to delete revocation events")
+            eventlet.sleep(self.interval)
+
+    def start(self):
+        """Runs the reaper every interval seconds in a green thread"""
+        if self.thread is None:
+            self.thread = eventlet.spawn(self._run)
+
+    def stop(self):
+        if self.thread is not None:
+            self.thread.kill()
+            self.thread = None
+
+
+def start_reaper():
+    """Starts the reaper green thread of this process, if configured with
+    token_reaper_interval"""
+    global REAPER  # pylint: disable=W0603
+    if REAPER is None and CONF.token_reaper_interval:
+        REAPER = TokenReaper(TokenManager(),
+                             batch_size=CONF.token_reaper_batch_size,
+                             interval=CONF.token_reaper_interval,
+                             event_ttl=CONF.revocation_event_ttl)
+        REAPER.start()
+    return REAPER
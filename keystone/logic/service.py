@@ -21,6 +21,10 @@ import logging
 import uuid
 
 from keystone import config
+from keystone.common.cache import LRUCache
+from keystone.common import signing
+from keystone.common import wsgi
+from keystone.logic.catalog import CatalogCompiler
 from keystone.logic.types import auth, atom
 from keystone.logic.signer import Signer
 import keystone.backends as backends
@@ -56,6 +60,17 @@ SERVICE_ADMIN_ROLE_ID = None
 SERVICE_ADMIN_ROLE_NAME = None
 GLOBAL_SERVICE_ID = None  # to facilitate global roles for validate tokens
 
+# Rendered ValidateData objects, keyed by (token_id, belongs_to, service_ids)
+# and tagged with the token, user and tenants they were built from.
+VALIDATE_CACHE = LRUCache(max_entries=0)
+# Rendered AuthData objects, keyed by token_id; also tagged with "catalog"
+# since they include the service catalog.
+AUTH_CACHE = LRUCache(max_entries=0)
+# Compiled service catalogs, one per tenant
+CATALOG = None
+# Revocation events returned per request at most
+MAX_REVOCATION_EVENTS = 1000
+
 LOG = logging.getLogger(__name__)
 
 
@@ -111,6 +126,40 @@ class IdentityService(object):
         global GLOBAL_SERVICE_ID
         GLOBAL_SERVICE_ID = CONF.global_service_id or "global"
 
+        global VALIDATE_CACHE
+        VALIDATE_CACHE = LRUCache(
+            max_entries=CONF.validate_cache_max_entries,
+            max_bytes=CONF.validate_cache_max_bytes,
+            ttl=CONF.validate_cache_ttl)
+
+        global AUTH_CACHE
+        AUTH_CACHE = LRUCache(
+            max_entries=CONF.validate_cache_max_entries,
+            max_bytes=CONF.validate_cache_max_bytes,
+            ttl=CONF.validate_cache_ttl)
+
+        UserManager.password_cache = LRUCache(
+            max_entries=CONF.password_cache_max_entries,
+            ttl=CONF.password_cache_ttl)
+
+        if CONF.token_format not in ['uuid', 'signed']:
+            raise ValueError("Unsupported token_format %s" % CONF.token_format)
+        if CONF.token_signing_keyfile:
+            # signed tokens are accepted even if UUID tokens are issued
+            TokenManager.signing_keys = signing.SigningKeys(
+                CONF.token_signing_keyfile, CONF.token_signing_certfile,
+                CONF.token_signing_certfiles)
+        elif CONF.token_format == 'signed':
+            raise ValueError("Signed tokens require a token_signing_keyfile")
+        else:
+            TokenManager.signing_keys = None
+
+        global CATALOG
+        CATALOG = CatalogCompiler(self.tenant_manager.get_all_endpoints,
+                                  self.service_manager.get,
+                                  max_entries=CONF.catalog_cache_max_entries,
+                                  ttl=CONF.catalog_cache_ttl)
+
         LOG.debug("init with ADMIN_ROLE_NAME=%s, SERVICE_ADMIN_ROLE_NAME=%s, "
                   "GLOBAL_SERVICE_ID=%s" % (ADMIN_ROLE_NAME,
                                             SERVICE_ADMIN_ROLE_NAME,
@@ -249,31 +298,235 @@ class IdentityService(object):
             dtoken.tenant_id = tenant_id
             dtoken.expires = datetime.now() + timedelta(days=1)
             dtoken = self.token_manager.create(dtoken)
-        return self.get_auth_data(dtoken)
+        auth_data = self.get_auth_data(dtoken)
+        if CONF.token_format == 'signed':
+            auth_data = self._sign_auth_data(auth_data)
+        return auth_data
+
+    @staticmethod
+    def _sign_auth_data(auth_data):
+        """Returns a copy of auth_data whose token is a signed token, which
+        carries the claims services need (see keystone.common.signing)"""
+        token = auth_data.token
+        tenant = token.tenant
+        claims = {
+            'id': token.id,
+            'user': {'id': unicode(auth_data.user.id),
+                     'name': auth_data.user.username},
+            'tenant': {'id': tenant and unicode(tenant.id),
+                       'name': tenant and tenant.name},
+            'roles': [role.name for role in auth_data.user.rolegrants.values],
+            'expires': token.expires.isoformat()}
+        signed = auth.Token(token.expires,
+                            TokenManager.signing_keys.sign(claims), tenant)
+        return auth.AuthData(signed, auth_data.user,
+                             base_urls=auth_data.base_urls,
+                             url_types=auth_data.url_types,
+                             catalog=auth_data.catalog)
 
     # pylint: disable=W0613
     @service_admin_token_validator
     def validate_token(self, admin_token, token_id, belongs_to=None,
                        service_ids=None):
-        (token, user) = self._validate_token(token_id, belongs_to, True)
+        cache_key = (token_id, belongs_to, service_ids)
+        auth_data = VALIDATE_CACHE.get(cache_key)
+        if auth_data is not None:
+            return auth_data
+        generation = VALIDATE_CACHE.generation
+
+        view = self._validate_token_view(token_id, belongs_to, True)
+        token = view['token']
         if service_ids and (token.tenant_id or belongs_to):
             # scope token, validate the service IDs if present
             service_ids = self.parse_service_ids(service_ids)
             self.validate_service_ids(service_ids)
-        auth_data = self.get_validate_data(token, user, service_ids)
+        auth_data = self._get_scoped_validate_data(view, belongs_to,
+                                                   service_ids)
+        self._cache_token_data(VALIDATE_CACHE, cache_key, view['token'],
+                               view['user'], auth_data, generation)
+        return auth_data
+
+    # pylint: disable=W0613
+    @service_admin_token_validator
+    def validate_tokens(self, admin_token, token_ids, belongs_to=None,
+                        service_ids=None):
+        """Validates several tokens at once
+
+        Does what validate_token does for each token, but loads all the
+        tokens that are not cached with a single backend call. A token that
+        fails validation does not fail the others: its result is the fault
+        validate_token would have raised.
+
+        Returns a ValidateDataList, mapping each token id to its ValidateData
+        or fault.
+        """
+        results = {}
+        generation = VALIDATE_CACHE.generation
+        missing = []
+        for token_id in token_ids:
+            if token_id in results:
+                continue
+            auth_data = VALIDATE_CACHE.get((token_id, belongs_to,
+                                            service_ids))
+            results[token_id] = auth_data
+            if auth_data is None:
+                missing.append(token_id)
+
+        parsed_service_ids = None
+        if missing and service_ids:
+            parsed_service_ids = self.parse_service_ids(service_ids)
+            self.validate_service_ids(parsed_service_ids)
+
+        views = self.token_manager.get_validation_views(
+            [token_id for token_id in missing if token_id])
+        for token_id in missing:
+            try:
+                view = self._check_token_view(token_id, views.get(token_id),
+                                              belongs_to, True)
+                token = view['token']
+                scoped_service_ids = None
+                if token.tenant_id or belongs_to:
+                    scoped_service_ids = parsed_service_ids
+                auth_data = self._get_scoped_validate_data(
+                    view, belongs_to, scoped_service_ids)
+            except fault.IdentityFault as e:
+                results[token_id] = e
+                continue
+            results[token_id] = auth_data
+            self._cache_token_data(VALIDATE_CACHE,
+                                   (token_id, belongs_to, service_ids),
+                                   view['token'], view['user'], auth_data,
+                                   generation)
+        return auth.ValidateDataList(
+            [(token_id, results[token_id]) for token_id in token_ids])
+
+    def _get_scoped_validate_data(self, view, belongs_to, service_ids):
+        """Returns the ValidateData of a checked view, filtering the roles
+        by the (parsed and validated) service_ids if given"""
+        auth_data = self.get_validate_data_from_view(view, service_ids)
+        token = view['token']
         if service_ids and (token.tenant_id or belongs_to):
             # we have service Ids and scope token, make sure we have some roles
             if not auth_data.user.rolegrants.values:
                 raise fault.UnauthorizedFault("No roles found for scope token")
         return auth_data
 
+    @staticmethod
+    def _cache_token_data(cache, cache_key, dtoken, duser, data, generation,
+                          tags=None):
+        """Caches data rendered for a token until it expires at the latest
+
+        The entry is tagged so that changes to the token, its user or the
+        tenants involved evict it (see _invalidate_token_caches).
+        """
+        if not cache.enabled:
+            return
+        remaining = dtoken.expires - datetime.now()
+        ttl = remaining.days * 86400 + remaining.seconds
+        if cache.ttl is not None:
+            ttl = min(ttl, cache.ttl)
+        tags = list(tags or [])
+        tags.extend(['token:%s' % dtoken.id, 'user:%s' % duser.id])
+        for tenant_id in set([dtoken.tenant_id, duser.tenant_id]):
+            if tenant_id:
+                tags.append('tenant:%s' % tenant_id)
+        cache.set(cache_key, data, ttl=ttl, tags=tags, generation=generation)
+
+    @staticmethod
+    def _invalidate_token_caches(token_id=None, user_id=None, tenant_id=None,
+                                 catalog=False):
+        """Evicts cached token data for a token, user, tenant or catalog
+
+        With no arguments, the caches are flushed; this is used for
+        changes (like deleting roles) that can affect any token.
+        """
+        if token_id is None and user_id is None and tenant_id is None and \
+                not catalog:
+            VALIDATE_CACHE.clear()
+            AUTH_CACHE.clear()
+            return
+        tags = []
+        if token_id is not None:
+            tags.append('token:%s' % token_id)
+        if user_id is not None:
+            tags.append('user:%s' % user_id)
+        if tenant_id is not None:
+            tags.append('tenant:%s' % tenant_id)
+        if tags:
+            VALIDATE_CACHE.invalidate(*tags)
+        if catalog:
+            tags.append('catalog')
+        AUTH_CACHE.invalidate(*tags)
+
+    @admin_token_validator
+    def get_cache_stats(self, admin_token):
+        """Returns the hit/miss counters of the in-process caches"""
+        return {'validate': VALIDATE_CACHE.stats(),
+                'auth': AUTH_CACHE.stats(),
+                'catalog': CATALOG.stats(),
+                'password': UserManager.password_cache.stats()}
+
+    @admin_token_validator
+    def get_backend_stats(self, admin_token):
+        """Returns the counters of the backends, e.g. of their connection
+        pools"""
+        return backends.get_backend_stats()
+
+    @service_admin_token_validator
+    def get_signing_certificates(self, admin_token):
+        """Returns the certificates of the keys that may have signed the
+        tokens in use, which services use to verify signed tokens without
+        calling Keystone"""
+        if TokenManager.signing_keys is None:
+            raise fault.ItemNotFoundFault("Tokens are not signed")
+        return auth.SigningCertificates(
+            TokenManager.signing_keys.published())
+
+    @admin_token_validator
+    def get_server_stats(self, admin_token):
+        """Returns the use of the green thread pools and of the accept
+        queues of the API servers of this process"""
+        return wsgi.get_server_stats()
+
+    @staticmethod
+    def _invalidate_catalog(tenant_id=None):
+        """Drops the compiled catalog of a tenant (or all of them) and
+        the auth responses that include it"""
+        CATALOG.invalidate(tenant_id)
+        IdentityService._invalidate_token_caches(catalog=True)
+
     @admin_token_validator
     def revoke_token(self, admin_token, token_id):
         dtoken = self.token_manager.get(token_id)
         if not dtoken:
             raise fault.ItemNotFoundFault("Token not found")
 
-        self.token_manager.delete(token_id)
+        self.token_manager.delete(dtoken.id)
+        self._invalidate_token_caches(token_id=dtoken.id)
+        self._add_revocation_event('token', dtoken.id)
+
+    def _add_revocation_event(self, type, target_id):
+        """Records that the cached copies of a token, or of the tokens of
+        a user or tenant, must be evicted (see get_revocation_events)"""
+        try:
+            self.token_manager.add_revocation_event(type, target_id)
+        except NotImplementedError:
+            LOG.debug("The token backend does not record revocation events")
+
+    @service_admin_token_validator
+    def get_revocation_events(self, admin_token, since=0, limit=1000):
+        """Returns the revocation events recorded after cursor since,
+        which services read to evict the tokens they cached"""
+        try:
+            since = int(since or 0)
+            limit = int(limit)
+        except ValueError:
+            raise fault.BadRequestFault("Expecting integer since and limit")
+        if since < 0 or limit < 1:
+            raise fault.BadRequestFault("Expecting positive since and limit")
+        events, cursor, truncated = self.token_manager.get_revocation_events(
+            since, min(limit, MAX_REVOCATION_EVENTS))
+        return auth.RevocationEvents(events, cursor, truncated)
 
     @staticmethod
     def parse_service_ids(service_ids):
@@ -389,10 +642,31 @@ class IdentityService(object):
         we check the existence of a Token using another Token
         to authenticate. This value decides the faults that are to be thrown.
         """
+        view = self._validate_token_view(token_id, belongs_to, is_check_token)
+        return (view['token'], view['user'])
+
+    def _validate_token_view(self, token_id, belongs_to=None,
+                             is_check_token=None):
+        """
+        Same as _validate_token(), but returns the whole validation view
+        (token, user, tenants and role grants) loaded by the token backend
+        in one call, so that callers don't have to go back to the backends.
+        """
+        view = None
+        if token_id:
+            view = self.token_manager.get_validation_view(token_id)
+        return self._check_token_view(token_id, view, belongs_to,
+                                      is_check_token)
+
+    def _check_token_view(self, token_id, view, belongs_to=None,
+                          is_check_token=None):
+        """Raises the fault for a token validation view that does not
+        validate (see _validate_token), or returns the view"""
         if not token_id:
             raise fault.UnauthorizedFault("Missing token")
 
-        (token, user) = self.get_token_info(token_id)
+        token = view['token'] if view else None
+        user = view['user'] if view else None
 
         if not token:
             if is_check_token:
@@ -412,15 +686,15 @@ class IdentityService(object):
                 % user.id)
 
         if user.tenant_id:
-            self.validate_tenant_by_id(user.tenant_id)
+            self.validate_tenant(view['user_tenant'])
 
         if token.tenant_id:
-            self.validate_tenant_by_id(token.tenant_id)
+            self.validate_tenant(view['token_tenant'])
 
         if belongs_to and unicode(token.tenant_id) != unicode(belongs_to):
             raise fault.UnauthorizedFault("Unauthorized on this tenant")
 
-        return (token, user)
+        return view
 
     def has_admin_role(self, token_id):
         """ Checks if the token belongs to a user who has Keystone admin
@@ -576,15 +850,17 @@ class IdentityService(object):
 
         AuthData is used for rendering authentication responses
         """
+        auth_data = AUTH_CACHE.get(dtoken.id)
+        if auth_data is not None:
+            return auth_data
+        generation = AUTH_CACHE.generation
+
         tenant = None
-        endpoints = None
 
         if dtoken.tenant_id:
             dtenant = self.tenant_manager.get(dtoken.tenant_id)
             tenant = auth.Tenant(id=dtenant.id, name=dtenant.name)
-            endpoints = self.tenant_manager.get_all_endpoints(dtoken.tenant_id)
-        else:
-            endpoints = self.tenant_manager.get_all_endpoints(None)
+        catalog = CATALOG.get(dtoken.tenant_id or None)
 
         token = auth.Token(dtoken.expires, dtoken.id, tenant)
         duser = self.user_manager.get(dtoken.user_id)
@@ -608,7 +884,11 @@ class IdentityService(object):
             url_types = ['admin', 'internal', 'public']
         else:
             url_types = ['internal', 'public']
-        return auth.AuthData(token, user, endpoints, url_types=url_types)
+        auth_data = auth.AuthData(token, user, url_types=url_types,
+                                  catalog=catalog)
+        self._cache_token_data(AUTH_CACHE, dtoken.id, dtoken, duser,
+                               auth_data, generation, tags=['catalog'])
+        return auth_data
 
     def get_validate_data(self, dtoken, duser, service_ids=None):
         """return ValidateData object for a token/user pair"""
@@ -639,6 +919,46 @@ class IdentityService(object):
             tenant_name, Roles(ts, []))
         return auth.ValidateData(token, user)
 
+    def get_validate_data_from_view(self, view, service_ids=None):
+        """return ValidateData object for a token validation view
+
+        Renders the same data as get_validate_data(), but takes the tenants
+        and role grants from the view instead of the backends.
+        """
+        global GLOBAL_SERVICE_ID
+        dtoken = view['token']
+        duser = view['user']
+
+        tenant = None
+        if dtoken.tenant_id:
+            dtenant = view['token_tenant']
+            tenant = auth.Tenant(id=dtenant.id, name=dtenant.name)
+
+        token = auth.Token(dtoken.expires, dtoken.id, tenant)
+
+        ts = []
+        if dtoken.tenant_id:
+            ts = [Role(drole.id, drole.name, None, drole.tenant_id)
+                  for drole in view['tenant_roles']]
+        if service_ids:
+            # if service IDs are specified, filter roles by service IDs
+            sroles_names = self.get_roles_names_by_service_ids(service_ids)
+            ts = [role for role in ts if role.name in sroles_names]
+        if (not dtoken.tenant_id or not service_ids or
+                (GLOBAL_SERVICE_ID in service_ids)):
+            # return the global roles for unscoped tokens or
+            # its ID is in the service IDs
+            ts = ts + [Role(drole.id, drole.name, None, drole.tenant_id)
+                       for drole in view['global_roles']]
+
+        tenant_name = None
+        if duser.tenant_id:
+            tenant_name = view['user_tenant'].name
+
+        user = auth.User(duser.id, duser.name, duser.tenant_id,
+            tenant_name, Roles(ts, []))
+        return auth.ValidateData(token, user)
+
     @staticmethod
     def validate_tenant(dtenant):
         if not dtenant:
@@ -699,9 +1019,8 @@ class IdentityService(object):
             #Check Admin Token
             (_token, user) = self.validate_admin_token(admin_token)
             # Return all tenants
-            dtenants = self.tenant_manager.get_page(marker, limit)
-            prev_page, next_page = self.tenant_manager.get_page_markers(marker,
-                                                                        limit)
+            dtenants, prev_page, next_page = self.tenant_manager.\
+                get_page_with_markers(marker, limit)
 
         for dtenant in dtenants:
             t = Tenant(id=dtenant.id, name=dtenant.name,
@@ -743,6 +1062,9 @@ class IdentityService(object):
         values = {'id': tenant_id, 'desc': tenant.description,
                   'enabled': tenant.enabled, 'name': tenant.name}
         self.tenant_manager.update(values)
+        self._invalidate_token_caches(tenant_id=tenant_id)
+        if not tenant.enabled:
+            self._add_revocation_event('tenant', tenant_id)
         dtenant = self.tenant_manager.get(tenant_id)
         return dtenant
 
@@ -753,6 +1075,8 @@ class IdentityService(object):
             raise fault.ItemNotFoundFault("The tenant could not be found")
 
         self.tenant_manager.delete(dtenant.id)
+        self._invalidate_token_caches(tenant_id=dtenant.id)
+        self._add_revocation_event('tenant', tenant_id)
         return None
 
     #
@@ -831,14 +1155,13 @@ class IdentityService(object):
     @admin_token_validator
     def get_users(self, admin_token, marker, limit, url):
         ts = []
-        dusers = self.user_manager.users_get_page(marker, limit)
+        dusers, prev, next = self.user_manager.users_get_page_with_markers(
+            marker, limit)
         for duser in dusers:
             ts.append(User(None, duser.id, duser.name, duser.tenant_id,
                                    duser.email, duser.enabled))
         links = []
         if ts.__len__():
-            prev, next = self.user_manager.users_get_page_markers(marker,
-                                                                  limit)
             links = self.get_links(url, prev, next, limit)
         return Users(ts, links)
 
@@ -881,6 +1204,7 @@ class IdentityService(object):
 
         values = {'id': user_id, 'email': user.email, 'name': user.name}
         self.user_manager.update(values)
+        self._invalidate_token_caches(user_id=user_id)
         duser = self.user_manager.get(user_id)
         return User(duser.password, duser.id, duser.name, duser.tenant_id,
             duser.email, duser.enabled)
@@ -915,6 +1239,9 @@ class IdentityService(object):
         values = {'id': user_id, 'enabled': user.enabled}
 
         self.user_manager.update(values)
+        self._invalidate_token_caches(user_id=user_id)
+        if not user.enabled:
+            self._add_revocation_event('user', user_id)
 
         duser = self.user_manager.get(user_id)
 
@@ -931,6 +1258,7 @@ class IdentityService(object):
         self.validate_and_fetch_user_tenant(user.tenant_id)
         values = {'id': user_id, 'tenant_id': user.tenant_id}
         self.user_manager.update(values)
+        self._invalidate_token_caches(user_id=user_id)
         return User_Update(tenant_id=user.tenant_id)
 
     @admin_token_validator
@@ -940,6 +1268,8 @@ class IdentityService(object):
             raise fault.ItemNotFoundFault("The user could not be found")
 
         self.user_manager.delete(user_id)
+        self._invalidate_token_caches(user_id=user_id)
+        self._add_revocation_event('user', user_id)
         return None
 
     def create_role(self, admin_token, role):
@@ -992,8 +1322,8 @@ class IdentityService(object):
 
     @service_admin_token_validator
     def get_roles(self, admin_token, marker, limit, url):
-        droles = self.role_manager.get_page(marker, limit)
-        prev, next = self.role_manager.get_page_markers(marker, limit)
+        droles, prev, next = self.role_manager.get_page_with_markers(marker,
+                                                                     limit)
         links = self.get_links(url, prev, next, limit)
         ts = self.transform_roles(droles)
         return Roles(ts, links)
@@ -1051,6 +1381,7 @@ class IdentityService(object):
             for rolegrant in rolegrants:
                 self.grant_manager.rolegrant_delete(rolegrant.id)
         self.role_manager.delete(role_id)
+        self._invalidate_token_caches()
 
     @service_admin_token_validator
     def add_role_to_user(self, admin_token, user_id, role_id, tenant_id=None):
@@ -1078,6 +1409,7 @@ class IdentityService(object):
         if tenant_id is not None:
             drolegrant.tenant_id = dtenant.id
         self.user_manager.user_role_add(drolegrant)
+        self._invalidate_token_caches(user_id=duser.id)
 
     @service_admin_token_validator
     def remove_role_from_user(self, admin_token, user_id, role_id,
@@ -1088,6 +1420,9 @@ class IdentityService(object):
             raise fault.ItemNotFoundFault(
                 "This role is not mapped to the user.")
         self.grant_manager.rolegrant_delete(drolegrant.id)
+        self._invalidate_token_caches(user_id=user_id)
+        # the roles of the tokens services cached have changed
+        self._add_revocation_event('user', user_id)
 
     # pylint: disable=R0913, R0914
     @service_admin_token_validator
@@ -1152,6 +1487,7 @@ class IdentityService(object):
         dendpoint_template.version_info = endpoint_template.version_info
         dendpoint_template = self.endpoint_template_manager.create(
                 dendpoint_template)
+        self._invalidate_catalog()
         endpoint_template.id = dendpoint_template.id
         return endpoint_template
 
@@ -1197,6 +1533,7 @@ class IdentityService(object):
         dendpoint_template.version_info = endpoint_template.version_info
         dendpoint_template = self.endpoint_template_manager.update(
                 dendpoint_template)
+        self._invalidate_catalog()
         return EndpointTemplate(
             dendpoint_template.id,
             dendpoint_template.region,
@@ -1242,14 +1579,13 @@ class IdentityService(object):
             for endpoint in endpoints:
                 self.endpoint_manager.delete(endpoint.id)
         self.endpoint_template_manager.delete(endpoint_template_id)
+        self._invalidate_catalog()
 
     @service_admin_token_validator
     def get_endpoint_templates(self, admin_token, marker, limit, url):
-        dendpoint_templates = self.endpoint_template_manager.get_page(marker,
-                                                                      limit)
+        dendpoint_templates, prev, next = self.endpoint_template_manager.\
+            get_page_with_markers(marker, limit)
         ts = self.transform_endpoint_templates(dendpoint_templates)
-        prev, next = self.endpoint_template_manager.get_page_markers(marker,
-                                                                     limit)
         links = self.get_links(url, prev, next, limit)
         return EndpointTemplates(ts, links)
 
@@ -1369,6 +1705,7 @@ class IdentityService(object):
         dendpoint.tenant_id = tenant_id
         dendpoint.endpoint_template_id = endpoint_template.id
         dendpoint = self.endpoint_manager.create(dendpoint)
+        self._invalidate_catalog(tenant_id)
         dservice = self.service_manager.get(dendpoint_template.service_id)
         dendpoint = Endpoint(
                             dendpoint.id,
@@ -1387,9 +1724,11 @@ class IdentityService(object):
 
     @service_admin_token_validator
     def delete_endpoint(self, admin_token, endpoint_id):
-        if self.endpoint_manager.get(endpoint_id) is None:
+        dendpoint = self.endpoint_manager.get(endpoint_id)
+        if dendpoint is None:
             raise fault.ItemNotFoundFault("The Endpoint is not found.")
         self.endpoint_manager.delete(endpoint_id)
+        self._invalidate_catalog(dendpoint.tenant_id)
         return None
 
     #Service Operations
@@ -1417,11 +1756,11 @@ class IdentityService(object):
     @service_admin_token_validator
     def get_services(self, admin_token, marker, limit, url):
         ts = []
-        dservices = self.service_manager.get_page(marker, limit)
+        dservices, prev, next = self.service_manager.get_page_with_markers(
+            marker, limit)
         for dservice in dservices:
             ts.append(Service(dservice.id, dservice.name, dservice.type,
                 dservice.desc))
-        prev, next = self.service_manager.get_page_markers(marker, limit)
         links = self.get_links(url, prev, next, limit)
         return Services(ts, links)
 
@@ -1469,6 +1808,8 @@ class IdentityService(object):
                         self.grant_manager.rolegrant_delete(rolegrant.id)
                 self.role_manager.delete(role.id)
         self.service_manager.delete(service_id)
+        self._invalidate_token_caches()
+        CATALOG.invalidate()
 
     @admin_token_validator
     def get_credentials(self, admin_token, user_id, marker, limit, url):
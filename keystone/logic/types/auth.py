@@ -15,6 +15,8 @@
 
 # pylint: disable=C0103,R0912,R0913,R0914
 
+from datetime import datetime
+import functools
 import json
 from lxml import etree
 from keystone.logic.types import fault
@@ -22,6 +24,23 @@ import keystone.backends.api as db_api
 from keystone import utils
 
 
+def rendered_once(fnc):
+    """Decorator that keeps the body rendered by a to_json/to_xml method
+
+    The objects are immutable once built, so a result that is cached and
+    returned again (see logic/service.py) is serialized only once per
+    content type.
+    """
+    @functools.wraps(fnc)
+    def _wrapper(self):
+        rendered = self.__dict__.setdefault('_rendered', {})
+        body = rendered.get(fnc.__name__)
+        if body is None:
+            body = rendered[fnc.__name__] = fnc(self)
+        return body
+    return _wrapper
+
+
 class AuthBase(object):
     def __init__(self, tenant_id=None, tenant_name=None):
         self.tenant_id = tenant_id
@@ -451,12 +470,17 @@ class AuthData(object):
         without elevated privileges, the "adminURL" is not returned. The
         url_types paramater in the initializer lists the types to return.
         The actual authorization is done in logic/service.py
+
+        The catalog is either given as a list of endpoint templates
+        (base_urls) or as a precompiled logic.catalog.ServiceCatalog.
     """
 
-    def __init__(self, token, user, base_urls=None, url_types=None):
+    def __init__(self, token, user, base_urls=None, url_types=None,
+                 catalog=None):
         self.token = token
         self.user = user
         self.base_urls = base_urls
+        self.catalog = catalog
         if url_types is None:
             self.url_types = ["internal", "public", "admin"]
         else:
@@ -465,6 +489,7 @@ class AuthData(object):
         if self.base_urls is not None:
             self.__convert_baseurls_to_dict()
 
+    @rendered_once
     def to_xml(self):
         dom = etree.Element("access",
             xmlns="http://docs.openstack.org/identity/api/v2.0")
@@ -486,7 +511,19 @@ class AuthData(object):
         if self.user.rolegrants is not None:
             user.append(self.user.rolegrants.to_dom())
 
-        if self.base_urls is not None and len(self.base_urls) > 0:
+        if self.catalog is not None and self.catalog.services:
+            service_catalog = etree.Element("serviceCatalog")
+            for dservice, endpoints in self.catalog.select(self.url_types):
+                service = etree.Element("service",
+                                 name=dservice.name, type=dservice.type)
+                for attributes in endpoints:
+                    endpoint = etree.Element("endpoint")
+                    for name, value in attributes:
+                        endpoint.set(name, value)
+                    service.append(endpoint)
+                service_catalog.append(service)
+            dom.append(service_catalog)
+        elif self.base_urls is not None and len(self.base_urls) > 0:
             service_catalog = etree.Element("serviceCatalog")
             for key, key_base_urls in self.d.items():
                 dservice = db_api.SERVICE.get(key)
@@ -534,6 +571,7 @@ class AuthData(object):
                 self.d[base_url.service_id] = list()
             self.d[base_url.service_id].append(base_url)
 
+    @rendered_once
     def to_json(self):
         token = {}
         token["id"] = self.token.id
@@ -553,7 +591,13 @@ class AuthData(object):
         if self.user.rolegrants is not None:
             auth['user']["roles"] = self.user.rolegrants.to_json_values()
 
-        if self.base_urls is not None and len(self.base_urls) > 0:
+        if self.catalog is not None and self.catalog.services:
+            auth["serviceCatalog"] = [
+                {"name": dservice.name,
+                 "type": dservice.type,
+                 "endpoints": [dict(attributes) for attributes in endpoints]}
+                for dservice, endpoints in self.catalog.select(self.url_types)]
+        elif self.base_urls is not None and len(self.base_urls) > 0:
             service_catalog = []
             for key, key_base_urls in self.d.items():
                 service = {}
@@ -586,11 +630,11 @@ class AuthData(object):
                                 endpoint['versionId'] = \
                                         str(base_url.version_id)
                         endpoints.append(endpoint)
-                        dservice = db_api.SERVICE.get(key)
-                        if not dservice:
-                            raise fault.ItemNotFoundFault(
-                            "The service could not be found for" + str(key))
                 if len(endpoints):
+                    dservice = db_api.SERVICE.get(key)
+                    if not dservice:
+                        raise fault.ItemNotFoundFault(
+                            "The service could not be found for" + str(key))
                     service["name"] = dservice.name
                     service["type"] = dservice.type
                     service["endpoints"] = endpoints
@@ -611,6 +655,7 @@ class ValidateData(object):
         self.token = token
         self.user = user
 
+    @rendered_once
     def to_xml(self):
         dom = etree.Element("access",
             xmlns="http://docs.openstack.org/identity/api/v2.0")
@@ -641,6 +686,7 @@ class ValidateData(object):
         dom.append(user)
         return etree.tostring(dom)
 
+    @rendered_once
     def to_json(self):
         token = {
             "id": unicode(self.token.id),
@@ -671,3 +717,140 @@ class ValidateData(object):
             "access": {
                 "token": token,
                 "user": user}})
+
+
+class TokenIds(object):
+    """A list of token ids to validate in one request."""
+
+    def __init__(self, token_ids):
+        self.token_ids = token_ids
+
+    @staticmethod
+    def from_xml(xml_str):
+        try:
+            dom = etree.Element("root")
+            dom.append(etree.fromstring(xml_str))
+            root = dom.find("{http://docs.openstack.org/identity/api/v2.0}"
+                "tokens")
+            if root is None:
+                raise fault.BadRequestFault("Expecting tokens")
+            token_ids = []
+            for token in root.findall(
+                    "{http://docs.openstack.org/identity/api/v2.0}token"):
+                token_id = token.get("id")
+                utils.check_empty_string(token_id, "Expecting a token id.")
+                token_ids.append(token_id)
+            return TokenIds(token_ids)
+        except etree.LxmlError as e:
+            raise fault.BadRequestFault("Cannot parse tokens", str(e))
+
+    @staticmethod
+    def from_json(json_str):
+        try:
+            obj = json.loads(json_str)
+            if not "tokens" in obj:
+                raise fault.BadRequestFault("Expecting tokens")
+            token_ids = []
+            for token in obj["tokens"]:
+                if not "id" in token:
+                    raise fault.BadRequestFault("Expecting a token id.")
+                utils.check_empty_string(token["id"],
+                                         "Expecting a token id.")
+                token_ids.append(token["id"])
+            return TokenIds(token_ids)
+        except (ValueError, TypeError) as e:
+            raise fault.BadRequestFault("Cannot parse tokens", str(e))
+
+
+class ValidateDataList(object):
+    """Results of validating several tokens at once.
+
+    Each result is the ValidateData of a token, or the fault its validation
+    raised, rendered with the token id in the order of the request.
+    """
+
+    def __init__(self, results):
+        self.results = results
+
+    def to_xml(self):
+        dom = etree.Element("tokens",
+            xmlns="http://docs.openstack.org/identity/api/v2.0")
+        for token_id, result in self.results:
+            token = etree.Element("token", id=unicode(token_id))
+            token.append(etree.fromstring(result.to_xml()))
+            dom.append(token)
+        return etree.tostring(dom)
+
+    def to_json(self):
+        tokens = []
+        for token_id, result in self.results:
+            token = json.loads(result.to_json())
+            token["id"] = token_id
+            tokens.append(token)
+        return json.dumps({"tokens": tokens})
+
+
+class SigningCertificates(object):
+    """The certificates of the keys that may have signed the tokens in use.
+
+    Services verify signed tokens with them (see keystone.common.signing);
+    the private keys are never published. Each certificate is a tuple of
+    the id of its key, the PEM certificate and the time (in seconds since
+    the epoch) it expires at.
+    """
+
+    def __init__(self, certificates):
+        self.certificates = certificates
+
+    def to_xml(self):
+        dom = etree.Element("signingCertificates",
+            xmlns="http://docs.openstack.org/identity/api/v2.0")
+        for key_id, pem, expires in self.certificates:
+            certificate = etree.Element("signingCertificate",
+                id=unicode(key_id),
+                expires=datetime.utcfromtimestamp(expires).isoformat() + "Z")
+            certificate.text = pem
+            dom.append(certificate)
+        return etree.tostring(dom)
+
+    def to_json(self):
+        return json.dumps({"signingCertificates": [
+            {"id": key_id,
+             "certificate": pem,
+             "expires": datetime.utcfromtimestamp(expires).isoformat() + "Z"}
+            for key_id, pem, expires in self.certificates]})
+
+
+class RevocationEvents(object):
+    """The revocation events recorded after a cursor.
+
+    Services evict the tokens they cached according to them, and read the
+    next events after cursor. If truncated, some events were deleted before
+    they could be read, and services must evict all the tokens they cached.
+    """
+
+    def __init__(self, events, cursor, truncated):
+        self.events = events
+        self.cursor = cursor
+        self.truncated = truncated
+
+    def to_xml(self):
+        dom = etree.Element("revocationEvents",
+            xmlns="http://docs.openstack.org/identity/api/v2.0",
+            cursor=unicode(self.cursor),
+            truncated=unicode(self.truncated).lower())
+        for event in self.events:
+            dom.append(etree.Element("revocationEvent", id=unicode(event.id),
+                type=event.type, targetId=unicode(event.target_id),
+                created=event.created.isoformat()))
+        return etree.tostring(dom)
+
+    def to_json(self):
+        return json.dumps({"revocationEvents": {
+            "cursor": self.cursor,
+            "truncated": self.truncated,
+            "events": [{"id": event.id,
+                        "type": event.type,
+                        "targetId": event.target_id,
+                        "created": event.created.isoformat()}
+                       for event in self.events]}})
@@ -0,0 +1,52 @@
+# Copyright (c) 2010-2011 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from lxml import etree
+
+
+class Stats(object):
+    """The counters of a process, as nested mappings of names to values"""
+
+    def __init__(self, values):
+        self.values = values
+
+    @staticmethod
+    def _to_dom(name, value):
+        if isinstance(value, dict):
+            dom = etree.Element("group", name=unicode(name))
+            for key in sorted(value):
+                dom.append(Stats._to_dom(key, value[key]))
+        else:
+            dom = etree.Element("stat", name=unicode(name))
+            if value is not None:
+                dom.text = unicode(value)
+        return dom
+
+    def to_dom(self):
+        dom = Stats._to_dom("stats", self.values)
+        dom.tag = "stats"
+        dom.attrib.pop("name")
+        dom.set(u"xmlns", "http://docs.openstack.org/identity/api/v2.0")
+        return dom
+
+    def to_xml(self):
+        return etree.tostring(self.to_dom())
+
+    def to_dict(self):
+        return {"stats": self.values}
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
@@ -0,0 +1,40 @@
+from keystone import config
+from keystone.logic.reaper import TokenReaper
+from keystone.manage2 import base
+from keystone.manage2 import common
+from keystone.manage2 import mixins
+
+
+@common.arg('--before',
+    required=False,
+    help='delete the tokens that expired before this POSIX date/time '
+        '(e.g. 1999-01-31T23:59) instead of now')
+@common.arg('--batch-size',
+    type=int,
+    required=False,
+    default=1000,
+    help='number of tokens deleted at a time')
+class Command(base.BaseBackendCommand, mixins.DateTimeMixin):
+    """Deletes expired tokens.
+
+    Tokens are deleted in batches, so the tokens table is never locked for
+    long and the command can run while keystone is serving requests. The
+    revocation events older than revocation_event_ttl are deleted too.
+    """
+
+    # pylint: disable=E1101
+    def delete_expired_tokens(self, before=None, batch_size=1000):
+        reaper = TokenReaper(self.token_manager, batch_size=batch_size,
+                             event_ttl=config.CONF.revocation_event_ttl)
+        deleted = reaper.reap(before)
+        reaper.reap_revocation_events()
+        return deleted
+
+    def run(self, args):
+        """Process argparse args, and print results to stdout"""
+        before = None
+        if args.before is not None:
+            before = self.str_to_datetime(args.before)
+
+        print self.delete_expired_tokens(before=before,
+                                         batch_size=args.batch_size)
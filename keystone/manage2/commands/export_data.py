@@ -0,0 +1,40 @@
+import sys
+
+from keystone.backends.sqlalchemy import bulk
+from keystone.manage2 import base
+from keystone.manage2 import common
+
+
+@common.arg('path',
+    help='file to write the records to, one per line (- for stdout)')
+@common.arg('--format',
+    required=False,
+    choices=['json', 'csv'],
+    help='format of the file (by default, csv for .csv files, json '
+        'otherwise)')
+@common.arg('--batch-size',
+    type=int,
+    required=False,
+    default=1000,
+    help='number of rows read at a time')
+class Command(base.BaseBackendCommand):
+    """Exports users, tenants, roles, grants, credentials, services and
+    endpoint templates of the SQL backend, for import_data.
+
+    Tables are read a page at a time, so exports of large databases are
+    streamed. Users are exported with their password hash.
+    """
+
+    @staticmethod
+    def export_data(out, format='json', batch_size=1000):
+        bulk.write_records(bulk.export_records(batch_size=batch_size), out,
+                           format)
+
+    def run(self, args):
+        """Process argparse args, and print results to stdout"""
+        format = args.format or bulk.guess_format(args.path)
+        if args.path == '-':
+            self.export_data(sys.stdout, format, args.batch_size)
+        else:
+            with open(args.path, 'wb') as out:
+                self.export_data(out, format, args.batch_size)
@@ -0,0 +1,52 @@
+import sys
+
+from keystone.backends.sqlalchemy import bulk
+from keystone.manage2 import base
+from keystone.manage2 import common
+
+
+@common.arg('path',
+    help='file of records to import, one per line (- for stdin)')
+@common.arg('--format',
+    required=False,
+    choices=['json', 'csv'],
+    help='format of the file (by default, csv for .csv files, json '
+        'otherwise)')
+@common.arg('--batch-size',
+    type=int,
+    required=False,
+    default=1000,
+    help='number of records inserted at a time')
+@common.arg('--workers',
+    type=int,
+    required=False,
+    help='number of processes hashing passwords (by default, the number '
+        'of CPUs; 0 to hash them in this process)')
+class Command(base.BaseBackendCommand):
+    """Imports users, tenants, roles, grants, credentials, services and
+    endpoint templates in bulk into the SQL backend.
+
+    Records refer to each other by name, and are inserted in batches, each
+    in its own transaction. See keystone.backends.sqlalchemy.bulk for the
+    file formats; export_data writes files in these formats.
+    """
+
+    @staticmethod
+    def import_data(lines, format='json', batch_size=1000, workers=None):
+        importer = bulk.Importer(batch_size=batch_size, workers=workers)
+        return importer.import_records(bulk.read_records(lines, format))
+
+    def run(self, args):
+        """Process argparse args, and print results to stdout"""
+        format = args.format or bulk.guess_format(args.path)
+        if args.path == '-':
+            counts = self.import_data(sys.stdin, format, args.batch_size,
+                                      args.workers)
+        else:
+            with open(args.path, 'rb') as lines:
+                counts = self.import_data(lines, format, args.batch_size,
+                                          args.workers)
+
+        for obj in bulk.OBJECTS:
+            if counts[obj]:
+                print "%s: %s" % (obj, counts[obj])
@@ -47,6 +47,11 @@ class Manager(object):
         """ Calculate pagination markers for endpoint template list """
         return self.driver.get_page_markers(marker, limit)
 
+    def get_page_with_markers(self, marker, limit):
+        """ Get one page of endpoint template list and its markers as
+        (page, prev, next) """
+        return self.driver.get_page_with_markers(marker, limit)
+
     def get_by_service(self, service_id):
         """ Returns Endpoint Templates by service """
         return self.driver.get_by_service(service_id)
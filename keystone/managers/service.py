@@ -51,6 +51,11 @@ class Manager(object):
         """ Calculate pagination markers for services list """
         return self.driver.get_page_markers(marker, limit)
 
+    def get_page_with_markers(self, marker, limit):
+        """ Get one page of services list and its markers as
+        (page, prev, next) """
+        return self.driver.get_page_with_markers(marker, limit)
+
     def get_by_name_and_type(self, name, service_type):
         """ Returns service by name and type """
         return self.driver.get_by_name_and_type(name, service_type)
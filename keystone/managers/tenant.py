@@ -57,6 +57,11 @@ class Manager(object):
         """ Calculate pagination markers for tenant list """
         return self.driver.get_page_markers(marker, limit)
 
+    def get_page_with_markers(self, marker, limit):
+        """ Get one page of tenants and its markers as
+        (page, prev, next) """
+        return self.driver.get_page_with_markers(marker, limit)
+
     def list_for_user_get_page(self, user_id, marker, limit):
         return self.driver.list_for_user_get_page(user_id, marker, limit)
 
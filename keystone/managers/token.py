@@ -19,23 +19,49 @@
 import logging
 
 import keystone.backends.api as api
+from keystone.common import signing
 
 LOG = logging.getLogger(__name__)
 
 
 class Manager(object):
+    # Verifies signed tokens (see keystone.common.signing), if configured
+    signing_keys = None
+
     def __init__(self):
         self.driver = api.TOKEN
 
+    def stored_id(self, token_id):
+        """ Returns the ID a token is stored under
+
+        Signed tokens carry the ID of the stored token; those that do not
+        verify have none.
+
+        :param token_id: token id as a string
+        :returns: the stored token id, or None
+        """
+        if not signing.is_signed(token_id):
+            return token_id
+        if self.signing_keys is None:
+            return None
+        try:
+            return self.signing_keys.verify(token_id).get('id')
+        except signing.InvalidToken:
+            LOG.debug("Signed token does not verify")
+            return None
+
     def create(self, token):
         return self.driver.create(token)
 
     # pylint: disable=E1103
     def update(self, id, token):
-        return self.driver.update(id, token)
+        return self.driver.update(self.stored_id(id), token)
 
     def get(self, token_id):
         """ Returns token by ID """
+        token_id = self.stored_id(token_id)
+        if token_id is None:
+            return None
         return self.driver.get(token_id)
 
     def get_all(self):
@@ -57,5 +83,67 @@ class Manager(object):
         else:
             return self.driver.get_for_user(user_id)
 
+    def get_validation_view(self, token_id):
+        """ Returns the token with its user, tenants and role grants
+
+        :param token_id: token id as a string
+        :returns: dict (see BaseTokenAPI.get_validation_view) or None
+        """
+        token_id = self.stored_id(token_id)
+        if token_id is None:
+            return None
+        return self.driver.get_validation_view(token_id)
+
+    def get_validation_views(self, token_ids):
+        """ Returns the validation views of several tokens at once
+
+        :param token_ids: list of token ids
+        :returns: dict of token id to view; unknown tokens are left out
+        """
+        stored_ids = dict((token_id, self.stored_id(token_id))
+                          for token_id in token_ids)
+        views = self.driver.get_validation_views(
+            [stored_id for stored_id in set(stored_ids.values())
+             if stored_id is not None])
+        return dict((token_id, views[stored_id])
+                    for token_id, stored_id in stored_ids.items()
+                    if stored_id in views)
+
     def delete(self, token_id):
-        self.driver.delete(token_id)
+        self.driver.delete(self.stored_id(token_id))
+
+    def delete_expired(self, before, limit):
+        """ Deletes up to limit tokens that expired before a given time
+
+        :param before: datetime
+        :param limit: int
+        :returns: the number of tokens deleted
+        """
+        return self.driver.delete_expired(before, limit)
+
+    def add_revocation_event(self, type, target_id):
+        """ Records that a token was revoked, or a user or tenant disabled
+
+        :param type: 'token', 'user' or 'tenant'
+        :param target_id: the ID of the token, user or tenant
+        :returns: models.RevocationEvent
+        """
+        return self.driver.add_revocation_event(type, target_id)
+
+    def get_revocation_events(self, after, limit):
+        """ Returns the revocation events recorded after a cursor
+
+        :param after: int - cursor of the last events read, or 0
+        :param limit: int
+        :returns: (events, cursor, truncated) (see
+            BaseTokenAPI.get_revocation_events)
+        """
+        return self.driver.get_revocation_events(after, limit)
+
+    def delete_revocation_events(self, before):
+        """ Deletes the revocation events recorded before a given time
+
+        :param before: datetime
+        :returns: the number of events deleted
+        """
+        return self.driver.delete_revocation_events(before)
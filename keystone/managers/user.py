@@ -16,14 +16,32 @@
 
 """ User manager module """
 
+import hashlib
+import hmac
 import logging
+import os
 
 import keystone.backends.api as api
+from keystone.common.cache import LRUCache
 
 LOG = logging.getLogger(__name__)
 
+# Key of the HMACs identifying passwords in the password cache; it never
+# leaves this process
+_PASSWORD_KEY = os.urandom(32)
+
+
+def _password_digest(password):
+    if isinstance(password, unicode):
+        password = password.encode('utf-8')
+    return hmac.new(_PASSWORD_KEY, password, hashlib.sha256).digest()
+
 
 class Manager(object):
+    # Successful password verifications, keyed by user ID and an HMAC of
+    # the password, and tagged with the user; IdentityService sizes it
+    password_cache = LRUCache(max_entries=0)
+
     def __init__(self):
         self.driver = api.USER
 
@@ -55,6 +73,11 @@ class Manager(object):
         """ Calculate pagination markers for users list """
         return self.driver.users_get_page_markers(marker, limit)
 
+    def users_get_page_with_markers(self, marker, limit):
+        """ Get one page of users list and its markers as
+        (page, prev, next) """
+        return self.driver.users_get_page_with_markers(marker, limit)
+
     def get_by_tenant(self, user_id, tenant_id):
         """ Get user if associated with tenant, else None """
         return self.driver.get_by_tenant(user_id, tenant_id)
@@ -72,13 +95,37 @@ class Manager(object):
 
     def update(self, user):
         """ Update user """
-        return self.driver.update(user['id'], user)
+        user_id = user['id']
+        try:
+            return self.driver.update(user_id, user)
+        finally:
+            Manager.password_cache.invalidate('user:%s' % user_id)
 
     def delete(self, user_id):
-        self.driver.delete(user_id)
+        try:
+            self.driver.delete(user_id)
+        finally:
+            Manager.password_cache.invalidate('user:%s' % user_id)
 
     def check_password(self, user_id, password):
-        return self.driver.check_password(user_id, password)
+        """ Verifies the password of a user
+
+        Successful verifications are cached, so repeated logins with the
+        same password skip the backend and the password hash until the
+        entry expires or the user is updated by this process. """
+        cache = Manager.password_cache
+        if not cache.enabled or not password:
+            return self.driver.check_password(user_id, password)
+
+        key = (user_id, _password_digest(password))
+        if cache.get(key):
+            return True
+        generation = cache.generation
+        result = self.driver.check_password(user_id, password)
+        if result:
+            cache.set(key, True, size=0, tags=['user:%s' % user_id],
+                      generation=generation)
+        return result
 
     def user_role_add(self, values):
         self.driver.user_role_add(values)
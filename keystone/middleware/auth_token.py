@@ -94,19 +94,45 @@ HTTP_X_ROLE
 HTTP_X_ROLES
     Comma delimited list of case-sensitive Roles
 
+SIGNED TOKENS
+-------------
+
+Signed tokens (see keystone.common.signing) carry their claims, so they are
+verified in process: the signature with the certificates of the signing
+keys Keystone publishes, which are fetched with the admin credentials when
+a token is signed with an unknown key (at most every
+signing_certificates_refresh_interval seconds), and the expiry. If
+signing_ca_file is set, only the certificates issued by the certificate
+authorities it holds are used. Other tokens are validated by the auth
+service.
+
+REVOCATION EVENTS
+-----------------
+
+Cached claims outlive the revocation of their token, or the disabling of
+their user or tenant, unless revocation_poll_interval is set: a green thread
+then reads the revocation events Keystone records every that many seconds,
+and evicts the cached claims they concern. Claims cached in memcache (which
+cannot be searched) are ignored if they were cached before such an event was
+read. Signed tokens of users or tenants with events are validated by the
+auth service, and revoked signed tokens are rejected. This makes long cache
+lifetimes safe.
+
 """
 
 from datetime import datetime
 from dateutil import parser
 import errno
 import eventlet
+from eventlet import event
 from eventlet import wsgi
 import httplib
 import json
-# memcache is imported in __init__ if memcache caching is configured
+# memcache is imported in _init_protocol if memcache caching is configured
 import logging
 import os
 from paste.deploy import loadapp
+import sys
 import time
 import urllib
 from urlparse import urlparse
@@ -114,6 +140,9 @@ from webob.exc import HTTPUnauthorized
 from webob.exc import Request, Response
 
 from keystone.common.bufferedhttp import http_connect_raw as http_connect
+from keystone.common.bufferedhttp import HTTPConnectionPool
+from keystone.common.cache import LRUCache
+from keystone.common import signing
 
 logger = logging.getLogger(__name__)  # pylint: disable=C0103
 
@@ -200,12 +229,42 @@ class AuthProtocol(object):
         # server
         self.cert_file = conf.get('certfile', None)
         self.key_file = conf.get('keyfile', None)
+        # Keep-alive connections to the auth service
+        self.auth_pool = HTTPConnectionPool(self.auth_host, self.auth_port,
+                ssl=(self.auth_protocol == 'https'),
+                key_file=self.key_file,
+                cert_file=self.cert_file,
+                timeout=self.auth_timeout,
+                max_size=int(conf.get('auth_pool_size', 10)),
+                idle_timeout=float(conf.get('auth_pool_idle_timeout', 60)))
+        # In-process cache of claims, checked before memcache (if any); off
+        # by default, as it accepts revoked tokens for up to its ttl unless
+        # revocation events are polled
+        self.local_cache = LRUCache(
+            max_entries=int(conf.get('local_cache_max_entries', 0)),
+            ttl=float(conf.get('local_cache_ttl', 60)))
+        self.local_cache_negative_ttl = float(conf.get(
+            'local_cache_negative_ttl', 10))
+        # Seconds between fetches of the certificates verifying signed
+        # tokens, and the certificate authorities that must have issued them
+        self.signing_certificates_refresh = float(conf.get(
+            'signing_certificates_refresh_interval', 10))
+        self.signing_ca_file = conf.get('signing_ca_file')
+        # Seconds between reads of the revocation events (0 for none)
+        self.revocation_poll_interval = float(conf.get(
+            'revocation_poll_interval', 0))
         # Caching
         self.cache = conf.get('cache', None)
         self.memcache_hosts = conf.get('memcache_hosts', None)
         if self.memcache_hosts:
             if self.cache is None:
                 self.cache = "keystone.cache"
+            # This will only be used if the configuration calls for memcache
+            from keystone.common.memcachering import MemcacheRing
+            # memcache_hosts is a comma separated list of host:port
+            self.memcache_client = MemcacheRing(self.memcache_hosts,
+                pool_size=int(conf.get('memcache_pool_size', 10)),
+                dead_retry=int(conf.get('memcache_dead_retry', 30)))
         self.tested_for_osksvalidate = False
         self.last_test_for_osksvalidate = None
         self.osksvalidate = self._supports_osksvalidate()
@@ -228,6 +287,7 @@ class AuthProtocol(object):
         self.auth_port = None
         self.auth_protocol = None
         self.auth_timeout = None
+        self.auth_pool = None
         self.cert_file = None
         self.key_file = None
         self.delay_auth_decision = None
@@ -243,20 +303,39 @@ class AuthProtocol(object):
         self.last_test_for_osksvalidate = None
         self.cache = None
         self.memcache_hosts = None
+        self.memcache_client = None
+        self.local_cache = None
+        self.local_cache_negative_ttl = None
+        self.validations_in_flight = {}
+        # key id -> signing.Certificate verifying the tokens of that key
+        self.signing_certificates = {}
+        self.signing_certificates_fetched = 0
+        self.signing_certificates_in_flight = None
+        self.signing_certificates_refresh = None
+        self.signing_ca_file = None
+        # 'token:<id>', 'user:<id>' or 'tenant:<id>' -> when a revocation
+        # event was read for it, and when events were missed, if recently
+        self.revoked = {}
+        self.revoked_all = 0
+        self.revocation_cursor = None
+        # ids of the events read after the cursor, which are read again
+        self.revocation_read = set()
+        self.revocation_poll_interval = None
+        self.revocation_poller = None
         self._init_protocol_common(app, conf)  # Applies to all protocols
         self._init_protocol(conf)  # Specific to this protocol
 
     def __call__(self, env, start_response):
         """ Handle incoming request. Authenticate. And send downstream. """
         logger.debug("entering AuthProtocol.__call__")
-        # Initialize caching client
-        if self.memcache_hosts:
-            # This will only be used if the configuration calls for memcache
-            import memcache
-
+        # Use our own caching client unless the pipeline provides one
+        if self.memcache_client is not None:
             if env.get(self.cache, None) is None:
-                memcache_client = memcache.Client([self.memcache_hosts])
-                env[self.cache] = memcache_client
+                env[self.cache] = self.memcache_client
+        # Started on the first request, in the hub (and process) serving it
+        if self.revocation_poll_interval and self.revocation_poller is None:
+            self.revocation_poller = eventlet.spawn(
+                self._poll_revocation_events)
 
         # Check if we're set up to use OS-KSVALIDATE periodically if not on
         if self.tested_for_osksvalidate != True:
@@ -361,36 +440,60 @@ class AuthProtocol(object):
         """ decrypt or demac claims if necessary """
         return pclaims
 
-    def _cache_put(self, env, token, claims, valid):
-        """ Put a claim into the cache """
+    def _cache_put(self, env, token, claims, valid, validated=None):
+        """ Put a claim into the cache
+
+        validated is when the validation of valid claims began; they are
+        not cached if a revocation event concerning them was read since.
+        """
+        validated = validated or time.time()
+        if valid and self._is_revoked(token, claims, validated):
+            logger.debug("Claims revoked while validated; not caching them")
+            return
+        if claims:
+            self._local_cache_put(token, (claims,
+                                  self._convert_date(claims['expires']),
+                                  valid))
+
         cache = self._cache(env)
         if cache and claims:
             key = 'tokens/%s' % (token)
+            expires = self._convert_date(claims['expires'])
+            if valid:
+                timeout = expires - time.time()
+            else:
+                # rejected claims are remembered as briefly as in process
+                timeout = self.local_cache_negative_ttl
+                if timeout <= 0:
+                    return
+            claims = self._protect_claims(token, claims)
             if "timeout" in cache.set.func_code.co_varnames:
                 # swift cache
-                expires = self._convert_date(claims['expires'])
-                claims = self._protect_claims(token, claims)
-                cache.set(key, (claims, expires, valid),
-                             timeout=expires - time.time())
+                cache.set(key, (claims, expires, valid, validated),
+                             timeout=timeout)
             else:
-                # normal memcache client
-                expires = self._convert_date(claims['expires'])
-                timeout = expires - time.time()
-                if timeout > MAX_CACHE_TIME or not valid:
-                    # Limit cache to one day (and cache bad tokens for a day)
-                    timeout = MAX_CACHE_TIME
-                claims = self._protect_claims(token, claims)
-                cache.set(key, (claims, expires, valid), time=timeout)
+                # normal memcache client; limit cache to one day
+                cache.set(key, (claims, expires, valid, validated),
+                          time=min(timeout, MAX_CACHE_TIME))
 
     def _cache_get(self, env, token):
         """ Return claim and relevant information (expiration and validity)
         from cache """
+        cached_claims = self.local_cache.get(token)
+        if cached_claims:
+            return cached_claims
+
         cache = self._cache(env)
         if cache:
             key = 'tokens/%s' % (token)
             cached_claims = cache.get(key)
             if cached_claims:
-                claims, expires, valid = cached_claims
+                claims, expires, valid = cached_claims[:3]
+                # claims cached by older versions lack the validation time
+                validated = cached_claims[3] if len(cached_claims) > 3 else 0
+                if valid and self._is_revoked(token, claims, validated):
+                    logger.debug("Cached claims revoked since")
+                    return None
                 if valid:
                     if "timeout" in cache.set.func_code.co_varnames:
                         if expires > time.time():
@@ -398,9 +501,117 @@ class AuthProtocol(object):
                     else:
                         if expires > time.time():
                             claims = self._unprotect_claims(token, claims)
+                self._local_cache_put(token, (claims, expires, valid))
                 return (claims, expires, valid)
         return None
 
+    def _local_cache_put(self, token, cached_claims):
+        """ Keep claims in process until they expire, but for no more than
+        local_cache_ttl seconds (local_cache_negative_ttl for bad claims) """
+        claims, expires, valid = cached_claims
+        if valid:
+            ttl = min(expires - time.time(), self.local_cache.ttl)
+        else:
+            ttl = self.local_cache_negative_ttl
+        # revocation events evict the claims by these tags
+        self.local_cache.set(token, cached_claims, ttl=ttl,
+                             tags=self._revocation_tags(token, claims))
+
+    @staticmethod
+    def _revocation_tags(token, claims):
+        """Returns the tags of the revocation events concerning claims"""
+        tags = ['token:%s' % token]
+        if claims.get('id'):
+            # the id of the stored token, for signed tokens
+            tags.append('token:%s' % claims['id'])
+        if claims.get('user'):
+            tags.append('user:%s' % claims['user']['id'])
+        if (claims.get('tenant') or {}).get('id'):
+            tags.append('tenant:%s' % claims['tenant']['id'])
+        return tags
+
+    def _is_revoked(self, token, claims, since=None):
+        """Tells whether claims are concerned by a revocation event read
+        after since (at any time by default)"""
+        if since is not None and self.revoked_all and \
+                self.revoked_all >= since:
+            return True
+        for tag in self._revocation_tags(token, claims):
+            read = self.revoked.get(tag)
+            if read is not None and (since is None or read >= since):
+                return True
+        return False
+
+    def _poll_revocation_events(self):
+        """Reads the revocation events every revocation_poll_interval
+        seconds"""
+        while True:
+            try:
+                self._read_revocation_events()
+            except Exception:  # pylint: disable=W0703
+                logger.exception("Unable to read the revocation events")
+            eventlet.sleep(self.revocation_poll_interval)
+
+    def _read_revocation_events(self):
+        """Reads the revocation events recorded since the last read, and
+        evicts the cached claims they concern"""
+        # the first read gets all the events Keystone kept
+        cursor = self.revocation_cursor or 0
+        while True:
+            events, next_cursor, truncated = self._fetch_revocation_events(
+                cursor)
+            now = time.time()
+            if truncated and self.revocation_cursor is not None:
+                logger.warning("Missed revocation events; evicting all "
+                               "cached claims")
+                self.revoked_all = now
+                self.local_cache.clear()
+            if truncated:
+                # the ids may have restarted
+                self.revocation_read.clear()
+            for revocation in events:
+                if revocation['id'] in self.revocation_read:
+                    continue
+                self.revocation_read.add(revocation['id'])
+                tag = '%s:%s' % (revocation['type'], revocation['targetId'])
+                self.revoked[tag] = now
+                self.local_cache.invalidate(tag)
+            if next_cursor == cursor:
+                break
+            cursor = next_cursor
+        self.revocation_cursor = cursor
+        self.revocation_read = set(id for id in self.revocation_read
+                                   if id > cursor)
+
+        # no claims were cached before that
+        for tag, read in self.revoked.items():
+            if now - read > MAX_CACHE_TIME:
+                del self.revoked[tag]
+        if now - self.revoked_all > MAX_CACHE_TIME:
+            self.revoked_all = 0
+
+    def _fetch_revocation_events(self, since, retry=True):
+        """Returns the revocation events recorded after cursor since, the
+        cursor to read the next ones after, and whether some were missed"""
+        if not self.admin_token:
+            auth = self._get_admin_auth_token(self.admin_user,
+                                              self.admin_password)
+            self.admin_token = json.loads(auth)["access"]["token"]["id"]
+        headers = {"Accept": "application/json",
+                   "X-Auth-Token": self.admin_token}
+        resp, data = self.auth_pool.request('GET',
+            '/v2.0/revocation-events?since=%d' % since, headers=headers)
+        if not str(resp.status).startswith('20'):
+            if retry and resp.status == 401:
+                # the admin token may have expired
+                self.admin_token = None
+                return self._fetch_revocation_events(since, False)
+            logger.error("Unable to read the revocation events: %s"
+                         % resp.status)
+            return [], since, False
+        events = json.loads(data)['revocationEvents']
+        return events['events'], events['cursor'], events['truncated']
+
     def _cache(self, env):
         """ Return a cache to use for token caching, or none """
         if self.cache is not None:
@@ -449,15 +660,8 @@ class AuthProtocol(object):
                     }
                    }
                   }
-        if self.auth_protocol == "http":
-            conn = httplib.HTTPConnection(self.auth_host, self.auth_port)
-        else:
-            conn = httplib.HTTPSConnection(self.auth_host, self.auth_port,
-                cert_file=self.cert_file)
-        conn.request("POST", self._build_token_uri(), json.dumps(params),
-            headers=headers)
-        response = conn.getresponse()
-        data = response.read()
+        _response, data = self.auth_pool.request("POST",
+            self._build_token_uri(), json.dumps(params), headers=headers)
         return data
 
     def _verify_claims(self, env, claims, retry=True):
@@ -475,6 +679,141 @@ class AuthProtocol(object):
                 raise TokenExpired()
             return claims
 
+        if signing.is_signed(claims):
+            verified_claims = self._verify_signed_claims(claims)
+            if verified_claims is not None:
+                return verified_claims
+
+        # Only one validation per token is in flight; concurrent requests
+        # carrying the same token wait for its result (or failure)
+        in_flight = self.validations_in_flight.get(claims)
+        if in_flight is not None:
+            logger.debug("Waiting for the validation of the same claims")
+            return in_flight.wait()
+
+        in_flight = self.validations_in_flight[claims] = event.Event()
+        try:
+            verified_claims = self._validate_claims(env, claims, retry)
+        except Exception:
+            in_flight.send_exception(*sys.exc_info())
+            raise
+        else:
+            in_flight.send(verified_claims)
+            return verified_claims
+        finally:
+            del self.validations_in_flight[claims]
+
+    def _verify_signed_claims(self, token):
+        """Verify a signed token in process and cache the result.
+
+        Returns None if the token must be validated by the auth service.
+        """
+        certificate = self._get_signing_certificate(signing.key_id(token))
+        try:
+            if certificate is None:
+                raise signing.InvalidToken("Unknown signing key")
+            claims = certificate.verify(token)
+            verified_claims = dict((name, claims[name]) for name in
+                                   ['id', 'user', 'tenant', 'roles',
+                                    'expires'])
+            expires = self._convert_date(verified_claims['expires'])
+        except (signing.InvalidToken, KeyError, TypeError, ValueError):
+            logger.debug("Signed claims not valid")
+            self._local_cache_put(token, ({}, time.time(), False))
+            raise ValidationFailed()
+
+        # cached in process only: verifying is cheaper than memcache
+        if expires <= time.time():
+            logger.debug("Signed claims (token) expired: %s" % str(expires))
+            self._local_cache_put(token, (verified_claims, expires, False))
+            raise TokenExpired()
+
+        if self.revocation_poll_interval:
+            if 'token:%s' % verified_claims['id'] in self.revoked:
+                logger.debug("Signed claims (token) revoked")
+                self._local_cache_put(token, ({}, time.time(), False))
+                raise ValidationFailed()
+            # the events of the user or tenant may not apply to this token,
+            # and events may not have been read
+            if self.revocation_cursor is None or self.revoked_all or \
+                    self._is_revoked(token, verified_claims):
+                logger.debug("Validating signed claims with revocation "
+                             "events")
+                return None
+        self._local_cache_put(token, (verified_claims, expires, True))
+        return verified_claims
+
+    def _get_signing_certificate(self, key_id):
+        """Returns the certificate of a key Keystone published, or None
+
+        Unknown keys make us fetch the published certificates again, unless
+        that was done less than signing_certificates_refresh seconds ago.
+        Requests needing the certificates while they are fetched wait for
+        them.
+        """
+        if key_id not in self.signing_certificates:
+            in_flight = self.signing_certificates_in_flight
+            if in_flight is not None:
+                in_flight.wait()
+            elif time.time() - self.signing_certificates_fetched >= \
+                    self.signing_certificates_refresh:
+                self.signing_certificates_fetched = time.time()
+                in_flight = self.signing_certificates_in_flight = \
+                    event.Event()
+                try:
+                    self.signing_certificates = \
+                        self._fetch_signing_certificates()
+                finally:
+                    self.signing_certificates_in_flight = None
+                    in_flight.send()
+        certificate = self.signing_certificates.get(key_id)
+        if certificate is None or certificate.expires <= time.time():
+            return None
+        return certificate
+
+    def _fetch_signing_certificates(self, retry=True):
+        """Returns the certificates published by the auth service, or the
+        certificates we have if they cannot be fetched"""
+        try:
+            if not self.admin_token:
+                auth = self._get_admin_auth_token(self.admin_user,
+                                                  self.admin_password)
+                self.admin_token = json.loads(auth)["access"]["token"]["id"]
+            headers = {"Accept": "application/json",
+                       "X-Auth-Token": self.admin_token}
+            resp, data = self.auth_pool.request('GET',
+                '/v2.0/signing-certificates', headers=headers)
+            if not str(resp.status).startswith('20'):
+                if retry and resp.status == 401:
+                    # the admin token may have expired
+                    self.admin_token = None
+                    return self._fetch_signing_certificates(False)
+                logger.error("Unable to fetch the signing certificates: %s"
+                             % resp.status)
+                return self.signing_certificates
+            certificates = {}
+            for published in json.loads(data)['signingCertificates']:
+                certificate = self.signing_certificates.get(published['id'])
+                if certificate is None or \
+                        certificate.pem != published['certificate']:
+                    certificate = signing.Certificate(
+                        published['certificate'])
+                    if self.signing_ca_file and not \
+                            certificate.is_issued_by(self.signing_ca_file):
+                        logger.error("Ignoring a signing certificate not "
+                                     "issued by signing_ca_file")
+                        continue
+                certificates[certificate.key_id] = certificate
+            return certificates
+        except (EnvironmentError, httplib.HTTPException, KeyError, TypeError,
+                ValueError, signing.SigningError) as exc:
+            logger.error("Unable to fetch the signing certificates: %s" % exc)
+            return self.signing_certificates
+
+    def _validate_claims(self, env, claims, retry=True):
+        """Validate claims with the auth service and cache the result."""
+        validated = time.time()
+
         # Step 1: We need to auth with the keystone service, so get an
         # admin token
         if not self.admin_token:
@@ -501,15 +840,7 @@ class AuthProtocol(object):
                     self.auth_protocol, self.auth_host, self.auth_port))
 
         try:
-            conn = http_connect(self.auth_host, self.auth_port, 'GET',
-                                path,
-                                headers=headers,
-                                ssl=(self.auth_protocol == 'https'),
-                                key_file=self.key_file,
-                                cert_file=self.cert_file,
-                                timeout=self.auth_timeout)
-            resp = conn.getresponse()
-            data = resp.read()
+            resp, data = self.auth_pool.request('GET', path, headers=headers)
         except EnvironmentError as exc:
             if exc.errno == errno.ECONNREFUSED:
                 logger.error("Keystone server not responding on %s://%s:%s "
@@ -524,21 +855,25 @@ class AuthProtocol(object):
 
         logger.debug("Response received: %s" % resp.status)
         if not str(resp.status).startswith('20'):
-            # Cache it if there is a cache available
-            if self.cache:
+            if retry:
+                # the admin token may have expired; get a new one and retry
+                self.admin_token = None
+                return self._validate_claims(env, claims, False)
+            elif resp.status in (401, 404):
+                # Keystone rejected claim
                 logger.debug("Caching that results were invalid")
                 self._cache_put(env, claims,
                                 claims={'expires':
-                                datetime.strftime(time.time(),
-                                                  EXPIRE_TIME_FORMAT)},
+                                datetime.now().strftime(EXPIRE_TIME_FORMAT)},
                                 valid=False)
-            if retry:
-                self.admin_token = None
-                return self._verify_claims(env, claims, False)
-            else:
-                # Keystone rejected claim
                 logger.debug("Failing the validation")
                 raise ValidationFailed()
+            else:
+                # not an answer about the claims: validate them again on
+                # the next request
+                logger.error("Keystone failed to validate claims: %s" %
+                             resp.status)
+                raise ValidationFailed()
 
         token_info = json.loads(data)
 
@@ -559,6 +894,7 @@ class AuthProtocol(object):
                                                                 tenant_name))
 
         verified_claims = {
+            'id': token_info['access']['token']['id'],
             'user': {
                 'id': token_info['access']['user']['id'],
                 'name': token_info['access']['user']['name'],
@@ -576,17 +912,14 @@ class AuthProtocol(object):
         expires = self._convert_date(verified_claims['expires'])
         if expires <= time.time():
             logger.debug("Claims (token) expired: %s" % str(expires))
-            # Cache it if there is a cache available (we also cached bad
-            # claims)
-            if self.cache:
-                logger.debug("Caching expired claim (token)")
-                self._cache_put(env, claims, verified_claims, valid=False)
+            # Cache it (we also cache bad claims)
+            logger.debug("Caching expired claim (token)")
+            self._cache_put(env, claims, verified_claims, valid=False)
             raise TokenExpired()
 
-        # Cache it if there is a cache available
-        if self.cache:
-            logger.debug("Caching validated claim")
-            self._cache_put(env, claims, verified_claims, valid=True)
+        logger.debug("Caching validated claim")
+        self._cache_put(env, claims, verified_claims, valid=True,
+                        validated=validated)
         logger.debug("Returning successful validation")
         return verified_claims
 
@@ -649,15 +982,8 @@ class AuthProtocol(object):
                 self.auth_protocol, self.auth_host, self.auth_port))
         try:
             self.last_test_for_osksvalidate = time.time()
-            conn = http_connect(self.auth_host, self.auth_port, 'GET',
-                                '/v2.0/extensions/',
-                                headers=headers,
-                                ssl=(self.auth_protocol == 'https'),
-                                key_file=self.key_file,
-                                cert_file=self.cert_file,
-                                timeout=self.auth_timeout)
-            resp = conn.getresponse()
-            data = resp.read()
+            resp, data = self.auth_pool.request('GET', '/v2.0/extensions/',
+                                                headers=headers)
 
             logger.debug("Response received: %s" % resp.status)
             if not str(resp.status).startswith('20'):
@@ -769,6 +769,20 @@ class Token(Resource):
                                     tenant_id=tenant_id, *args, **kw)
 
 
+class RevocationEvent(Resource):
+    """ Revocation event model
+
+    Records that a token was revoked, or that a user or tenant was disabled
+    (type is 'token', 'user' or 'tenant'). Event ids increase, so that
+    readers of the events can resume after the last one they read.
+    """
+    def __init__(self, id=None, type=None, target_id=None, created=None,
+            *args, **kw):
+        super(RevocationEvent, self).__init__(id=id, type=type,
+                                              target_id=target_id,
+                                              created=created, *args, **kw)
+
+
 class UserRoleAssociation(Resource):
     """ Role Grant model """
 
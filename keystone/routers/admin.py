@@ -22,6 +22,7 @@ from keystone.common import wsgi
 from keystone.controllers.token import TokenController
 from keystone.controllers.roles import RolesController
 from keystone.controllers.staticfiles import StaticFilesController
+from keystone.controllers.stats import StatsController
 from keystone.controllers.tenant import TenantController
 from keystone.controllers.user import UserController
 from keystone.controllers.version import VersionController
@@ -59,6 +60,12 @@ class AdminApi(wsgi.Router):
                         controller=auth_controller,
                         action="endpoints",
                         conditions=dict(method=["GET"]))
+        mapper.connect("/signing-certificates", controller=auth_controller,
+                        action="get_signing_certificates",
+                        conditions=dict(method=["GET"]))
+        mapper.connect("/revocation-events", controller=auth_controller,
+                        action="get_revocation_events",
+                        conditions=dict(method=["GET"]))
 
         # Tenant Operations
         tenant_controller = TenantController()
@@ -92,6 +99,13 @@ class AdminApi(wsgi.Router):
                         action="get_extensions_info",
                         conditions=dict(method=["GET"]))
 
+        # Counters of this process (admin token required)
+        stats_controller = StatsController()
+        mapper.connect("/stats",
+                        controller=stats_controller,
+                        action="get_stats",
+                        conditions=dict(method=["GET"]))
+
         # Static Files Controller
         static_files_controller = StaticFilesController()
         mapper.connect("/identityadminguide.pdf",
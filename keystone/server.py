@@ -55,9 +55,15 @@ HTTP_X_AUTHORIZATION
 
 import logging
 
+import eventlet
+import eventlet.wsgi
+
 from keystone import config
+from keystone.backends import backendutils
 from keystone.common import config as common_config
+from keystone.common import prefork
 from keystone.common import wsgi
+from keystone.logic import reaper
 from keystone.routers.service import ServiceApi
 from keystone.routers.admin import AdminApi
 
@@ -106,6 +112,7 @@ class Server():
         self.port = None
         self.host = None
         self.protocol = None
+        self.socket = None
         self.options = CONF.to_dict()
 
     def start(self, host=None, port=None, wait=True):
@@ -116,7 +123,83 @@ class Server():
         :param wait: whether to wait (block) for the server to terminate or
             return to the caller without waiting
         """
+        self.bind(host, port)
+        self.serve()
+
+        # Wait until done
+        if wait:
+            self.server.wait()
+
+    def bind(self, host=None, port=None):
+        """Binds the listening socket of the server, without serving
+
+        With workers, raises ValueError if the in-process caches are enabled
+
+        :param host: the IP address to listen on
+        :param port: the TCP/IP port to listen on
+        """
+        if port is None:
+            if self.config == 'admin':
+                # Legacy
+                port = int(CONF.admin_port or 35357)
+            else:
+                port = int(CONF.service_port or CONF.bind_port or 5000)
+        if host is None:
+            host = CONF.bind_host or CONF.service_host or "0.0.0.0"
+
+        self.port = port
+        self.host = host
+        if CONF.workers:
+            self._check_workers()
+        if CONF.password_hash_pool == 'process':
+            if CONF.workers:
+                # each worker would fork a pool of its own while serving
+                raise ValueError("password_hash_pool = process cannot be "
+                                 "used with workers, which already spread "
+                                 "the hashing over the CPUs")
+            backendutils.configure_hashing(CONF.password_hash_pool,
+                                           CONF.password_hash_workers)
+            backendutils.start_process_pool()
+        self.socket = eventlet.listen((host, port),
+                                      backlog=self._option('backlog'))
+
+    @staticmethod
+    def _check_workers():
+        """Refuses the in-process caches with workers: a worker evicts the
+        entries a change makes stale from its own caches only, so the other
+        workers would keep using them"""
+        caches = [name for name in ('validate_cache_max_entries',
+                                    'catalog_cache_max_entries',
+                                    'password_cache_max_entries')
+                  if CONF[name]]
+        if CONF['keystone.backends.sqlalchemy'].uid_cache_max_entries:
+            caches.append('uid_cache_max_entries')
+        if caches:
+            raise ValueError("Workers do not share their caches; set %s to 0 "
+                             "to run with workers" % ', '.join(caches))
+
+    def _option(self, name):
+        """Returns the admin_* or service_* setting of the server"""
+        prefix = 'admin' if self.config == 'admin' else 'service'
+        return CONF['%s_%s' % (prefix, name)]
+
+    def _wsgi_server(self, server_class):
+        # eventlet limits the length of header lines process-wide
+        eventlet.wsgi.MAX_HEADER_LINE = CONF.max_header_line
+        return server_class(threads=self._option('pool_size'),
+                            keepalive=self._option('keepalive'),
+                            socket_timeout=(
+                                self._option('client_socket_timeout') or None))
+
+    def serve(self, reaper_enabled=True):
+        """Serves the application on the socket bound by bind()
+
+        :param reaper_enabled: whether to delete expired tokens in this
+            process, if configured
+        """
         logger.debug("Starting API server")
+        # the configuration may have been re-read since the initialization
+        self.options = CONF.to_dict()
         conf, app = common_config.load_paste_app(self.config, self.options,
                 self.args)
 
@@ -129,15 +212,7 @@ class Server():
             logger.info("Starting '%s' with config: %s" %
                                    (self.config, config_file))
 
-        if port is None:
-            if self.config == 'admin':
-                # Legacy
-                port = int(CONF.admin_port or 35357)
-            else:
-                port = int(CONF.service_port or CONF.bind_port or 5000)
-        if host is None:
-            host = CONF.bind_host or CONF.service_host or "0.0.0.0"
-
+        host, port = self.host, self.port
         self.key = "%s-%s:%s" % (self.name, host, port)
 
         # Safely get SSL options
@@ -151,28 +226,27 @@ class Server():
             keyfile = conf.get('keyfile')
             ca_certs = conf.get('ca_certs')
 
-            self.server = wsgi.SslServer()
+            self.server = self._wsgi_server(wsgi.SslServer)
             self.server.start(app, port, host,
                          certfile=certfile, keyfile=keyfile,
                          ca_certs=ca_certs,
                          cert_required=cert_required,
-                         key=self.key)
+                         key=self.key, socket=self.socket)
             self.protocol = 'https'
         else:
-            self.server = wsgi.Server()
+            self.server = self._wsgi_server(wsgi.Server)
             self.server.start(app, port, host,
-                              key="%s-%s:%s" % (self.config, host, port))
+                              key="%s-%s:%s" % (self.config, host, port),
+                              socket=self.socket)
             self.protocol = 'http'
 
-        self.port = port
-        self.host = host
+        # deletes expired tokens periodically, if configured
+        if reaper_enabled:
+            reaper.start_reaper()
 
         logger.info("%s listening on %s://%s:%s" % (
             self.name, ['http', 'https'][service_ssl], host, port))
-
-        # Wait until done
-        if wait:
-            self.server.wait()
+        return self.server
 
     def stop(self):
         """Stops the Keystone server
@@ -180,7 +254,39 @@ class Server():
         This should be called always to release the network socket
         """
         if self.server is not None:
-            if self.key in self.server.threads:
-                logger.debug("Killing %s" % self.key)
-                self.server.threads[self.key].kill()
+            logger.debug("Stopping %s" % self.key)
+            self.server.stop()
             self.server = None
+
+
+def run_workers(servers, workers, reload=None):
+    """Runs the Keystone servers in pre-forked worker processes
+
+    The sockets of the servers are bound once, by the calling process, which
+    then supervises the workers until it receives SIGTERM or SIGINT (see
+    keystone.common.prefork). The applications are loaded by each worker,
+    so that the workers share no database connections, nor caches: binding
+    fails while the in-process caches are enabled (see Server.bind).
+
+    :param servers: the Server instances to run
+    :param workers: the number of worker processes
+    :param reload: called on SIGHUP, before replacing the workers (e.g. to
+        re-read the configuration; the sockets are not bound again)
+    """
+    for server in servers:
+        if server.socket is None:
+            server.bind()
+
+    def serve(slot):
+        # one process is enough to delete the expired tokens
+        return [server.serve(reaper_enabled=(slot == 0))
+                for server in servers]
+
+    # the supervisor logs like the workers
+    options = CONF.to_dict()
+    _conf_file, conf = common_config.load_paste_config(servers[0].config,
+            options, servers[0].args)
+    common_config.setup_logging(options, conf)
+
+    logger.info("Starting %s worker processes" % workers)
+    prefork.Supervisor(serve, workers, reload=reload).run()
@@ -704,6 +704,12 @@ class MemcacheTest(SQLTest):
     test_files = ('keystone.memcachetest.db',)
 
 
+class KvsTest(SQLTest):
+    """Test defined using only SQLAlchemy and in-process token back-end"""
+    config_name = 'kvs.conf.template'
+    test_files = ('keystone.kvstest.db',)
+
+
 class LDAPTest(SQLTest):
     """Test defined using only SQLAlchemy and LDAP back-end"""
     config_name = 'ldap.conf.template'
@@ -16,6 +16,7 @@
 
 """Base test case classes for the unit tests"""
 
+import atexit
 import datetime
 import functools
 import httplib
@@ -23,6 +24,8 @@ import logging
 from lxml import etree, objectify
 import pprint
 import os
+import shutil
+import subprocess
 import sys
 import tempfile
 import unittest2 as unittest
@@ -33,11 +36,33 @@ from keystone import server
 import keystone.backends.sqlalchemy as db
 import keystone.backends.api as db_api
 from keystone import backends
+from keystone.common.cache import UidMap
 
 logger = logging.getLogger('test.unit.base')
 
 CONF = config.CONF
 
+# name -> (key file, certificate file) of the signing keys generated
+_SIGNING_KEYS = {}
+
+
+def signing_key(name='keystone'):
+    """Returns the paths of an RSA private key signing tokens, and of its
+    self-signed certificate (valid for a day); the same ones for a name"""
+    if name not in _SIGNING_KEYS:
+        directory = tempfile.mkdtemp()
+        atexit.register(shutil.rmtree, directory, True)
+        keyfile = os.path.join(directory, 'key.pem')
+        certfile = os.path.join(directory, 'cert.pem')
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(
+                ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+                 '-subj', '/CN=%s' % name, '-days', '1',
+                 '-keyout', keyfile, '-out', certfile],
+                stdout=devnull, stderr=devnull)
+        _SIGNING_KEYS[name] = (keyfile, certfile)
+    return _SIGNING_KEYS[name]
+
 
 class ServiceAPITest(unittest.TestCase):
     """
@@ -201,6 +226,16 @@ backend_entities = ['UserRoleAssociation',
                 credentials['user_id'])
             return credentials
 
+    def enable_uid_caches(self, max_entries=100):
+        """
+        Caches the user and tenant uid translations of the SQL backend
+        (disabled by default) until the end of the test.
+        """
+        for backend in (db_api.USER, db_api.TENANT):
+            api = type(backend)
+            self.addCleanup(setattr, api, 'uids', api.uids)
+            api.uids = UidMap(max_entries)
+
     def fixture_create_tenant(self, **kwargs):
         """
         Creates a tenant fixture.
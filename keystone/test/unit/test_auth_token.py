@@ -0,0 +1,354 @@
+import datetime
+import eventlet
+import json
+import unittest2 as unittest
+
+from keystone.common import signing
+from keystone.logic.types import auth
+from keystone.middleware import auth_token
+from keystone.test.unit.base import signing_key
+
+SIGNING_KEYS = signing.SigningKeys(*signing_key())
+SIGNED = SIGNING_KEYS.sign({
+    'id': 'STORED', 'user': {'id': 'u1', 'name': 'user'},
+    'tenant': {'id': 't1', 'name': 'tenant'}, 'roles': ['Member'],
+    'expires': (datetime.datetime.now() +
+                datetime.timedelta(days=1)).isoformat()})
+
+
+class FakeResponse(object):
+    def __init__(self, status):
+        self.status = status
+
+
+class FakePool(object):
+    """Answers token validation requests without a keystone server"""
+
+    def __init__(self, valid_tokens):
+        # token -> id of the stored token
+        self.valid_tokens = valid_tokens
+        self.requests = []
+        # (type, target id) of the revocation events
+        self.revocation_events = []
+        self.revocation_truncated = False
+        # events returned again after the cursor, as if not committed yet
+        self.revocation_lag = 0
+
+    def request(self, method, path, body=None, headers=None):
+        if method == 'POST':
+            # the middleware asks for a new admin token
+            return FakeResponse(200), json.dumps({'access': {
+                'token': {'id': 'ADMIN'}}})
+        self.requests.append(path)
+        # let other green threads run while "waiting" for keystone
+        eventlet.sleep(0)
+        if path == '/v2.0/signing-certificates':
+            return FakeResponse(200), auth.SigningCertificates(
+                SIGNING_KEYS.published()).to_json()
+        if path.startswith('/v2.0/revocation-events?since='):
+            since = int(path.split('=')[1])
+            events = [{'id': id, 'type': type, 'targetId': target_id}
+                      for id, (type, target_id)
+                      in enumerate(self.revocation_events, 1)][since:]
+            truncated, self.revocation_truncated = \
+                self.revocation_truncated, False
+            return FakeResponse(200), json.dumps({'revocationEvents': {
+                'events': events,
+                'cursor': len(self.revocation_events) - self.revocation_lag,
+                'truncated': truncated}})
+        token = path.split('/')[3]
+        if token == 'ERROR':
+            return FakeResponse(503), ''
+        if token not in self.valid_tokens:
+            return FakeResponse(404), ''
+        expires = datetime.datetime.now() + datetime.timedelta(days=1)
+        return FakeResponse(200), json.dumps({'access': {
+            'token': {'id': self.valid_tokens[token],
+                      'expires': expires.isoformat(),
+                      'tenant': {'id': 't1', 'name': 'tenant'}},
+            'user': {'id': 'u1', 'name': 'user',
+                     'roles': [{'name': 'Member'}]}}})
+
+
+class FakeCache(object):
+    """A memcache client keeping the values in a dict"""
+
+    def __init__(self):
+        self.values = {}
+        self.times = {}
+
+    def set(self, key, value, time=0):
+        self.values[key] = value
+        self.times[key] = time
+
+    def get(self, key):
+        return self.values.get(key)
+
+
+class AuthTokenTestCase(unittest.TestCase):
+    """Runs keystone.middleware.auth_token against a FakePool"""
+
+    def _middleware(self, **conf):
+        conf.setdefault('local_cache_max_entries', '1000')
+        conf.update({'auth_host': '127.0.0.1',
+                     'auth_port': '1',
+                     'auth_protocol': 'http',
+                     'service_host': '127.0.0.1',
+                     'service_port': '1',
+                     'admin_token': 'ADMIN'})
+        middleware = auth_token.AuthProtocol(None, conf)
+        middleware.auth_pool = FakePool({'GOOD': 'GOOD', SIGNED: 'STORED'})
+        return middleware
+
+    def _verify_concurrently(self, middleware, token):
+        pile = eventlet.GreenPile()
+        for i in range(10):
+            pile.spawn(self._verify, middleware, token)
+        return list(pile)
+
+    @staticmethod
+    def _verify(middleware, token):
+        try:
+            return middleware._verify_claims({}, token)
+        except auth_token.ValidationFailed as e:
+            return e
+
+
+class TestAuthTokenCache(AuthTokenTestCase):
+    """Tests the claims caching of keystone.middleware.auth_token"""
+
+    def test_caches_valid_claims(self):
+        middleware = self._middleware()
+        claims = middleware._verify_claims({}, 'GOOD')
+        self.assertEqual('u1', claims['user']['id'])
+        self.assertEqual(claims, middleware._verify_claims({}, 'GOOD'))
+        self.assertEqual(1, len(middleware.auth_pool.requests))
+
+    def test_caches_rejected_claims(self):
+        middleware = self._middleware()
+        self.assertRaises(auth_token.ValidationFailed,
+                          middleware._verify_claims, {}, 'BAD')
+        # the first failure is retried with a new admin token
+        self.assertEqual(2, len(middleware.auth_pool.requests))
+        self.assertRaises(auth_token.ValidationFailed,
+                          middleware._verify_claims, {}, 'BAD')
+        self.assertEqual(2, len(middleware.auth_pool.requests))
+
+    def test_negative_ttl(self):
+        middleware = self._middleware(local_cache_negative_ttl='0')
+        for i in range(2):
+            self.assertRaises(auth_token.ValidationFailed,
+                              middleware._verify_claims, {}, 'BAD')
+        self.assertEqual(4, len(middleware.auth_pool.requests))
+
+    def test_negative_ttl_in_memcache(self):
+        middleware = self._middleware(cache='keystone.cache')
+        env = {'keystone.cache': FakeCache()}
+        self.assertRaises(auth_token.ValidationFailed,
+                          middleware._verify_claims, env, 'BAD')
+        self.assertEqual(10, env['keystone.cache'].times['tokens/BAD'])
+
+        middleware = self._middleware(cache='keystone.cache',
+                                      local_cache_negative_ttl='0')
+        env = {'keystone.cache': FakeCache()}
+        self.assertRaises(auth_token.ValidationFailed,
+                          middleware._verify_claims, env, 'BAD')
+        self.assertEqual({}, env['keystone.cache'].values)
+
+    def test_server_errors_not_cached(self):
+        middleware = self._middleware()
+        for i in range(2):
+            self.assertRaises(auth_token.ValidationFailed,
+                              middleware._verify_claims, {}, 'ERROR')
+        self.assertEqual(4, len(middleware.auth_pool.requests))
+
+    def test_local_cache_disabled_by_default(self):
+        middleware = auth_token.AuthProtocol(None, {
+            'auth_host': '127.0.0.1', 'auth_port': '1',
+            'auth_protocol': 'http', 'service_host': '127.0.0.1',
+            'service_port': '1', 'admin_token': 'ADMIN'})
+        middleware.auth_pool = FakePool({'GOOD': 'GOOD'})
+        for i in range(2):
+            middleware._verify_claims({}, 'GOOD')
+        self.assertFalse(middleware.local_cache.enabled)
+        self.assertEqual(2, len(middleware.auth_pool.requests))
+
+    def test_local_cache_disabled(self):
+        middleware = self._middleware(local_cache_max_entries='0')
+        middleware._verify_claims({}, 'GOOD')
+        middleware._verify_claims({}, 'GOOD')
+        self.assertEqual(2, len(middleware.auth_pool.requests))
+
+    def test_coalesces_concurrent_validations(self):
+        middleware = self._middleware(local_cache_max_entries='0')
+        results = self._verify_concurrently(middleware, 'GOOD')
+        self.assertEqual(1, len(middleware.auth_pool.requests))
+        self.assertEqual(['u1'] * 10,
+                         [claims['user']['id'] for claims in results])
+        self.assertEqual({}, middleware.validations_in_flight)
+
+    def test_coalesces_concurrent_failures(self):
+        middleware = self._middleware(local_cache_max_entries='0')
+        results = self._verify_concurrently(middleware, 'BAD')
+        self.assertEqual(2, len(middleware.auth_pool.requests))
+        for result in results:
+            self.assertTrue(isinstance(result, auth_token.ValidationFailed))
+        self.assertEqual({}, middleware.validations_in_flight)
+
+
+class TestAuthTokenSigned(AuthTokenTestCase):
+    """Tests the local verification of signed tokens"""
+
+    def _token(self, expires=None, keys=SIGNING_KEYS):
+        expires = expires or (datetime.datetime.now() +
+                              datetime.timedelta(days=1))
+        return keys.sign({'id': 'GOOD',
+                          'user': {'id': 'u1', 'name': 'user'},
+                          'tenant': {'id': 't1', 'name': 'tenant'},
+                          'roles': ['Member'],
+                          'expires': expires.isoformat()})
+
+    def test_verifies_signed_token(self):
+        middleware = self._middleware()
+        token = self._token()
+        claims = middleware._verify_claims({}, token)
+        self.assertEqual('u1', claims['user']['id'])
+        self.assertEqual(['Member'], claims['roles'])
+        # the certificates are fetched once; tokens are not validated
+        # remotely
+        middleware._verify_claims({}, self._token())
+        self.assertEqual(['/v2.0/signing-certificates'],
+                         middleware.auth_pool.requests)
+
+    def test_rejects_tampered_token(self):
+        middleware = self._middleware()
+        token = self._token()
+        prefix, key_id, claims, signature = token.split('.')
+        other = self._token().split('.')[2]
+        self.assertRaises(auth_token.ValidationFailed,
+                          middleware._verify_claims, {},
+                          '.'.join([prefix, key_id, other[:-4], signature]))
+
+    def test_rejects_unknown_key(self):
+        middleware = self._middleware(
+            signing_certificates_refresh_interval='60')
+        token = self._token(
+            keys=signing.SigningKeys(*signing_key('other')))
+        self.assertRaises(auth_token.ValidationFailed,
+                          middleware._verify_claims, {}, token)
+        middleware._verify_claims({}, self._token())
+        # the certificates are not fetched again before the refresh interval
+        self.assertEqual(1, len(middleware.auth_pool.requests))
+
+    def test_certificate_authority(self):
+        middleware = self._middleware(signing_ca_file=signing_key()[1])
+        self.assertEqual('u1',
+                         middleware._verify_claims({}, SIGNED)['user']['id'])
+        middleware = self._middleware(signing_ca_file=signing_key('other')[1])
+        self.assertRaises(auth_token.ValidationFailed,
+                          middleware._verify_claims, {}, self._token())
+        self.assertEqual({}, middleware.signing_certificates)
+
+    def test_rejects_expired_token(self):
+        middleware = self._middleware()
+        token = self._token(datetime.datetime.now() -
+                            datetime.timedelta(seconds=1))
+        self.assertRaises(auth_token.TokenExpired,
+                          middleware._verify_claims, {}, token)
+
+    def test_coalesces_key_fetches(self):
+        middleware = self._middleware(local_cache_max_entries='0')
+        results = self._verify_concurrently(middleware, self._token())
+        self.assertEqual(['u1'] * 10,
+                         [claims['user']['id'] for claims in results])
+        self.assertEqual(1, len(middleware.auth_pool.requests))
+
+
+class TestAuthTokenRevocation(AuthTokenTestCase):
+    """Tests the eviction of cached claims by revocation events"""
+
+    def setUp(self):
+        self.middleware = self._middleware(revocation_poll_interval='10',
+                                           cache='keystone.cache')
+        self.env = {'keystone.cache': FakeCache()}
+
+    def _revoke(self, type, target_id):
+        self.middleware.auth_pool.revocation_events.append((type, target_id))
+        self.middleware._read_revocation_events()
+
+    def _verify_count(self, token='GOOD'):
+        """Verifies token and returns the number of validations so far"""
+        self.middleware._verify_claims(self.env, token)
+        return len([path for path in self.middleware.auth_pool.requests
+                    if path.startswith('/v2.0/tokens/')])
+
+    def test_token_event_evicts_claims(self):
+        self.middleware._read_revocation_events()
+        self.assertEqual(1, self._verify_count())
+        self.assertEqual(1, self._verify_count())
+        self._revoke('token', 'GOOD')
+        self.assertEqual(2, self._verify_count())
+        self.assertEqual(2, self._verify_count())
+
+    def test_user_event_evicts_claims(self):
+        self.middleware._read_revocation_events()
+        self.assertEqual(1, self._verify_count())
+        self._revoke('user', 'other')
+        self.assertEqual(1, self._verify_count())
+        self._revoke('user', 'u1')
+        self.assertEqual(2, self._verify_count())
+
+    def test_memcache_claims_cached_before_event(self):
+        self.middleware._read_revocation_events()
+        self.assertEqual(1, self._verify_count())
+        self.middleware.local_cache.clear()
+        self.assertEqual(1, self._verify_count())
+        self._revoke('tenant', 't1')
+        self.middleware.local_cache.clear()
+        # memcache cannot be searched: its claims are ignored instead
+        self.assertEqual(2, self._verify_count())
+        self.middleware.local_cache.clear()
+        self.assertEqual(2, self._verify_count())
+
+    def test_events_read_again_evict_once(self):
+        self.middleware._read_revocation_events()
+        self.assertEqual(1, self._verify_count())
+        self.middleware.auth_pool.revocation_lag = 1
+        self._revoke('user', 'u1')
+        self.assertEqual(2, self._verify_count())
+        self.middleware._read_revocation_events()
+        self.assertEqual(2, self._verify_count())
+
+    def test_missed_events_evict_all_claims(self):
+        self.middleware._read_revocation_events()
+        self.assertEqual(1, self._verify_count())
+        self.middleware.auth_pool.revocation_truncated = True
+        self.middleware._read_revocation_events()
+        self.assertEqual(2, self._verify_count())
+        self.assertEqual(2, self._verify_count())
+
+    def test_revoked_signed_token(self):
+        self.middleware._read_revocation_events()
+        self.assertEqual(0, self._verify_count(SIGNED))
+        self._revoke('token', 'STORED')
+        self.assertRaises(auth_token.ValidationFailed,
+                          self.middleware._verify_claims, self.env, SIGNED)
+
+    def test_signed_token_of_revoked_user(self):
+        self._revoke('user', 'u1')
+        self.assertEqual(1, self._verify_count(SIGNED))
+        self.assertEqual(1, self._verify_count(SIGNED))
+        self._revoke('token', 'STORED')
+        self.assertRaises(auth_token.ValidationFailed,
+                          self.middleware._verify_claims, self.env, SIGNED)
+
+    def test_signed_tokens_validated_until_events_read(self):
+        self.assertEqual(1, self._verify_count(SIGNED))
+        self.middleware.local_cache.clear()
+        self.env['keystone.cache'].values.clear()
+        self.middleware._read_revocation_events()
+        self.assertEqual(1, self._verify_count(SIGNED))
+
+
+if __name__ == '__main__':
+    unittest.main()
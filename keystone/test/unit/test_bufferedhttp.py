@@ -0,0 +1,77 @@
+import eventlet
+from eventlet import wsgi
+import unittest2 as unittest
+
+from keystone.common import bufferedhttp
+
+
+class NullLog(object):
+    def write(self, msg):
+        pass
+
+
+def echo_app(env, start_response):
+    body = env['PATH_INFO']
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+                              ('Content-Length', str(len(body)))])
+    return [body]
+
+
+class TestHTTPConnectionPool(unittest.TestCase):
+    """Tests keystone.common.bufferedhttp.HTTPConnectionPool"""
+
+    def setUp(self):
+        self.sock = eventlet.listen(('127.0.0.1', 0))
+        self.server = eventlet.spawn(wsgi.server, self.sock, echo_app,
+                                     log=NullLog())
+        self.port = self.sock.getsockname()[1]
+
+    def tearDown(self):
+        self.server.kill()
+        self.sock.close()
+
+    def _pool(self, **kwargs):
+        return bufferedhttp.HTTPConnectionPool('127.0.0.1', self.port,
+                                               **kwargs)
+
+    def test_reuses_connections(self):
+        pool = self._pool()
+        for path in ('/a', '/b', '/c'):
+            resp, data = pool.request('GET', path)
+            self.assertEqual(200, resp.status)
+            self.assertEqual(path, data)
+        self.assertEqual(1, pool.created)
+
+    def test_closes_idle_connections(self):
+        pool = self._pool(idle_timeout=-1)
+        pool.request('GET', '/a')
+        pool.request('GET', '/b')
+        self.assertEqual(2, pool.created)
+
+    def test_reconnects_broken_connections(self):
+        pool = self._pool()
+        pool.request('GET', '/a')
+        # simulate the server dropping the idle connection
+        pool._idle[0][1].sock.close()
+        resp, data = pool.request('GET', '/b')
+        self.assertEqual('/b', data)
+        self.assertEqual(2, pool.created)
+
+    def test_bounded(self):
+        pool = self._pool(max_size=2)
+        pile = eventlet.GreenPile()
+        for i in range(10):
+            pile.spawn(pool.request, 'GET', '/%s' % i)
+        self.assertEqual(10, len(list(pile)))
+        self.assertTrue(pool.created <= 2)
+
+    def test_refused(self):
+        sock = eventlet.listen(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        pool = bufferedhttp.HTTPConnectionPool('127.0.0.1', port)
+        self.assertRaises(EnvironmentError, pool.request, 'GET', '/a')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import StringIO
+import unittest2 as unittest
+
+import keystone.backends.api as db_api
+from keystone.backends.sqlalchemy import bulk
+from keystone.test.unit.base import ServiceAPITest
+
+RECORDS = [
+    {'object': 'tenant', 'name': 'bulk-tenant', 'description': 'imported'},
+    {'object': 'user', 'name': 'bulk-user', 'password': 'secret',
+     'tenant': 'bulk-tenant', 'email': 'bulk@example.com'},
+    {'object': 'user', 'name': 'bulk-disabled', 'password': 'secret',
+     'enabled': False},
+    {'object': 'service', 'name': 'bulk-service', 'type': 'compute'},
+    {'object': 'role', 'name': 'bulk-service:bulk-role'},
+    {'object': 'grant', 'role': 'bulk-service:bulk-role',
+     'user': 'bulk-user', 'tenant': 'bulk-tenant'},
+    {'object': 'credentials', 'user': 'bulk-user', 'type': 'EC2',
+     'key': 'access', 'secret': 'secret', 'tenant': 'bulk-tenant'},
+    {'object': 'endpoint_template', 'service': 'bulk-service',
+     'region': 'RegionOne', 'public_url': 'http://public/%tenant_id%',
+     'id': 100},
+    {'object': 'endpoint', 'tenant': 'bulk-tenant',
+     'endpoint_template': 100},
+]
+
+
+class TestBulk(ServiceAPITest):
+    """Tests keystone.backends.sqlalchemy.bulk"""
+
+    def _import(self, records, batch_size=1000, workers=0):
+        importer = bulk.Importer(batch_size=batch_size, workers=workers)
+        return importer.import_records(records)
+
+    def _check_imported(self):
+        tenant = db_api.TENANT.get_by_name('bulk-tenant')
+        self.assertEqual('imported', tenant.description)
+        self.assertTrue(tenant.enabled)
+        user = db_api.USER.get_by_name('bulk-user')
+        self.assertEqual(tenant.id, user.tenant_id)
+        self.assertTrue(db_api.USER.check_password(user.id, 'secret'))
+        self.assertFalse(db_api.USER.get_by_name('bulk-disabled').enabled)
+        role = db_api.ROLE.get_by_name('bulk-service:bulk-role')
+        self.assertEqual(db_api.SERVICE.get_by_name('bulk-service').id,
+                         role.service_id)
+        self.assertEqual([role.id], [grant.role_id for grant in
+            db_api.ROLE.rolegrant_get_page(None, 10, user.id, tenant.id)])
+        self.assertEqual('access',
+                         db_api.CREDENTIALS.get_by_access('access').key)
+        self.assertEqual(100, db_api.ENDPOINT_TEMPLATE.endpoint_get_by_tenant(
+            tenant.id).endpoint_template_id)
+
+    def test_import(self):
+        counts = self._import(RECORDS)
+        self.assertEqual(2, counts['user'])
+        self.assertEqual(1, counts['endpoint'])
+        self._check_imported()
+
+    def test_import_in_batches(self):
+        # each record is inserted in a batch of its own, after the records
+        # it refers to
+        self._import(RECORDS, batch_size=1)
+        self._check_imported()
+
+    def test_hash_in_worker_processes(self):
+        self._import(RECORDS, workers=1)
+        self._check_imported()
+
+    def test_mixed_ids_in_batch(self):
+        records = RECORDS[:4] + [
+            {'object': 'endpoint_template', 'service': 'bulk-service',
+             'region': 'RegionTwo'},
+            {'object': 'endpoint_template', 'service': 'bulk-service',
+             'region': 'RegionOne', 'id': 100},
+            {'object': 'endpoint_template', 'service': 'bulk-service',
+             'region': 'RegionThree'}]
+        self._import(records)
+        self.assertEqual('RegionOne',
+                         db_api.ENDPOINT_TEMPLATE.get(100).region)
+        self.assertEqual(3, len(db_api.ENDPOINT_TEMPLATE.get_all()))
+
+        self.clear_all_data()
+        self._import(RECORDS[:4] + list(reversed(records[4:])))
+        self.assertEqual('RegionOne',
+                         db_api.ENDPOINT_TEMPLATE.get(100).region)
+
+    def test_unknown_name(self):
+        records = [{'object': 'user', 'name': 'bulk-user',
+                    'tenant': 'missing'}]
+        self.assertRaises(IndexError, self._import, records)
+        self.assertRaises(ValueError, self._import, [{'object': 'token'}])
+
+    def test_export_round_trip(self):
+        self._import(RECORDS)
+        exported = list(bulk.export_records(batch_size=2))
+        users = [record for record in exported if record['object'] == 'user']
+        self.assertTrue(users[-1]['password_hash'])
+
+        self.clear_all_data()
+        self._import(exported)
+        self._check_imported()
+        self.assertEqual(exported, list(bulk.export_records()))
+
+    def test_file_formats(self):
+        self._import(RECORDS)
+        exported = list(bulk.export_records())
+        for format in ['json', 'csv']:
+            out = StringIO.StringIO()
+            bulk.write_records(exported, out, format)
+            lines = StringIO.StringIO(out.getvalue())
+            records = list(bulk.read_records(lines, format))
+            self.assertEqual(len(exported), len(records))
+            self.clear_all_data()
+            self._import(records)
+            self._check_imported()
+
+    def test_guess_format(self):
+        self.assertEqual('csv', bulk.guess_format('users.csv'))
+        self.assertEqual('json', bulk.guess_format('users.jsonl'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import time
+import unittest2 as unittest
+
+from keystone.common import cache
+
+
+class TestLRUCache(unittest.TestCase):
+    """Unit tests for keystone.common.cache.LRUCache"""
+
+    def test_get_set(self):
+        lru = cache.LRUCache(max_entries=10)
+        self.assertIsNone(lru.get('a'))
+        lru.set('a', 1)
+        self.assertEqual(1, lru.get('a'))
+        self.assertEqual(1, lru.hits)
+        self.assertEqual(1, lru.misses)
+
+    def test_disabled(self):
+        lru = cache.LRUCache(max_entries=0)
+        self.assertFalse(lru.enabled)
+        lru.set('a', 1)
+        self.assertIsNone(lru.get('a'))
+
+    def test_evicts_least_recently_used(self):
+        lru = cache.LRUCache(max_entries=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(1, lru.get('a'))
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(3, lru.get('c'))
+        self.assertEqual(1, lru.evictions)
+
+    def test_bounded_by_bytes(self):
+        lru = cache.LRUCache(max_entries=10, max_bytes=10)
+        lru.set('a', 'x', size=6)
+        lru.set('b', 'y', size=6)
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual('y', lru.get('b'))
+        self.assertEqual(6, lru.size)
+        lru.set('c', 'z', size=11)
+        self.assertIsNone(lru.get('c'))
+
+    def test_estimates_size(self):
+        lru = cache.LRUCache(max_entries=10, max_bytes=1000)
+        lru.set('a', 'x' * 100)
+        self.assertTrue(lru.size >= 100)
+
+    def test_expiry(self):
+        lru = cache.LRUCache(max_entries=10, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2, ttl=-1)
+        self.assertIsNone(lru.get('b'))
+        lru._entries['a'].expires = time.time() - 1
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(0, len(lru))
+
+    def test_invalidate_by_tag(self):
+        lru = cache.LRUCache(max_entries=10)
+        lru.set('a', 1, tags=['user:1', 'tenant:1'])
+        lru.set('b', 2, tags=['user:2', 'tenant:1'])
+        lru.set('c', 3, tags=['user:3'])
+        self.assertEqual(1, lru.invalidate('user:1'))
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(1, lru.invalidate('tenant:1'))
+        self.assertEqual(['c'], lru._entries.keys())
+
+    def test_set_after_invalidation_is_dropped(self):
+        lru = cache.LRUCache(max_entries=10)
+        generation = lru.generation
+        lru.invalidate('user:1')
+        lru.set('a', 1, generation=generation)
+        self.assertIsNone(lru.get('a'))
+        lru.set('a', 1, generation=lru.generation)
+        self.assertEqual(1, lru.get('a'))
+
+    def test_stats(self):
+        lru = cache.LRUCache(max_entries=10)
+        lru.set('a', 1)
+        lru.get('a')
+        lru.get('b')
+        stats = lru.stats()
+        self.assertEqual(1, stats['entries'])
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+
+
+class TestUidMap(unittest.TestCase):
+    """Unit tests for keystone.common.cache.UidMap"""
+
+    def test_both_directions(self):
+        uids = cache.UidMap(max_entries=10)
+        uids.add('abc', 1)
+        self.assertEqual(1, uids.get_id('abc'))
+        self.assertEqual('abc', uids.get_uid(1))
+        self.assertEqual('abc', uids.get_uid('1'))
+        self.assertIsNone(uids.get_id('def'))
+
+    def test_remove(self):
+        uids = cache.UidMap(max_entries=10)
+        uids.add('abc', 1)
+        uids.add('def', 2)
+        uids.remove(uid='abc')
+        self.assertIsNone(uids.get_id('abc'))
+        self.assertIsNone(uids.get_uid(1))
+        uids.remove(id=2)
+        self.assertIsNone(uids.get_id('def'))
+        self.assertIsNone(uids.get_uid(2))
+
+    def test_bounded(self):
+        uids = cache.UidMap(max_entries=2)
+        for i in range(3):
+            uids.add('uid%s' % i, i)
+        self.assertIsNone(uids.get_id('uid0'))
+        self.assertEqual(2, uids.get_id('uid2'))
+        self.assertEqual(2, uids.stats()['uid_to_id']['entries'])
+
+    def test_disabled(self):
+        uids = cache.UidMap(max_entries=0)
+        uids.add('abc', 1)
+        self.assertFalse(uids.enabled)
+        self.assertIsNone(uids.get_id('abc'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,6 +17,7 @@ from keystone.manage2.commands import create_token
 from keystone.manage2.commands import create_user
 from keystone.manage2.commands import delete_credential
 from keystone.manage2.commands import delete_endpoint_template
+from keystone.manage2.commands import delete_expired_tokens
 from keystone.manage2.commands import delete_role
 from keystone.manage2.commands import delete_service
 from keystone.manage2.commands import delete_tenant
@@ -997,6 +998,42 @@ class TestDeleteTokenCommand(CommandTestCase):
         self.assertNotIn(token_id, output)
 
 
+class TestDeleteExpiredTokensCommand(CommandTestCase):
+    def test_delete_expired_tokens(self):
+        user_id = self._create_user()
+        token_id = self._create_token(user_id)
+        expired_ids = []
+        for i in range(3):
+            self.run_cmd(create_token, [
+                '--user-id', user_id,
+                '--expires', '1999-12-31T23:59'])
+            expired_ids.append(self.ob.read_lines()[0])
+            self.ob.clear()
+
+        self.run_cmd(delete_expired_tokens, [
+            '--batch-size', '2'])
+        self.assertEqual('3', self.ob.read_lines()[0])
+
+        self.ob.clear()
+
+        self.run_cmd(list_tokens)
+        output = self.ob.read()
+        self.assertIn(token_id, output)
+        for expired_id in expired_ids:
+            self.assertNotIn(expired_id, output)
+
+    def test_delete_tokens_expired_before(self):
+        user_id = self._create_user()
+        self.run_cmd(create_token, [
+            '--user-id', user_id,
+            '--expires', '1999-12-31T23:59'])
+        self.ob.clear()
+
+        self.run_cmd(delete_expired_tokens, [
+            '--before', '1999-12-31T23:00'])
+        self.assertEqual('0', self.ob.read_lines()[0])
+
+
 class TestCreateCredentialCommand(CommandTestCase):
     def test_no_args(self):
         with self.assertRaises(SystemExit):
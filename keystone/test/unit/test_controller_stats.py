@@ -0,0 +1,45 @@
+import json
+from lxml import etree
+import unittest2 as unittest
+from webob import Request
+
+from keystone.controllers.stats import StatsController
+from keystone.test.unit.base import AdminAPITest
+
+
+class TestStatsController(AdminAPITest):
+    """Tests the counters reported by GET /stats"""
+
+    def setUp(self):
+        # configures the backends, before the fixtures are created
+        self.controller = StatsController()
+        super(TestStatsController, self).setUp()
+
+    def _get_stats(self, token, accept='application/json'):
+        req = Request.blank('/stats')
+        req.headers['X-Auth-Token'] = token
+        req.headers['Accept'] = accept
+        return self.controller.get_stats(req=req)
+
+    def test_get_stats(self):
+        response = self._get_stats(self.admin_token_id)
+        self.assertEqual(200, response.status_int)
+        stats = json.loads(response.body)['stats']
+        self.assertEqual(set(['servers', 'caches', 'backends']), set(stats))
+        self.assertIn('hits', stats['caches']['validate'])
+
+    def test_get_stats_xml(self):
+        response = self._get_stats(self.admin_token_id, 'application/xml')
+        dom = etree.fromstring(response.body)
+        self.assertEqual('{http://docs.openstack.org/identity/api/v2.0}stats',
+                         dom.tag)
+        names = [group.get('name') for group in dom]
+        self.assertEqual(['backends', 'caches', 'servers'], names)
+
+    def test_requires_admin(self):
+        response = self._get_stats(self.auth_token_id)
+        self.assertEqual(401, response.status_int)
+
+
+if __name__ == '__main__':
+    unittest.main()
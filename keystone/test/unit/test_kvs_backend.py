@@ -0,0 +1,151 @@
+import datetime
+import os
+import shutil
+import tempfile
+import time
+import unittest2 as unittest
+
+from keystone import config
+from keystone.backends import kvs
+from keystone.backends.kvs.api import token as token_api
+from keystone.models import Token
+
+
+class TestTokenStore(unittest.TestCase):
+    """Tests keystone.backends.kvs.TokenStore"""
+
+    def setUp(self):
+        self.now = time.time()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'tokens.snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _expires(self, seconds):
+        return datetime.datetime.fromtimestamp(self.now + seconds)
+
+    def test_put_get_find(self):
+        store = kvs.TokenStore(shards=4, now=self.now)
+        store.put('a', 'u1', 't1', self._expires(60), now=self.now)
+        store.put('b', 'u1', 't1', self._expires(120), now=self.now)
+        store.put('c', 'u1', None, self._expires(60), now=self.now)
+        self.assertEqual('u1', store.get('a', now=self.now).user_id)
+        self.assertEqual('b', store.find('u1', 't1', now=self.now))
+        self.assertEqual('c', store.find('u1', None, now=self.now))
+        store.delete('b', now=self.now)
+        self.assertEqual('a', store.find('u1', 't1', now=self.now))
+        self.assertEqual(2, len(store))
+
+    def test_expiry(self):
+        store = kvs.TokenStore(now=self.now)
+        store.put('a', 'u1', 't1', self._expires(60), now=self.now)
+        store.put('b', 'u1', 't1', self._expires(10), now=self.now)
+        # extended before it expires
+        store.put('b', 'u1', 't1', self._expires(90), now=self.now)
+        self.assertEqual(0, store.expire(self.now + 30))
+        self.assertEqual(1, store.expire(self.now + 61))
+        self.assertIsNone(store.get('a', now=self.now + 61))
+        self.assertEqual('b', store.find('u1', 't1', now=self.now + 61))
+        self.assertEqual(1, store.expire(self.now + 91))
+        self.assertEqual({}, store.index)
+
+    def test_events(self):
+        store = kvs.TokenStore(now=self.now)
+        for i in range(5):
+            store.add_event('token', i)
+        events, cursor, truncated = store.get_events(0, 3)
+        self.assertEqual([1, 2, 3], [event.id for event in events])
+        self.assertEqual((3, False), (cursor, truncated))
+        self.assertEqual(4, store.delete_events(datetime.datetime.max))
+        events, cursor, truncated = store.get_events(3, 10)
+        self.assertEqual(([5], 5, True),
+                         ([event.id for event in events], cursor, truncated))
+        self.assertEqual(([], 5, False), store.get_events(5, 10))
+
+    def test_snapshot(self):
+        store = kvs.TokenStore(snapshot_file=self.path, now=self.now)
+        store.put('a', 'u1', 't1', self._expires(60), now=self.now)
+        store.put('b', 'u1', None, self._expires(5), now=self.now)
+        store.put('c', 'u2', None, self._expires(60), now=self.now)
+        store.delete('c', now=self.now)
+        store.add_event('token', 'c')
+        store.snapshot.write('["t","trunc')
+        store.close()
+
+        store = kvs.TokenStore(snapshot_file=self.path, now=self.now + 10)
+        self.assertEqual(['a'], store.ids(now=self.now + 10))
+        self.assertEqual(self._expires(60),
+                         store.get('a', now=self.now + 10).expires)
+        self.assertEqual(1, store.last_event_id)
+        # compacted to the live records
+        with open(self.path) as snapshot:
+            self.assertEqual(2, len(snapshot.readlines()))
+        store.close()
+
+    def test_snapshot_locked(self):
+        store = kvs.TokenStore(snapshot_file=self.path, now=self.now)
+        self.assertRaises(IOError, kvs.TokenStore, snapshot_file=self.path)
+        store.close()
+        kvs.TokenStore(snapshot_file=self.path).close()
+
+    def test_compaction(self):
+        compact_min = kvs.COMPACT_MIN_RECORDS
+        kvs.COMPACT_MIN_RECORDS = 10
+        try:
+            store = kvs.TokenStore(snapshot_file=self.path, now=self.now)
+            for i in range(20):
+                store.put('a', 'u1', None, self._expires(60 + i),
+                          now=self.now)
+            self.assertTrue(store.records <= 10)
+            store.close()
+        finally:
+            kvs.COMPACT_MIN_RECORDS = compact_min
+        store = kvs.TokenStore(snapshot_file=self.path, now=self.now)
+        self.assertEqual(self._expires(79), store.get('a').expires)
+        store.close()
+
+
+class TestKvsTokenAPI(unittest.TestCase):
+    """Tests keystone.backends.kvs.api.token"""
+
+    def setUp(self):
+        self.original_store = kvs.STORE
+        kvs.STORE = kvs.TokenStore()
+        self.api = token_api.TokenAPI()
+        self.expires = datetime.datetime.now() + datetime.timedelta(hours=1)
+
+    def tearDown(self):
+        kvs.STORE = self.original_store
+
+    def test_refused_with_workers(self):
+        config.CONF.set_override('workers', 1)
+        try:
+            self.assertRaises(ValueError, kvs.configure_backend,
+                              {'backend_entities': "['Token']"})
+        finally:
+            config.CONF.set_override('workers', 0)
+
+    def test_token_api(self):
+        token = self.api.create(Token(id='a', user_id='u1', tenant_id='t1',
+                                      expires=self.expires))
+        self.assertEqual(Token(id='a', user_id='u1', tenant_id='t1',
+                               expires=self.expires), token)
+        self.api.create(Token(id='b', user_id='u1', expires=self.expires))
+        self.assertEqual('a', self.api.get_for_user_by_tenant('u1', 't1').id)
+        self.assertEqual('b', self.api.get_for_user('u1').id)
+        self.assertIsNone(self.api.get_for_user('u2'))
+
+        later = self.expires + datetime.timedelta(hours=1)
+        self.api.update('a', {'expires': later})
+        self.assertEqual(later, self.api.get('a').expires)
+
+        self.api.delete('a')
+        self.assertIsNone(self.api.get('a'))
+        self.assertEqual(['b'], [t.id for t in self.api.get_all()])
+        self.assertEqual(0, self.api.delete_expired(datetime.datetime.now(),
+                                                    100))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,7 +19,10 @@ from lxml import etree
 import unittest2 as unittest
 
 import base
+import keystone.backends.api as db_api
+from keystone.logic.catalog import ServiceCatalog
 from keystone.logic.types import auth as logic_auth
+from keystone.logic.types import fault
 from keystone import models
 from keystone.test import utils as test_utils
 
@@ -127,6 +130,82 @@ class LogicTypesAuthTestCase(base.ServiceAPITest):
         self.assertIn("versionId", endpoint.attrib)
         self.assertIn("tenantId", endpoint.attrib)
 
+    def test_AuthData_json_looks_up_service_once(self):
+        calls = []
+        get = db_api.SERVICE.get
+
+        def counting_get(id):
+            calls.append(id)
+            return get(id)
+
+        db_api.SERVICE.get = counting_get
+        try:
+            auth = logic_auth.AuthData(self.token, self.user, self.base_urls)
+            auth.to_json()
+        finally:
+            del db_api.SERVICE.get
+        self.assertEqual(["0"], calls)
+
+    def test_AuthData_renders_once(self):
+        auth = logic_auth.AuthData(self.token, self.user, self.base_urls)
+        body = auth.to_json()
+        self.assertTrue(body is auth.to_json())
+        self.assertTrue(auth.to_xml() is auth.to_xml())
+        self.assertNotEqual(body, auth.to_xml())
+
+    def test_AuthData_compiled_catalog(self):
+        catalog = ServiceCatalog.compile(self.tenant.id, self.base_urls,
+                                         db_api.SERVICE.get)
+        for url_types in (self.url_types, ["internal", "public"]):
+            auth = logic_auth.AuthData(self.token, self.user, self.base_urls,
+                                       url_types=url_types)
+            compiled = logic_auth.AuthData(self.token, self.user,
+                                           url_types=url_types,
+                                           catalog=catalog)
+            self.assertEqual(json.loads(auth.to_json()),
+                             json.loads(compiled.to_json()))
+            self.assertTrue(test_utils.XMLTools.xmlEqual(auth.to_xml(),
+                                                         compiled.to_xml()))
+
+    def test_compiled_catalog_unscoped(self):
+        catalog = ServiceCatalog.compile(None, self.base_urls,
+                                         db_api.SERVICE.get)
+        service, endpoints = catalog.select(self.url_types)[0]
+        self.assertEqual([[("region", "RegionOne"),
+                           ("adminURL", "http://private.net/v1/"),
+                           ("id", "1"),
+                           ("versionId", "v1")]], endpoints)
+
+    def test_TokenIds_parsing(self):
+        self.assertEqual(['a', 'b'], logic_auth.TokenIds.from_json(
+            '{"tokens": [{"id": "a"}, {"id": "b"}]}').token_ids)
+        self.assertEqual(['a', 'b'], logic_auth.TokenIds.from_xml(
+            '<tokens xmlns="http://docs.openstack.org/identity/api/v2.0">'
+            '<token id="a"/><token id="b"/></tokens>').token_ids)
+        self.assertRaises(fault.BadRequestFault,
+                          logic_auth.TokenIds.from_json, '{"tokens": [{}]}')
+        self.assertRaises(fault.BadRequestFault,
+                          logic_auth.TokenIds.from_json, '{}')
+
+    def test_ValidateDataList_serialization(self):
+        self.user.tenant_id = None
+        data = logic_auth.ValidateData(self.token, self.user)
+        error = fault.ItemNotFoundFault("Token does not exist.")
+        results = logic_auth.ValidateDataList([('abc123T', data),
+                                               ('unknown', error)])
+        tokens = json.loads(results.to_json())['tokens']
+        expected = json.loads(data.to_json())
+        expected['id'] = 'abc123T'
+        self.assertDictEqual(expected, tokens[0])
+        self.assertEqual('unknown', tokens[1]['id'])
+        self.assertEqual('404', tokens[1]['itemNotFound']['code'])
+
+        dom = etree.fromstring(results.to_xml())
+        self.assertEqual(['abc123T', 'unknown'],
+                         [token.get('id') for token in dom])
+        self.assertTrue(test_utils.XMLTools.xmlEqual(
+            data.to_xml(), etree.tostring(dom[0][0])))
+
 
 if __name__ == '__main__':
     unittest.main()
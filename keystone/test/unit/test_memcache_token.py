@@ -0,0 +1,161 @@
+import datetime
+import unittest2 as unittest
+
+from keystone.backends import memcache
+from keystone.backends.memcache.api import token as token_api
+from keystone.models import RevocationEvent, Token
+
+
+class FakeClient(object):
+    """Stands in for a python-memcached client, counting round trips"""
+
+    def __init__(self):
+        self.store = {}
+        self.calls = []
+
+    def get(self, key):
+        self.calls.append('get')
+        return self.store.get(key)
+
+    def get_multi(self, keys):
+        self.calls.append('get_multi')
+        return dict((key, self.store[key]) for key in keys
+                    if key in self.store)
+
+    def set(self, key, val, time=0):
+        self.calls.append('set')
+        self.store[key] = val
+        return True
+
+    def set_multi(self, mapping, time=0):
+        self.calls.append('set_multi')
+        self.store.update(mapping)
+        return []
+
+    def add(self, key, val, time=0):
+        self.calls.append('add')
+        return self.store.setdefault(key, val) is val
+
+    def incr(self, key):
+        self.calls.append('incr')
+        if key not in self.store:
+            return None
+        self.store[key] = str(int(self.store[key]) + 1)
+        return int(self.store[key])
+
+    def delete(self, key):
+        self.calls.append('delete')
+        self.store.pop(key, None)
+
+    def delete_multi(self, keys):
+        self.calls.append('delete_multi')
+        for key in keys:
+            self.store.pop(key, None)
+        return True
+
+
+class TestMemcacheTokenAPI(unittest.TestCase):
+    """Tests keystone.backends.memcache.api.token"""
+
+    def setUp(self):
+        self.client = FakeClient()
+        server = memcache.Memcache_Server('127.0.0.1:11211')
+        server.server = self.client
+        self.original_server = token_api.MEMCACHE_SERVER
+        token_api.MEMCACHE_SERVER = server
+        self.api = token_api.TokenAPI()
+        self.expires = datetime.datetime(2011, 12, 1, 10, 30, 0, 123)
+
+    def tearDown(self):
+        token_api.MEMCACHE_SERVER = self.original_server
+
+    def _create(self, id, tenant_id='1'):
+        return self.api.create(Token(id=id, user_id='u1', tenant_id=tenant_id,
+                                     expires=self.expires))
+
+    def test_codec_round_trip(self):
+        token = Token(id=u'abc', user_id='u1', tenant_id=None,
+                      expires=self.expires)
+        value = token_api.encode_token(token)
+        self.assertTrue(value.startswith(token_api.TOKEN_FORMAT))
+        self.assertEqual(token, token_api.decode_token(value))
+        self.assertIsNone(token_api.decode_token('T9:[]'))
+
+    def test_legacy_pickled_tokens(self):
+        legacy = Token(id='abc', user_id='u1', expires=self.expires)
+        del legacy['tenant_id']
+        self.client.store['abc'] = legacy
+        self.assertIsNone(self.api.get('abc').tenant_id)
+
+    def test_create_in_one_round_trip(self):
+        token = self._create('t1')
+        self.assertEqual('t1', token.id)
+        self.assertEqual(['set_multi'], self.client.calls)
+        self.assertEqual(self.expires, self.api.get('t1').expires)
+        self.assertEqual('t1',
+                         self.api.get_for_user_by_tenant('u1', '1').id)
+        self._create('t2', tenant_id=None)
+        self.assertEqual('t2', self.api.get_for_user('u1').id)
+
+    def test_get_many(self):
+        self._create('t1')
+        self._create('t2')
+        self.client.calls = []
+        tokens = self.api.get_many(['t1', 't2', 'missing'])
+        self.assertEqual(['t1', 't2'], sorted(tokens))
+        self.assertEqual(['get_multi'], self.client.calls)
+
+    def test_delete_keeps_later_user_token(self):
+        self._create('t1')
+        self._create('t2')
+        self.api.delete('t1')
+        self.assertIsNone(self.api.get('t1'))
+        self.assertEqual('t2',
+                         self.api.get_for_user_by_tenant('u1', '1').id)
+        self.api.delete('t2')
+        self.assertIsNone(self.api.get_for_user_by_tenant('u1', '1'))
+
+    def test_update_keeps_user_token_consistent(self):
+        self._create('t1')
+        later = self.expires + datetime.timedelta(hours=1)
+        self.api.update('t1', {'expires': later})
+        self.assertEqual(later,
+                         self.api.get_for_user_by_tenant('u1', '1').expires)
+        self._create('t2')
+        self.api.update('t1', {'expires': self.expires})
+        self.assertEqual('t2',
+                         self.api.get_for_user_by_tenant('u1', '1').id)
+
+    def test_revocation_event_not_stored_yet(self):
+        for user_id in ['u1', 'u2', 'u3']:
+            self.api.add_revocation_event('user', user_id)
+        # another server took id 2, and has not stored its event yet
+        pending = self.client.store.pop(token_api.EVENT_KEY % 2)
+        events, cursor, truncated = self.api.get_revocation_events(1, 10)
+        self.assertEqual([3], [event.id for event in events])
+        self.assertEqual((1, False), (cursor, truncated))
+        self.client.store[token_api.EVENT_KEY % 2] = pending
+        events, cursor, truncated = self.api.get_revocation_events(1, 10)
+        self.assertEqual([2, 3], [event.id for event in events])
+        self.assertEqual((3, False), (cursor, truncated))
+
+    def test_expired_revocation_events(self):
+        created = datetime.datetime.now() - datetime.timedelta(hours=1)
+        for id in range(1, 5):
+            self.api.add_revocation_event('user', 'u%d' % id)
+            self.client.store[token_api.EVENT_KEY % id] = \
+                token_api.encode_event(RevocationEvent(
+                    id=id, type='user', target_id='u%d' % id,
+                    created=created))
+        del self.client.store[token_api.EVENT_KEY % 2]
+        del self.client.store[token_api.EVENT_KEY % 4]
+        events, cursor, truncated = self.api.get_revocation_events(1, 10)
+        self.assertEqual([3], [event.id for event in events])
+        # the event 4 may not be stored yet
+        self.assertEqual((3, True), (cursor, truncated))
+        # missing ids that newer ids follow are skipped
+        self.assertEqual(([], 2, True), self.api.get_revocation_events(1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
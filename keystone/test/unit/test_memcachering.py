@@ -0,0 +1,237 @@
+import unittest2 as unittest
+
+from keystone.common import memcachering
+
+
+class FakeServer(object):
+    def __init__(self):
+        self.deaduntil = 0
+
+
+class FakeClient(object):
+    """Stands in for a python-memcached client bound to a single server"""
+
+    def __init__(self, host, store, down, calls):
+        self.host = host
+        self.store = store
+        self.down = down
+        self.calls = calls
+        self.servers = [FakeServer()]
+
+    def _check(self):
+        self.calls.append(self.host)
+        if self.host in self.down:
+            self.servers[0].deaduntil = 1
+            return False
+        return True
+
+    def get(self, key):
+        if self._check():
+            return self.store.get((self.host, key))
+
+    def set(self, key, val, time=0):
+        if self._check():
+            self.store[(self.host, key)] = val
+            return True
+        return 0
+
+    def delete(self, key):
+        if self._check():
+            return self.store.pop((self.host, key), None) is not None
+        return 0
+
+    def add(self, key, val, time=0):
+        if self._check() and (self.host, key) not in self.store:
+            return self.set(key, val, time)
+        return 0
+
+    def incr(self, key, delta=1):
+        if self._check() and (self.host, key) in self.store:
+            value = int(self.store[(self.host, key)]) + delta
+            self.store[(self.host, key)] = value
+            return value
+
+    def get_multi(self, keys):
+        if self._check():
+            return dict((key, self.store[(self.host, key)]) for key in keys
+                        if (self.host, key) in self.store)
+        return {}
+
+    def set_multi(self, mapping, time=0):
+        if self._check():
+            for key, val in mapping.items():
+                self.store[(self.host, key)] = val
+            return []
+        return mapping.keys()
+
+    def delete_multi(self, keys):
+        if self._check():
+            for key in keys:
+                self.store.pop((self.host, key), None)
+            return 1
+        return 0
+
+
+class FakeMemcacheRing(memcachering.MemcacheRing):
+    def __init__(self, *args, **kwargs):
+        super(FakeMemcacheRing, self).__init__(*args, **kwargs)
+        self.store = {}
+        self.down = set()
+        self.calls = []
+        self.created = 0
+
+    def _new_client(self, host):
+        self.created += 1
+        return FakeClient(host, self.store, self.down, self.calls)
+
+    def hosts_of(self, key):
+        return set(host for host, k in self.store if k == key)
+
+
+class TestMemcacheRing(unittest.TestCase):
+    """Tests keystone.common.memcachering.MemcacheRing"""
+
+    hosts = '10.0.0.1:11211, 10.0.0.2:11211,10.0.0.3:11211'
+
+    def test_parse_hosts(self):
+        self.assertEqual(['10.0.0.1:11211', '10.0.0.2:11211',
+                          '10.0.0.3:11211'],
+                         memcachering.parse_hosts(self.hosts))
+        self.assertRaises(ValueError, memcachering.MemcacheRing, '')
+        self.assertEqual([('10.0.0.1:11211', 3), ('10.0.0.2:11211', 1)],
+                         memcachering.parse_weighted_hosts(
+                             '10.0.0.1:11211:3,10.0.0.2:11211'))
+        self.assertRaises(ValueError, memcachering.MemcacheRing,
+                          '10.0.0.1:11211:0')
+
+    def test_set_get_delete(self):
+        ring = FakeMemcacheRing(self.hosts)
+        ring.set('tokens/a', 'claims', time=10)
+        self.assertEqual('claims', ring.get('tokens/a'))
+        ring.delete('tokens/a')
+        self.assertIsNone(ring.get('tokens/a'))
+
+    def test_spreads_keys(self):
+        ring = FakeMemcacheRing(self.hosts)
+        for i in range(100):
+            ring.set('tokens/%s' % i, i)
+        used = set(host for host, _key in ring.store)
+        self.assertEqual(3, len(used))
+
+    def test_reuses_clients(self):
+        ring = FakeMemcacheRing('10.0.0.1:11211')
+        for i in range(10):
+            ring.set('tokens/%s' % i, i)
+            ring.get('tokens/%s' % i)
+        self.assertEqual(1, ring.created)
+
+    def test_server_failure_moves_only_its_keys(self):
+        ring = FakeMemcacheRing(self.hosts)
+        keys = ['tokens/%s' % i for i in range(100)]
+        owners = dict((key, list(ring._hosts_for(key))[0]) for key in keys)
+        ring.down.add('10.0.0.2:11211')
+        for key in keys:
+            ring.set(key, key)
+        for key in keys:
+            self.assertEqual(key, ring.get(key))
+            (host,) = [host for host, k in ring.store if k == key]
+            if owners[key] != '10.0.0.2:11211':
+                self.assertEqual(owners[key], host)
+            else:
+                self.assertNotEqual('10.0.0.2:11211', host)
+
+    def test_weights(self):
+        ring = FakeMemcacheRing('10.0.0.1:11211:3,10.0.0.2:11211')
+        for i in range(400):
+            ring.set('tokens/%s' % i, i)
+        heavy = len([1 for host, _key in ring.store
+                     if host == '10.0.0.1:11211'])
+        self.assertTrue(250 < heavy < 350, heavy)
+
+    def test_adding_server_moves_only_its_share(self):
+        keys = ['tokens/%s' % i for i in range(1000)]
+        ring = FakeMemcacheRing(self.hosts)
+        before = dict((key, list(ring._hosts_for(key))[0]) for key in keys)
+        ring = FakeMemcacheRing(self.hosts + ',10.0.0.4:11211')
+        moved = 0
+        for key in keys:
+            owner = list(ring._hosts_for(key))[0]
+            if owner != before[key]:
+                self.assertEqual('10.0.0.4:11211', owner)
+                moved += 1
+        self.assertTrue(150 < moved < 350, moved)
+
+    def test_replicas(self):
+        ring = FakeMemcacheRing(self.hosts, replicas=2)
+        ring.set('tokens/a', 'claims')
+        owners = list(ring._hosts_for('tokens/a'))
+        self.assertEqual(set(owners[:2]), ring.hosts_of('tokens/a'))
+
+        # reads fall back to the replica
+        ring.down.add(owners[0])
+        self.assertEqual('claims', ring.get('tokens/a'))
+        # and writes go to the next live servers
+        ring.set('tokens/a', 'other claims')
+        self.assertEqual(set(owners), ring.hosts_of('tokens/a'))
+
+        # the server back from its failure holds an older version
+        ring.down.clear()
+        ring._dead.clear()
+        self.assertEqual('other claims', ring.get('tokens/a'))
+
+    def test_stale_server_without_replicas(self):
+        ring = FakeMemcacheRing(self.hosts)
+        ring.set('tokens/a', 'claims')
+        ring.set('tokens/b', 'claims')
+        owner = list(ring._hosts_for('tokens/a'))[0]
+        ring.down.add(owner)
+        ring.delete('tokens/a')
+        self.assertIsNone(ring.get('tokens/a'))
+
+        # a server marked dead (e.g. after a slow reply) keeps its keys,
+        # but the deletes made meanwhile hide its older values
+        ring.down.clear()
+        ring._dead.clear()
+        self.assertIn(owner, ring.hosts_of('tokens/a'))
+        self.assertIsNone(ring.get('tokens/a'))
+        self.assertIsNone(ring.get_multi(['tokens/a']).get('tokens/a'))
+        self.assertEqual('claims', ring.get('tokens/b'))
+
+    def test_multi(self):
+        ring = FakeMemcacheRing(self.hosts, replicas=2)
+        values = dict(('tokens/%s' % i, i) for i in range(30))
+        self.assertEqual([], ring.set_multi(values))
+        # one call per server and replica
+        self.assertEqual(6, len(ring.calls))
+        for key in values:
+            self.assertEqual(2, len(ring.hosts_of(key)))
+
+        ring.down.add('10.0.0.2:11211')
+        ring.calls[:] = []
+        self.assertEqual(values, ring.get_multi(values.keys() + ['x']))
+        # at most one call per server and round, whatever the keys
+        self.assertTrue(len(ring.calls) <= 9)
+
+        ring.delete_multi(values.keys())
+        ring.down.clear()
+        ring._dead.clear()
+        self.assertEqual({}, ring.get_multi(values.keys()))
+
+    def test_counters(self):
+        ring = FakeMemcacheRing(self.hosts, replicas=2)
+        self.assertIsNone(ring.incr('n'))
+        self.assertTrue(ring.add('n', '0'))
+        self.assertFalse(ring.add('n', '0'))
+        self.assertEqual(1, ring.incr('n'))
+        self.assertEqual(set([list(ring._hosts_for('n'))[0]]),
+                         ring.hosts_of('n'))
+
+    def test_all_servers_down(self):
+        ring = FakeMemcacheRing(self.hosts)
+        ring.down.update(memcachering.parse_hosts(self.hosts))
+        self.assertEqual(0, ring.set('tokens/a', 'claims'))
+        self.assertIsNone(ring.get('tokens/a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
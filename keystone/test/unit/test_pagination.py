@@ -0,0 +1,108 @@
+import unittest2 as unittest
+
+import keystone.backends.api as db_api
+from keystone.backends.sqlalchemy import get_session, models
+from keystone.backends.sqlalchemy.pagination import paginate
+from keystone.test.unit.base import ServiceAPITest
+
+
+class TestPaginate(ServiceAPITest):
+    """Tests keystone.backends.sqlalchemy.pagination"""
+
+    def setUp(self):
+        super(TestPaginate, self).setUp()
+        for i in range(10):
+            db_api.TENANT.create({'name': 'page-tenant-%s' % i,
+                                  'enabled': True})
+        self.session = get_session()
+        self.query = self.session.query(models.Tenant)
+        self.ids = [tenant.id for tenant in
+                    self.query.order_by(models.Tenant.id).all()]
+
+    def _walk(self, limit):
+        """Follows the next markers and returns the pages seen"""
+        pages = []
+        marker = None
+        while True:
+            rows, prev, next = paginate(self.query, models.Tenant.id,
+                                        marker, limit)
+            pages.append(([row.id for row in rows], prev, next))
+            if next is None:
+                return pages
+            marker = next
+
+    def test_pages(self):
+        pages = self._walk(3)
+        self.assertEqual(self.ids, sum([ids for ids, _p, _n in pages], []))
+        for ids, _prev, _next in pages[:-1]:
+            self.assertEqual(3, len(ids))
+        # the first and second pages have no prev marker to follow
+        self.assertIsNone(pages[0][1])
+        self.assertIsNone(pages[1][1])
+        # following a prev marker returns the previous page
+        for index in range(2, len(pages)):
+            rows, _prev, _next = paginate(self.query, models.Tenant.id,
+                                          pages[index][1], 3)
+            self.assertEqual(pages[index - 1][0], [row.id for row in rows])
+
+    def test_exact_pages(self):
+        limit = len(self.ids)
+        rows, prev, next = paginate(self.query, models.Tenant.id, None, limit)
+        self.assertEqual(self.ids, [row.id for row in rows])
+        self.assertIsNone(prev)
+        self.assertIsNone(next)
+
+    def test_empty_marker(self):
+        first = paginate(self.query, models.Tenant.id, None, 2)
+        self.assertEqual(first, paginate(self.query, models.Tenant.id, '', 2))
+
+    def test_multiple_entities(self):
+        query = self.session.query(models.Tenant, models.Tenant.name)
+        rows, prev, next = paginate(query, models.Tenant.id, self.ids[0], 2)
+        self.assertEqual(self.ids[1:3], [tenant.id for tenant, _n in rows])
+        self.assertEqual(rows[0][0].name, rows[0][1])
+        self.assertEqual(self.ids[2], next)
+
+    def test_get_page(self):
+        tenants = db_api.TENANT.get_page(None, 4)
+        prev, next = db_api.TENANT.get_page_markers(None, 4)
+        self.assertIsNone(prev)
+        self.assertEqual(4, len(tenants))
+        tenants = db_api.TENANT.get_page(next, 4)
+        self.assertEqual(self.ids[4:8],
+                         [int(db_api.TENANT.uid_to_id(tenant.id))
+                          for tenant in tenants])
+
+    def test_get_page_with_markers(self):
+        for api in (db_api.TENANT, db_api.USER, db_api.ROLE,
+                    db_api.ENDPOINT_TEMPLATE, db_api.SERVICE):
+            for marker in (None, '', self.ids[1]):
+                page, prev, next = api.get_page_with_markers(marker, 1)
+                self.assertEqual([row.id for row in api.get_page(marker, 1)],
+                                 [row.id for row in page])
+                self.assertEqual(tuple(api.get_page_markers(marker, 1)),
+                                 (prev, next))
+
+    def test_list_for_user(self):
+        granted = [db_api.TENANT.get_by_name('page-tenant-%s' % i)
+                   for i in (2, 5)]
+        role = db_api.ROLE.get_all()[0]
+        for tenant in granted:
+            db_api.USER.user_role_add({'user_id': self.auth_user['id'],
+                                       'tenant_id': tenant.id,
+                                       'role_id': role.id})
+        user_id = self.auth_user['id']
+        tenants = db_api.TENANT.list_for_user_get_page(user_id, None, 1)
+        self.assertEqual([granted[0].id], [tenant.id for tenant in tenants])
+        prev, next = db_api.TENANT.list_for_user_get_page_markers(user_id,
+                                                                  None, 1)
+        self.assertIsNone(prev)
+        tenants = db_api.TENANT.list_for_user_get_page(user_id, next, 1)
+        self.assertEqual([granted[1].id], [tenant.id for tenant in tenants])
+        self.assertEqual((None, None),
+                         db_api.TENANT.list_for_user_get_page_markers(
+                             user_id, next, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
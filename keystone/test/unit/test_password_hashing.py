@@ -0,0 +1,86 @@
+import eventlet
+import unittest2 as unittest
+
+from keystone import config
+from keystone import server
+from keystone.backends import backendutils
+
+
+class TestPasswordHashing(unittest.TestCase):
+    """Tests hashing and verifying passwords in keystone.backends.backendutils
+    """
+
+    def tearDown(self):
+        config.CONF.set_override('password_hash_pool', None)
+        config.CONF.set_override('password_hash_workers', 0)
+        config.CONF.set_override('workers', 0)
+        backendutils.configure_hashing(None)
+
+    def _check(self):
+        values = {'password': 'secret'}
+        backendutils.set_hashed_password(values)
+        self.assertNotEqual('secret', values['password'])
+        self.assertTrue(backendutils.check_password('secret',
+                                                    values['password']))
+        self.assertFalse(backendutils.check_password('wrong',
+                                                     values['password']))
+
+    def test_inline(self):
+        before = backendutils.get_hashing_stats()
+        self._check()
+        stats = backendutils.get_hashing_stats()
+        self.assertEqual('inline', stats['pool'])
+        self.assertEqual(before['hash']['count'] + 1, stats['hash']['count'])
+        self.assertEqual(before['verify']['count'] + 2,
+                         stats['verify']['count'])
+        self.assertTrue(stats['verify']['max_ms'] > 0)
+
+    def test_thread_pool(self):
+        backendutils.configure_hashing('thread')
+        self._check()
+        self.assertEqual('thread', backendutils.get_hashing_stats()['pool'])
+
+    def test_process_pool(self):
+        backendutils.configure_hashing('process', 1)
+        self._check()
+        stats = backendutils.get_hashing_stats()
+        self.assertEqual('process', stats['pool'])
+        self.assertEqual(1, stats['workers'])
+
+    def test_process_pool_keeps_hub_running(self):
+        backendutils.configure_hashing('process', 1)
+        hashed = backendutils.hash_password('secret')
+        ticks = []
+
+        def tick():
+            while True:
+                ticks.append(1)
+                eventlet.sleep(0.001)
+
+        ticker = eventlet.spawn(tick)
+        try:
+            eventlet.sleep(0)
+            del ticks[:]
+            self.assertTrue(backendutils.check_password('secret', hashed))
+        finally:
+            ticker.kill()
+        self.assertTrue(len(ticks) > 10)
+
+    def test_process_pool_started_before_bind(self):
+        config.CONF.set_override('password_hash_pool', 'process')
+        config.CONF.set_override('password_hash_workers', 1)
+        keystone = server.Server()
+        keystone.bind('127.0.0.1', 0)
+        keystone.socket.close()
+        # pylint: disable=W0212
+        self.assertIsNotNone(backendutils._PROCESS_POOL)
+
+        config.CONF.set_override('workers', 2)
+        self.assertRaises(ValueError, keystone.bind, '127.0.0.1', 0)
+
+    def test_unsupported_pool(self):
+        self.assertRaises(ValueError, backendutils.configure_hashing, 'gpu')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import httplib
+import os
+import signal
+import time
+import unittest2 as unittest
+
+import eventlet
+
+from keystone.common import prefork
+from keystone.common import wsgi
+
+
+def pid_app(env, start_response):
+    """Returns the pid of the worker, after sleeping if asked to"""
+    if env['PATH_INFO'] == '/slow':
+        eventlet.sleep(1)
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(os.getpid())]
+
+
+class TestSupervisor(unittest.TestCase):
+    """Tests keystone.common.prefork with real worker processes"""
+
+    def setUp(self):
+        self.socket = eventlet.listen(('127.0.0.1', 0))
+        self.port = self.socket.getsockname()[1]
+        self.supervisor_pid = os.fork()
+        if self.supervisor_pid == 0:
+            status = 0
+            try:
+                prefork.Supervisor(self._serve, 2).run()
+            except BaseException:  # pylint: disable=W0703
+                status = 1
+            os._exit(status)  # pylint: disable=W0212
+        self.socket.close()
+
+    def tearDown(self):
+        if self.supervisor_pid:
+            self._stop_supervisor()
+
+    def _serve(self, slot):
+        server = wsgi.Server()
+        server.start(pid_app, self.port, socket=self.socket)
+        return [server]
+
+    def _get(self, path='/'):
+        connection = httplib.HTTPConnection('127.0.0.1', self.port)
+        connection.request('GET', path, headers={'Connection': 'close'})
+        return connection.getresponse().read()
+
+    def _worker_pids(self, count=2):
+        """Returns the pids of the workers answering, once count of them
+        have"""
+        pids = set()
+        for _i in range(200):
+            pids.add(self._get())
+            if len(pids) == count:
+                return pids
+        self.fail("%s workers answered, not %s" % (len(pids), count))
+
+    def _stop_supervisor(self):
+        os.kill(self.supervisor_pid, signal.SIGTERM)
+        _pid, status = os.waitpid(self.supervisor_pid, 0)
+        self.supervisor_pid = None
+        return status
+
+    def test_workers_share_socket(self):
+        pids = self._worker_pids()
+        self.assertNotIn(str(self.supervisor_pid), pids)
+        self.assertEqual(0, self._stop_supervisor())
+
+    def test_dead_worker_is_replaced(self):
+        pids = self._worker_pids()
+        killed = pids.pop()
+        os.kill(int(killed), signal.SIGKILL)
+        time.sleep(prefork.RESTART_DELAY + 0.5)
+        self.assertNotIn(killed, self._worker_pids())
+
+    def test_reload_drains_requests(self):
+        old_pids = self._worker_pids()
+        connection = httplib.HTTPConnection('127.0.0.1', self.port)
+        connection.request('GET', '/slow', headers={'Connection': 'close'})
+        time.sleep(0.2)
+        os.kill(self.supervisor_pid, signal.SIGHUP)
+        # the request in progress completes in an old worker
+        self.assertIn(connection.getresponse().read(), old_pids)
+        time.sleep(0.5)
+        new_pids = self._worker_pids()
+        self.assertFalse(old_pids & new_pids)
+        self.assertEqual(0, self._stop_supervisor())
+
+
+if __name__ == '__main__':
+    unittest.main()
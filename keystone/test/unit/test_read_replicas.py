@@ -0,0 +1,79 @@
+import eventlet
+import unittest2 as unittest
+
+from keystone import config
+import keystone.backends.api as db_api
+import keystone.backends.sqlalchemy as db
+from keystone.test.unit.base import ServiceAPITest
+
+CONF = config.CONF
+GROUP = 'keystone.backends.sqlalchemy'
+
+
+class TestReadReplicas(ServiceAPITest):
+    """Tests routing read-only queries to a read replica
+
+    The replica is an empty in-memory database, so reads answered by the
+    replica find nothing."""
+
+    def setUp(self):
+        CONF.set_override('sql_read_connections', ['sqlite://'], group=GROUP)
+        super(TestReadReplicas, self).setUp()
+
+    def tearDown(self):
+        CONF.set_override('sql_read_connections', None, group=GROUP)
+        super(TestReadReplicas, self).tearDown()
+
+    def test_reads_after_write_go_to_primary(self):
+        self.assertEqual(self.auth_token_id,
+                         db_api.TOKEN.get(self.auth_token_id).id)
+
+    def test_reads_go_to_replica(self):
+        db._REQUEST.last_write = 0
+        self.assertIsNone(db_api.USER.get(self.auth_user['id']))
+        self.assertEqual([], db_api.ROLE.list_global_roles_for_user(
+            self.auth_user['id']))
+        # queries not routed to replicas still go to the primary
+        self.assertTrue(db_api.USER.get_all())
+
+    def test_write_moves_reads_to_primary(self):
+        db._REQUEST.last_write = 0
+        self.assertIsNone(db_api.USER.get(self.auth_user['id']))
+        db_api.TOKEN.update(self.auth_token_id, {'expires': self.expires})
+        self.assertEqual(self.auth_user['id'],
+                         db_api.USER.get(self.auth_user['id']).id)
+
+    def test_writes_of_other_requests_keep_reads_on_replica(self):
+        db._REQUEST.last_write = 0
+        eventlet.spawn(db_api.TOKEN.update, self.auth_token_id,
+                       {'expires': self.expires}).wait()
+        self.assertIsNone(db_api.USER.get(self.auth_user['id']))
+
+    def test_token_reads_retried_on_primary(self):
+        db._REQUEST.last_write = 0
+        token_id = self.auth_token_id
+        self.assertEqual(token_id, db_api.TOKEN.get(token_id).id)
+        self.assertIsNotNone(db_api.TOKEN.get_for_user(
+            self.auth_user['id']))
+        view = db_api.TOKEN.get_validation_view(token_id)
+        self.assertEqual(token_id, view['token'].id)
+        self.assertEqual([token_id],
+                         db_api.TOKEN.get_validation_views([token_id]).keys())
+        self.assertIsNone(db_api.TOKEN.get('missing'))
+
+    def test_uid_translations_retried_on_primary(self):
+        tenant = db_api.TENANT.create({'name': 'replicated', 'enabled': True})
+        db._REQUEST.last_write = 0
+        user_id = db_api.USER.uid_to_id(self.auth_user['id'])
+        self.assertIsNotNone(user_id)
+        self.assertEqual(self.auth_user['id'], db_api.USER.id_to_uid(user_id))
+        tenant_id = db_api.TENANT.uid_to_id(tenant.id)
+        self.assertIsNotNone(tenant_id)
+        self.assertEqual(tenant.id, db_api.TENANT.id_to_uid(tenant_id))
+
+    def test_stats(self):
+        self.assertEqual(1, len(db.get_stats()['read_pools']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest2 as unittest
+
+from keystone import backends
+import keystone.backends.api as db_api
+import keystone.backends.sqlalchemy as db
+from keystone.frontends.request_scope import RequestScopeFilter
+from keystone.test.unit.base import ServiceAPITest
+
+
+class TestRequestScope(ServiceAPITest):
+    """Tests sharing a database connection between the backend calls of a
+    request"""
+
+    def _checkouts(self):
+        return db.get_stats()['pool']['checkouts']
+
+    def _backend_calls(self):
+        self.assertIsNotNone(db_api.USER.get(self.auth_user['id']))
+        self.assertTrue(db_api.ROLE.get_all())
+        self.assertIsNotNone(db_api.TOKEN.get(self.auth_token_id))
+
+    def test_without_scope(self):
+        # without translating uids, which would check out connections too
+        self.enable_uid_caches()
+        self._backend_calls()
+        checkouts = self._checkouts()
+        self._backend_calls()
+        self.assertEqual(checkouts + 3, self._checkouts())
+
+    def test_scope_checks_out_one_connection(self):
+        checkouts = self._checkouts()
+        backends.open_request_scope()
+        try:
+            self._backend_calls()
+            # nested scopes reuse the connection
+            backends.open_request_scope()
+            self._backend_calls()
+            backends.close_request_scope()
+            self._backend_calls()
+        finally:
+            backends.close_request_scope()
+        self.assertEqual(checkouts + 1, self._checkouts())
+        stats = db.get_stats()['pool']
+        self.assertEqual(stats['checkouts'], stats['checkins'])
+
+    def test_transactions_in_scope(self):
+        backends.open_request_scope()
+        try:
+            db_api.USER.update(self.auth_user['id'], {'email': 'x@y.z'})
+            self.assertEqual('x@y.z',
+                             db_api.USER.get(self.auth_user['id']).email)
+        finally:
+            backends.close_request_scope()
+        self.assertEqual('x@y.z', db_api.USER.get(self.auth_user['id']).email)
+
+    def test_filter(self):
+        def app(env, start_response):
+            self._backend_calls()
+            return ['ok']
+
+        checkouts = self._checkouts()
+        self.assertEqual(['ok'], RequestScopeFilter(app, {})({}, None))
+        self.assertEqual(checkouts + 1, self._checkouts())
+
+    def test_backend_stats(self):
+        stats = backends.get_backend_stats()
+        self.assertIn('keystone.backends.sqlalchemy', stats)
+        self.assertIn('checkouts',
+                      stats['keystone.backends.sqlalchemy']['pool'])
+        self.assertEqual('inline', stats['passwords']['pool'])
+
+
+class FakeConf(object):
+    sql_idle_timeout = None
+    sql_pool_size = 20
+    sql_max_overflow = 5
+    sql_pool_timeout = None
+
+
+class TestPoolArgs(unittest.TestCase):
+    """Tests the engine arguments configuring the connection pool"""
+
+    @staticmethod
+    def _pool_args(connection_str):
+        conf = FakeConf()
+        return db.Driver._pool_args(conf, connection_str)
+
+    def test_server_database(self):
+        self.assertEqual({'pool_recycle': db.DEFAULT_POOL_RECYCLE,
+                          'pool_size': 20,
+                          'max_overflow': 5},
+                         self._pool_args('mysql://keystone@localhost/ks'))
+
+    def test_sqlite(self):
+        self.assertEqual({'pool_recycle': db.DEFAULT_POOL_RECYCLE},
+                         self._pool_args('sqlite:///keystone.db'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,87 +1,67 @@
+import ConfigParser
+import os
 import unittest2 as unittest
-from StringIO import StringIO
-import datetime
-import webob
-from lxml import etree
-import json
 
-from keystone import utils
-from keystone.logic.types import auth
-import keystone.logic.types.fault as fault
+from keystone import config
+from keystone import server
+from keystone.test import BASE_DIR
 
+CONF = config.CONF
+GROUP = 'keystone.backends.sqlalchemy'
 
-class TestServer(unittest.TestCase):
-    '''Unit tests for server.py.'''
 
-    request = None
-    auth_data = None
+class TestServerWorkers(unittest.TestCase):
+    """Tests that workers are refused while the in-process caches, which
+    the workers would not share, are enabled"""
 
     def setUp(self):
-        environ = {'wsgi.url_scheme': 'http'}
-        self.request = webob.Request(environ)
-        self.auth_data = auth.ValidateData(auth.Token(datetime.date.today(),
-            "2231312"), auth.User("id", "username", "12345", "aTenant"))
-
-    #def tearDown(self):
-
-    def test_is_xml_response(self):
-        self.assertFalse(utils.is_xml_response(self.request))
-        self.request.headers["Accept"] = "application/xml"
-        self.request.content_type = "application/json"
-        self.assertTrue(utils.is_xml_response(self.request))
-
-    def test_send_result_xml(self):
-        self.request.headers["Accept"] = "application/xml"
-        response = utils.send_result(200, self.request, self.auth_data)
-
-        self.assertTrue(response.headers['content-type'] ==
-            "application/xml; charset=UTF-8")
-        xml = etree.fromstring(response.unicode_body)
-
-        user = xml.find("{http://docs.openstack.org/identity/api/v2.0}user")
-        token = xml.find("{http://docs.openstack.org/identity/api/v2.0}token")
-
-        self.assertTrue(user.get("name"), "username")
-        self.assertTrue(user.get("id"), "id")
-        self.assertTrue(user.get("tenantId"), '12345')
-        self.assertTrue(token.get("id"), '2231312')
-        self.assertTrue(token.get("expires"), datetime.date.today())
-
-    def test_send_result_json(self):
-        self.request.headers["Accept"] = "application/json"
-        response = utils.send_result(200, self.request, self.auth_data)
-        self.assertTrue(response.headers['content-type'] ==
-            "application/json; charset=UTF-8")
-        dict = json.loads(response.unicode_body)
-        self.assertTrue(dict['access']['user']['id'], 'id')
-        self.assertTrue(dict['access']['user']['name'], 'username')
-        self.assertTrue(dict['access']['user']['tenantId'], '12345')
-        self.assertTrue(dict['access']['token']['id'], '2231312')
-        self.assertTrue(dict['access']['token']['expires'],
-            datetime.date.today())
-
-    def test_get_auth_token(self):
-        self.request.headers["X-Auth-Token"] = "Test token"
-        self.assertTrue(utils.get_auth_token(self.request), "Test Token")
-
-    def test_get_normalized_request_content_exception(self):
-        self.assertRaises(fault.IdentityFault,
-            utils.get_normalized_request_content, None, self.request)
-
-    def test_get_normalized_request_content_xml(self):
-        self.request.environ["CONTENT_TYPE"] = "application/xml"
-        auth.AuthWithPasswordCredentials("username", "password", "1")
-        body = '<?xml version="1.0" encoding="UTF-8"?> \
-                <auth xmlns="http://docs.openstack.org/identity/api/v2.0">\
-                <passwordCredentials \
-                xmlns="http://docs.openstack.org/identity/api/v2.0" \
-                password="secret" username="disabled" \
-                /></auth>'
-        str = StringIO()
-        str.write(body)
-        self.request.environ["wsgi.input"] = str
-        self.request.environ["CONTENT_LENGTH"] = str.len
-        #TODO: I THINK THIS belongs in a test for auth.py.
+        CONF.set_override('workers', 2)
+        CONF.set_override('uid_cache_max_entries', 0, group=GROUP)
+        self.server = server.Server()
+
+    def tearDown(self):
+        CONF.set_override('workers', 0)
+        CONF.set_override('uid_cache_max_entries', None, group=GROUP)
+        CONF.set_override('validate_cache_max_entries', None)
+        CONF.set_override('catalog_cache_max_entries', None)
+        CONF.set_override('password_cache_max_entries', None)
+        CONF.set_override('password_hash_pool', None)
+        if self.server.socket is not None:
+            self.server.socket.close()
+
+    def test_workers_without_caches(self):
+        self.server.bind('127.0.0.1', 0)
+        self.assertIsNotNone(self.server.socket)
+
+    def test_workers_with_shipped_config(self):
+        shipped = ConfigParser.RawConfigParser()
+        shipped.read(os.path.join(BASE_DIR, 'etc', 'keystone.conf'))
+        options = [(name, value, None)
+                   for name, value in shipped.defaults().items()]
+        options += [(name, value, GROUP)
+                    for name, value in shipped.items(GROUP)
+                    if name not in shipped.defaults()]
+        for name, value, group in options:
+            if name.endswith('_cache_max_entries'):
+                CONF.set_override(name, int(value), group=group)
+        CONF.set_override('password_hash_pool',
+                          shipped.get('DEFAULT', 'password_hash_pool') or None)
+        self.server.bind('127.0.0.1', 0)
+        self.assertIsNotNone(self.server.socket)
+
+    def test_workers_with_default_config(self):
+        CONF.set_override('uid_cache_max_entries', None, group=GROUP)
+        self.server.bind('127.0.0.1', 0)
+        self.assertIsNotNone(self.server.socket)
+
+    def test_workers_refuse_caches(self):
+        CONF.set_override('validate_cache_max_entries', 100)
+        self.assertRaises(ValueError, self.server.bind, '127.0.0.1', 0)
+        self.assertIsNone(self.server.socket)
+
+    def test_workers_refuse_uid_cache(self):
+        CONF.set_override('uid_cache_max_entries', 100, group=GROUP)
+        self.assertRaises(ValueError, self.server.bind, '127.0.0.1', 0)
 
 
 if __name__ == '__main__':
@@ -1,9 +1,24 @@
 import datetime as dt
 import unittest2 as unittest
 
+from keystone import config
+import keystone.backends.api as db_api
+from keystone.backends.sqlalchemy import get_session, models
+from keystone.backends.sqlalchemy.api import tenant as tenant_api
+from keystone.backends.sqlalchemy.pagination import paginate
+from keystone.common.cache import LRUCache
+from keystone.common import signing
+from keystone.logic.catalog import CatalogCompiler
+from keystone.logic.reaper import TokenReaper
 import keystone.logic.service as service
-from keystone.test.unit.base import ServiceAPITest, AdminAPITest
+from keystone.logic.types.endpoint import EndpointTemplate
+from keystone.logic.types.user import User
+from keystone.managers.user import Manager as UserManager
+from keystone.models import RevocationEvent
+from keystone.test.unit.base import ServiceAPITest, AdminAPITest, \
+    signing_key
 from keystone.logic.types.fault import ItemNotFoundFault, UnauthorizedFault
+from keystone.logic.types import auth
 from keystone.logic.types.auth import ValidateData
 
 
@@ -49,6 +64,314 @@ class TestServiceLogic(AdminAPITest):
         data = self.api.validate_token(self.admin_token_id, self.auth_token_id)
         self.assertTrue(isinstance(data, ValidateData))
 
+    def _create_scoped_token(self):
+        db_api.USER.user_role_add({'user_id': self.auth_user["id"],
+                                   'tenant_id': 'tenant1',
+                                   'role_id': self.role_fixtures[1]["id"]})
+        return self.fixture_create_token(id='SCOPEDTOKEN',
+                                         user_id=self.auth_user["id"],
+                                         tenant_id='tenant1',
+                                         expires=self.expires)
+
+    def test_validate_token_renders_roles(self):
+        self._create_scoped_token()
+        data = self.api.validate_token(self.admin_token_id, 'SCOPEDTOKEN')
+        self.assertEqual(self.auth_user["id"], data.user.id)
+        self.assertEqual('tenant1', data.token.tenant.id)
+        self.assertEqual(["Admin", "regular_role"],
+                         [role.name for role in data.user.rolegrants.values])
+
+    def test_validation_view_matches_fallback(self):
+        self._create_scoped_token()
+        native = db_api.TOKEN.get_validation_view('SCOPEDTOKEN')
+        fallback = db_api.BaseTokenAPI.get_validation_view(db_api.TOKEN,
+                                                           'SCOPEDTOKEN')
+        self.assertEqual(fallback, native)
+        self.assertEqual('tenant1', native['token_tenant'].id)
+        self.assertEqual(["Admin"],
+                         [role.name for role in native['tenant_roles']])
+        self.assertEqual(["regular_role"],
+                         [role.name for role in native['global_roles']])
+
+    def test_validation_view_unknown_token(self):
+        self.assertIsNone(db_api.TOKEN.get_validation_view("unknown"))
+
+    def test_validation_views(self):
+        self._create_scoped_token()
+        views = db_api.TOKEN.get_validation_views(
+            ['SCOPEDTOKEN', self.auth_token_id, 'unknown'])
+        self.assertEqual(set(['SCOPEDTOKEN', self.auth_token_id]),
+                         set(views))
+        for token_id, view in views.items():
+            self.assertEqual(db_api.TOKEN.get_validation_view(token_id),
+                             view)
+
+    def test_validate_tokens(self):
+        self._create_scoped_token()
+        token_ids = ['SCOPEDTOKEN', 'unknown', self.auth_token_id]
+        results = self.api.validate_tokens(self.admin_token_id, token_ids)
+        self.assertEqual(token_ids,
+                         [token_id for token_id, _ in results.results])
+        scoped, unknown, unscoped = [result for _, result in results.results]
+        self.assertEqual(
+            self.api.validate_token(self.admin_token_id,
+                                    'SCOPEDTOKEN').to_json(),
+            scoped.to_json())
+        self.assertTrue(isinstance(unknown, ItemNotFoundFault))
+        self.assertEqual(self.auth_user["id"], unscoped.user.id)
+
+    def test_validate_tokens_belongs_to(self):
+        self._create_scoped_token()
+        results = self.api.validate_tokens(
+            self.admin_token_id, ['SCOPEDTOKEN', self.auth_token_id],
+            belongs_to='tenant1')
+        scoped, unscoped = [result for _, result in results.results]
+        self.assertTrue(isinstance(scoped, ValidateData))
+        self.assertTrue(isinstance(unscoped, UnauthorizedFault))
+
+    def test_validate_tokens_require_service_admin(self):
+        self.assertRaises(UnauthorizedFault, self.api.validate_tokens,
+                self.auth_token_id, ["any_id"])
+
+    def test_validate_tokens_uses_cache(self):
+        service.VALIDATE_CACHE = LRUCache(max_entries=10)
+        data = self.api.validate_token(self.admin_token_id, self.auth_token_id)
+        results = self.api.validate_tokens(self.admin_token_id,
+                                           [self.auth_token_id])
+        self.assertTrue(data is results.results[0][1])
+
+    def test_find_token_uses_index(self):
+        self._create_scoped_token()
+        self.fixture_create_token(id='OLDERTOKEN',
+                                  user_id=self.auth_user["id"],
+                                  tenant_id='tenant1',
+                                  expires=self.expires - dt.timedelta(hours=1))
+        self.assertEqual('SCOPEDTOKEN', db_api.TOKEN.get_for_user_by_tenant(
+            self.auth_user["id"], 'tenant1').id)
+
+        session = get_session()
+        query = session.query(models.Token).\
+            filter(models.Token.user_id == 1).\
+            filter(models.Token.tenant_id == None).\
+            order_by(models.Token.expires.desc())
+        statement = query.statement.compile(session.bind)
+        plan = session.bind.execute(
+            "EXPLAIN QUERY PLAN %s" % statement,
+            [statement.params[name] for name in statement.positiontup])
+        self.assertTrue('ix_tokens_user_tenant_expires' in
+                        ' '.join(str(row) for row in plan))
+
+    def test_get_tenants_paginates_once(self):
+        calls = []
+
+        def counting_paginate(*args):
+            calls.append(args)
+            return paginate(*args)
+
+        tenant_api.paginate = counting_paginate
+        try:
+            tenants = self.api.get_tenants(self.admin_token_id, None, 1,
+                                           'http://localhost/tenants')
+        finally:
+            tenant_api.paginate = paginate
+        self.assertEqual(1, len(calls))
+        self.assertEqual(1, len(tenants.values))
+
+    def test_uid_translations_are_cached(self):
+        self.enable_uid_caches()
+        uids = db_api.USER.uids
+        user_id = db_api.USER.uid_to_id(self.admin_user['id'])
+        self.assertEqual(user_id,
+                         db_api.USER.uid_to_id(self.admin_user['id']))
+        self.assertEqual(self.admin_user['id'], uids.get_uid(user_id))
+
+        translated = uids.stats()['id_to_uid']['hits'] + \
+            uids.stats()['id_to_uid']['misses']
+        grants = db_api.ROLE.list_global_roles_for_user(
+            self.admin_user['id'])
+        self.assertTrue(grants)
+        self.assertEqual([self.admin_user['id']] * len(grants),
+                         [grant.user_id for grant in grants])
+        # the uids of the grants are joined in, not translated
+        self.assertEqual(translated, uids.stats()['id_to_uid']['hits'] +
+                         uids.stats()['id_to_uid']['misses'])
+
+    def test_uid_cache_evicts_deleted_users(self):
+        self.enable_uid_caches()
+        user = db_api.USER.create({'id': 'shortlived', 'name': 'shortlived',
+                                   'password': 'secret', 'enabled': True})
+        user_id = db_api.USER.uids.get_id('shortlived')
+        self.assertEqual(user_id, db_api.USER.uid_to_id(user.id))
+        db_api.USER.delete(user.id)
+        self.assertIsNone(db_api.USER.uids.get_id('shortlived'))
+        self.assertIsNone(db_api.USER.uids.get_uid(user_id))
+        self.assertIsNone(db_api.USER.uid_to_id('shortlived'))
+
+    def test_validate_token_is_cached(self):
+        service.VALIDATE_CACHE = LRUCache(max_entries=10)
+        data = self.api.validate_token(self.admin_token_id, self.auth_token_id)
+        self.assertTrue(data is self.api.validate_token(self.admin_token_id,
+                                                        self.auth_token_id))
+        self.assertEqual(1, service.VALIDATE_CACHE.hits)
+        stats = self.api.get_cache_stats(self.admin_token_id)
+        self.assertEqual(1, stats['validate']['entries'])
+
+    def test_revoke_token_evicts_cache(self):
+        service.VALIDATE_CACHE = LRUCache(max_entries=10)
+        self.api.validate_token(self.admin_token_id, self.auth_token_id)
+        self.api.revoke_token(self.admin_token_id, self.auth_token_id)
+        self.assertRaises(ItemNotFoundFault, self.api.validate_token,
+                          self.admin_token_id, self.auth_token_id)
+
+    def test_remove_role_evicts_cache(self):
+        service.VALIDATE_CACHE = LRUCache(max_entries=10)
+        data = self.api.validate_token(self.admin_token_id, self.auth_token_id)
+        self.assertEqual(1, len(data.user.rolegrants.values))
+        self.api.remove_role_from_user(self.admin_token_id,
+                self.auth_user["id"], self.role_fixtures[0]["id"])
+        data = self.api.validate_token(self.admin_token_id, self.auth_token_id)
+        self.assertEqual(0, len(data.user.rolegrants.values))
+
+    def test_auth_data_is_cached(self):
+        service.AUTH_CACHE = LRUCache(max_entries=10)
+        dtoken = db_api.TOKEN.get(self.auth_token_id)
+        data = self.api.get_auth_data(dtoken)
+        self.assertTrue(data is self.api.get_auth_data(dtoken))
+        self.assertTrue(data.to_json() is data.to_json())
+
+    def test_password_verifications_are_cached(self):
+        UserManager.password_cache = LRUCache(max_entries=10)
+        user_id = self.test_user['id']
+        manager = self.api.user_manager
+        self.assertTrue(manager.check_password(user_id, 'test_pass'))
+        self.assertTrue(manager.check_password(user_id, 'test_pass'))
+        self.assertFalse(manager.check_password(user_id, 'wrong'))
+        self.assertFalse(manager.check_password(user_id, 'wrong'))
+        stats = self.api.get_cache_stats(self.admin_token_id)['password']
+        self.assertEqual(1, stats['entries'])
+        self.assertEqual(1, stats['hits'])
+
+    def test_password_change_evicts_cache(self):
+        UserManager.password_cache = LRUCache(max_entries=10)
+        user_id = self.test_user['id']
+        manager = self.api.user_manager
+        self.assertTrue(manager.check_password(user_id, 'test_pass'))
+        self.api.set_user_password(self.admin_token_id, user_id,
+                                   User(password='new_pass'))
+        self.assertFalse(manager.check_password(user_id, 'test_pass'))
+        self.assertTrue(manager.check_password(user_id, 'new_pass'))
+
+    def test_catalog_change_evicts_auth_data(self):
+        service.AUTH_CACHE = LRUCache(max_entries=10)
+        dtoken = db_api.TOKEN.get(self.auth_token_id)
+        data = self.api.get_auth_data(dtoken)
+        self.api._invalidate_token_caches(catalog=True)
+        self.assertFalse(data is self.api.get_auth_data(dtoken))
+
+    def test_catalog_follows_endpoint_changes(self):
+        service.CATALOG = CatalogCompiler(
+            self.api.tenant_manager.get_all_endpoints,
+            self.api.service_manager.get, max_entries=10)
+        catalog = service.CATALOG.get('tenant1')
+        self.assertTrue(catalog is service.CATALOG.get('tenant1'))
+        self.assertEqual((), catalog.services)
+
+        template = self.api.add_endpoint_template(self.admin_token_id,
+            EndpointTemplate(None, 'RegionOne', 'test_service', 'test',
+                             'http://public/%tenant_id%', 'http://admin/',
+                             None, True, False))
+        endpoint = self.api.create_endpoint_for_tenant(self.admin_token_id,
+                                                       'tenant1', template)
+        catalog = service.CATALOG.get('tenant1')
+        dservice, endpoints = catalog.select(['public'])[0]
+        self.assertEqual('test_service', dservice.name)
+        self.assertEqual([[('region', 'RegionOne'),
+                           ('publicURL', 'http://public/tenant1'),
+                           ('tenantId', 'tenant1'),
+                           ('id', str(template.id))]], endpoints)
+        self.assertEqual((), service.CATALOG.get(None).services)
+
+        self.api.delete_endpoint(self.admin_token_id, endpoint.id)
+        self.assertEqual((), service.CATALOG.get('tenant1').services)
+
+    def _revocation_events(self, since=0, limit=1000):
+        events = self.api.get_revocation_events(self.admin_token_id, since,
+                                                limit)
+        return [(event.type, event.target_id) for event in events.events], \
+            events.cursor, events.truncated
+
+    def test_revocation_events(self):
+        self.api.revoke_token(self.admin_token_id, self.auth_token_id)
+        user_id = self.test_user['id']
+        self.api.enable_disable_user(self.admin_token_id, user_id,
+                                     User(enabled=False))
+        # enabling a user revokes nothing
+        self.api.enable_disable_user(self.admin_token_id, user_id,
+                                     User(enabled=True))
+        tenant_id = self.fixture_create_tenant(name='revoked', enabled=True,
+                                               desc='revoked').id
+        self.api.delete_tenant(self.admin_token_id, tenant_id)
+        events, cursor, truncated = self._revocation_events()
+        self.assertEqual([('token', self.auth_token_id), ('user', user_id),
+                          ('tenant', tenant_id)], events)
+        self.assertFalse(truncated)
+        self.assertEqual(([], cursor, False), self._revocation_events(cursor))
+
+        # paging
+        events, first, truncated = self._revocation_events(limit=2)
+        self.assertEqual(2, len(events))
+        events, cursor, truncated = self._revocation_events(first)
+        self.assertEqual([('tenant', tenant_id)], events)
+        self.assertRaises(UnauthorizedFault, self.api.get_revocation_events,
+                          self.auth_token_id)
+
+    def test_missed_revocation_events(self):
+        for user_id in ['u1', 'u2', 'u3']:
+            self.api.token_manager.add_revocation_event('user', user_id)
+        first = self._revocation_events(limit=1)[1]
+        reaper = TokenReaper(self.api.token_manager, event_ttl=0)
+        # the newest event is kept, so that ids keep increasing
+        self.assertEqual(2, reaper.reap_revocation_events(
+            dt.datetime.now() + dt.timedelta(seconds=1)))
+        events, cursor, truncated = self._revocation_events(first)
+        self.assertTrue(truncated)
+        self.assertEqual([('user', 'u3')], events)
+        self.assertEqual(([], cursor, False), self._revocation_events(cursor))
+
+    def test_revocation_event_not_committed_yet(self):
+        for user_id in ['u1', 'u2', 'u3']:
+            self.api.token_manager.add_revocation_event('user', user_id)
+        first = self._revocation_events(limit=1)[1]
+        # the event of u2 is committed after the one of u3
+        session = get_session()
+        model = models.RevocationEvent
+        ref = session.query(model).filter(model.target_id == 'u2').one()
+        values = {'id': ref.id, 'type': ref.type, 'target_id': ref.target_id,
+                  'created': ref.created}
+        session.delete(ref)
+        session.flush()
+        self.assertEqual(([('user', 'u3')], first, False),
+                         self._revocation_events(first))
+        ref = model()
+        ref.update(values)
+        ref.save()
+        events, cursor, truncated = self._revocation_events(first)
+        self.assertEqual([('user', 'u2'), ('user', 'u3')], events)
+        self.assertEqual(([], cursor, False), self._revocation_events(cursor))
+
+    def test_revocation_cursor(self):
+        now = dt.datetime.now()
+        old = now - dt.timedelta(seconds=db_api.REVOCATION_EVENT_LAG + 1)
+        events = [RevocationEvent(id=id, created=created)
+                  for id, created in [(1, old), (3, now), (4, now)]]
+        cursor = db_api.BaseTokenAPI.revocation_cursor
+        self.assertEqual(1, cursor(0, events, now=now))
+        self.assertEqual(4, cursor(0, events[1:], now=now))
+        self.assertEqual(4, cursor(2, events[1:], now=now))
+        self.assertEqual(6, cursor(4, [], 6, now=now))
+        events[1].created = old
+        self.assertEqual(4, cursor(0, events, now=now))
+
     def test_remove_role_from_user(self):
         auth_userid = self.auth_user["id"]
         regular_role_id = self.role_fixtures[0]["id"]
@@ -61,5 +384,84 @@ class TestServiceLogic(AdminAPITest):
                 auth_userid, regular_role_id)
 
 
+class TestSignedTokens(AdminAPITest):
+    """Tests the signed token format of logic/service.py"""
+    def __init__(self, *args, **kwargs):
+        super(TestSignedTokens, self).__init__(*args, **kwargs)
+        self.api_class = service.IdentityService
+
+    def setUp(self):
+        keyfile, certfile = signing_key()
+        config.CONF.set_override('token_format', 'signed')
+        config.CONF.set_override('token_signing_keyfile', keyfile)
+        config.CONF.set_override('token_signing_certfile', certfile)
+        super(TestSignedTokens, self).setUp()
+
+    def tearDown(self):
+        config.CONF.set_override('token_format', 'uuid')
+        config.CONF.set_override('token_signing_keyfile', None)
+        config.CONF.set_override('token_signing_certfile', None)
+        service.TokenManager.signing_keys = None
+        super(TestSignedTokens, self).tearDown()
+
+    def _authenticate(self):
+        return self.api.authenticate(auth.AuthWithPasswordCredentials(
+            'auth_user', 'auth_pass'))
+
+    def test_authenticate_issues_signed_token(self):
+        token_id = self._authenticate().token.id
+        self.assertTrue(signing.is_signed(token_id))
+        claims = service.TokenManager.signing_keys.verify(token_id)
+        self.assertEqual(self.auth_token_id, claims['id'])
+        self.assertEqual('auth_user', claims['user']['name'])
+        self.assertEqual(None, claims['tenant']['id'])
+        self.assertEqual([self.role_fixtures[0]['name']], claims['roles'])
+
+    def test_reused_token_is_signed_once(self):
+        token_id = self._authenticate().token.id
+        signed = service.TokenManager.signing_keys.signed
+        misses = signed.misses
+        self.assertEqual(token_id, self._authenticate().token.id)
+        self.assertEqual(misses, signed.misses)
+        self.assertEqual(1, signed.hits)
+
+    def test_validate_signed_token(self):
+        token_id = self._authenticate().token.id
+        data = self.api.validate_token(self.admin_token_id, token_id)
+        self.assertEqual(self.auth_user['id'], data.user.id)
+        views = self.api.token_manager.get_validation_views([token_id])
+        self.assertEqual([token_id], views.keys())
+
+    def test_tampered_token_is_not_found(self):
+        token_id = self._authenticate().token.id
+        tampered = token_id[:-2] + ('AA' if token_id[-2:] != 'AA' else 'BB')
+        self.assertRaises(ItemNotFoundFault, self.api.validate_token,
+                          self.admin_token_id, tampered)
+
+    def test_revoke_signed_token(self):
+        token_id = self._authenticate().token.id
+        self.api.revoke_token(self.admin_token_id, token_id)
+        self.assertRaises(ItemNotFoundFault, self.api.validate_token,
+                          self.admin_token_id, token_id)
+        self.assertEqual(None, db_api.TOKEN.get(self.auth_token_id))
+
+    def test_get_signing_certificates(self):
+        certificates = self.api.get_signing_certificates(self.admin_token_id)
+        key_id = service.TokenManager.signing_keys.key_id
+        self.assertEqual([key_id], [published[0] for published
+                                    in certificates.certificates])
+        self.assertTrue('signingCertificates' in certificates.to_json())
+        # only the certificate is published, not the key
+        self.assertFalse('PRIVATE' in certificates.to_json())
+        self.assertFalse('PRIVATE' in certificates.to_xml())
+        self.assertRaises(UnauthorizedFault,
+                          self.api.get_signing_certificates,
+                          self.auth_token_id)
+
+    def test_signed_format_requires_key(self):
+        config.CONF.set_override('token_signing_keyfile', None)
+        self.assertRaises(ValueError, service.IdentityService)
+
+
 if __name__ == '__main__':
     unittest.main()
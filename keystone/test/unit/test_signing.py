@@ -0,0 +1,110 @@
+import unittest2 as unittest
+
+from keystone.common import signing
+from keystone.test.unit.base import signing_key
+
+CLAIMS = {'id': 'abc', 'user': {'id': 'u1', 'name': 'user'}}
+
+
+class TestSigning(unittest.TestCase):
+    """Tests keystone.common.signing"""
+
+    def setUp(self):
+        self.keyfile, self.certfile = signing_key()
+        self.keys = signing.SigningKeys(self.keyfile, self.certfile)
+
+    def test_round_trip(self):
+        token = self.keys.sign(CLAIMS)
+        self.assertTrue(signing.is_signed(token))
+        self.assertEqual(self.keys.key_id, signing.key_id(token))
+        self.assertEqual(CLAIMS, self.keys.verify(token))
+
+    def test_claims_are_signed_once(self):
+        calls = []
+        openssl = signing._openssl
+
+        def counting_openssl(args, data):
+            calls.append(args[0])
+            return openssl(args, data)
+
+        signing._openssl = counting_openssl
+        try:
+            token = self.keys.sign(CLAIMS)
+            self.assertEqual(token, self.keys.sign(dict(CLAIMS)))
+            self.assertEqual(['dgst'], calls)
+            unmemoized = signing.SigningKeys(self.keyfile, self.certfile,
+                                             max_signed=0)
+            del calls[:]
+            self.assertEqual(token, unmemoized.sign(CLAIMS))
+            self.assertEqual(token, unmemoized.sign(CLAIMS))
+            self.assertEqual(['dgst', 'dgst'], calls)
+        finally:
+            signing._openssl = openssl
+
+    def test_equal(self):
+        self.assertTrue(signing._equal('abc', 'abc'))
+        self.assertFalse(signing._equal('abc', 'abd'))
+        self.assertFalse(signing._equal('abc', 'ab'))
+        self.assertTrue(signing._equal('', ''))
+
+    def test_uuid_tokens_are_not_signed(self):
+        self.assertFalse(signing.is_signed('887665443383838'))
+        self.assertFalse(signing.is_signed(None))
+        self.assertRaises(signing.InvalidToken, self.keys.verify, 'abc')
+
+    def test_tampered_token(self):
+        token = self.keys.sign(CLAIMS)
+        prefix, key_id, claims, signature = token.split('.')
+        other = self.keys.sign({'id': 'other'}).split('.')[2]
+        for tampered in ['.'.join([prefix, key_id, other, signature]),
+                         '.'.join([prefix, key_id, claims, signature[:-2]]),
+                         '.'.join([prefix, key_id, claims, 'A' * 342]),
+                         '.'.join([prefix, key_id, claims, '']),
+                         '.'.join([prefix, 'other', claims, signature])]:
+            self.assertRaises(signing.InvalidToken, self.keys.verify,
+                              tampered)
+
+    def test_other_key(self):
+        token = signing.SigningKeys(*signing_key('other')).sign(CLAIMS)
+        self.assertRaises(signing.InvalidToken, self.keys.verify, token)
+
+    def test_key_must_match_certificate(self):
+        self.assertRaises(ValueError, signing.SigningKeys, self.keyfile,
+                          signing_key('other')[1])
+
+    def test_previous_certificates(self):
+        token = self.keys.sign(CLAIMS)
+        keyfile, certfile = signing_key('other')
+        keys = signing.SigningKeys(keyfile, certfile, [self.certfile])
+        self.assertEqual(CLAIMS, keys.verify(token))
+        self.assertNotEqual(self.keys.key_id, keys.key_id)
+        self.assertEqual(sorted([self.keys.key_id, keys.key_id]),
+                         sorted(key_id for key_id, _pem, _expires
+                                in keys.published()))
+
+    def test_published_certificates(self):
+        [(key_id, pem, expires)] = self.keys.published()
+        self.assertEqual(self.keys.key_id, key_id)
+        self.assertTrue(pem.startswith('-----BEGIN CERTIFICATE-----'))
+        self.assertNotIn('PRIVATE', pem)
+        # services verify with the certificate alone
+        certificate = signing.Certificate(pem)
+        self.assertEqual(CLAIMS, certificate.verify(self.keys.sign(CLAIMS)))
+        self.assertEqual(expires, certificate.expires)
+
+    def test_expired_certificate(self):
+        token = self.keys.sign(CLAIMS)
+        expires = self.keys.get(self.keys.key_id).expires
+        self.assertEqual(CLAIMS, self.keys.verify(token, now=expires - 1))
+        self.assertRaises(signing.InvalidToken, self.keys.verify, token,
+                          now=expires)
+        self.assertEqual([], self.keys.published(now=expires))
+
+    def test_certificate_authority(self):
+        certificate = self.keys.get(self.keys.key_id)
+        self.assertTrue(certificate.is_issued_by(self.certfile))
+        self.assertFalse(certificate.is_issued_by(signing_key('other')[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
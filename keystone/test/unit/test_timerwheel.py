@@ -0,0 +1,46 @@
+import random
+import unittest2 as unittest
+
+from keystone.common.timerwheel import TimerWheel
+
+
+class TestTimerWheel(unittest.TestCase):
+    """Tests keystone.common.timerwheel.TimerWheel"""
+
+    def test_expires_in_order(self):
+        wheel = TimerWheel(tick=1, bits=2, levels=3, now=1000)
+        wheel.schedule('a', 1001)
+        wheel.schedule('b', 1005)
+        wheel.schedule('c', 1100)
+        self.assertEqual([], wheel.advance(1000))
+        self.assertEqual(['a'], wheel.advance(1004))
+        self.assertEqual(['b'], wheel.advance(1099))
+        self.assertEqual(['c'], wheel.advance(1100))
+        self.assertEqual(0, wheel.count)
+
+    def test_past_expiry_fires_on_next_tick(self):
+        wheel = TimerWheel(now=1000)
+        wheel.schedule('a', 10)
+        self.assertEqual(['a'], wheel.advance(1001))
+
+    def test_cascades_like_a_sorted_list(self):
+        # small levels, so that keys cascade and overflow the top level
+        wheel = TimerWheel(tick=1, bits=3, levels=2, now=0)
+        expiries = dict(('k%s' % i, random.randint(1, 300))
+                        for i in range(500))
+        for key, when in expiries.items():
+            wheel.schedule(key, when)
+        fired = {}
+        for now in range(1, 301):
+            for key in wheel.advance(now):
+                fired[key] = now
+        self.assertEqual(expiries, fired)
+
+    def test_idle_wheel_jumps(self):
+        wheel = TimerWheel(now=0)
+        self.assertEqual([], wheel.advance(10 ** 9))
+        self.assertEqual(10 ** 9, wheel.current)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import datetime
+import unittest2 as unittest
+
+import keystone.backends.api as db_api
+from keystone.backends.sqlalchemy import get_session
+from keystone.backends.sqlalchemy.api import token as token_api
+from keystone.logic.reaper import TokenReaper
+from keystone.managers.token import Manager as TokenManager
+from keystone.test.unit.base import ServiceAPITest
+
+
+class TestTokenReaper(ServiceAPITest):
+    """Tests keystone.logic.reaper and the deletion of expired tokens"""
+
+    def _create_tokens(self, api, prefix, expires, count=1):
+        for i in range(count):
+            api.create({'id': '%s%s' % (prefix, i),
+                        'user_id': self.auth_user['id'],
+                        'tenant_id': self.auth_user['tenant_id'],
+                        'expires': expires})
+
+    def test_reap(self):
+        now = datetime.datetime.now()
+        self._create_tokens(db_api.TOKEN, 'EXPIRED',
+                            now - datetime.timedelta(hours=1), count=5)
+        reaper = TokenReaper(TokenManager(), batch_size=2)
+        self.assertEqual(5, reaper.reap())
+        self.assertIsNone(db_api.TOKEN.get('EXPIRED0'))
+        self.assertIsNotNone(db_api.TOKEN.get(self.auth_token_id))
+        self.assertEqual(0, reaper.reap())
+
+    def test_delete_expired_is_bounded(self):
+        now = datetime.datetime.now()
+        self._create_tokens(db_api.TOKEN, 'EXPIRED',
+                            now - datetime.timedelta(hours=1), count=5)
+        self.assertEqual(3, db_api.TOKEN.delete_expired(now, 3))
+        self.assertEqual(2, db_api.TOKEN.delete_expired(now, 3))
+
+
+class TestBucketedTokenAPI(ServiceAPITest):
+    """Tests storing tokens in time-bucketed tables"""
+
+    def setUp(self):
+        super(TestBucketedTokenAPI, self).setUp()
+        self.api = token_api.BucketedTokenAPI(1)
+        self.now = datetime.datetime.now()
+
+    def _create(self, id, expires):
+        return self.api.create({'id': id,
+                                'user_id': self.auth_user['id'],
+                                'tenant_id': self.auth_user['tenant_id'],
+                                'expires': expires})
+
+    def _buckets(self):
+        return [name for name in get_session().bind.table_names()
+                if token_api.BUCKET_TABLE.match(name)]
+
+    def test_bucket_name(self):
+        expires = datetime.datetime(2012, 1, 31, 23, 30)
+        self.assertEqual('tokens_2012020100', self.api.bucket_name(expires))
+        self.assertEqual(datetime.datetime(2012, 2, 1),
+                         self.api.bucket_end('tokens_2012020100'))
+
+    def test_lookups(self):
+        self._create('SOON', self.now + datetime.timedelta(minutes=5))
+        self._create('LATER', self.now + datetime.timedelta(hours=5))
+        self.assertEqual(2, len(self._buckets()))
+        self.assertEqual('SOON', self.api.get('SOON').id)
+        # the token stored before bucketing
+        self.assertEqual(self.auth_token_id,
+                         self.api.get(self.auth_token_id).id)
+        self.assertEqual('LATER', self.api.get_for_user_by_tenant(
+            self.auth_user['id'], self.auth_user['tenant_id']).id)
+        views = self.api.get_validation_views(['SOON', 'LATER',
+                                               self.auth_token_id])
+        self.assertEqual(3, len(views))
+        self.assertEqual(self.api.get_validation_view('SOON'), views['SOON'])
+
+    def test_sees_buckets_of_other_processes(self):
+        self.api.get(self.auth_token_id)
+        other = token_api.BucketedTokenAPI(1)
+        other.create({'id': 'OTHER', 'user_id': self.auth_user['id'],
+                      'expires': self.now + datetime.timedelta(hours=3)})
+        self.api.listed = 0
+        self.assertEqual('OTHER', self.api.get('OTHER').id)
+
+    def test_update_moves_token(self):
+        self._create('MOVED', self.now + datetime.timedelta(minutes=5))
+        self.api.update('MOVED',
+                        {'expires': self.now + datetime.timedelta(hours=5)})
+        token = self.api.get('MOVED')
+        self.assertEqual(self.now + datetime.timedelta(hours=5),
+                         token.expires)
+        self.assertEqual(1, len(self.api.get_all()) -
+                         len(db_api.TOKEN.get_all()))
+
+    def test_delete_expired_drops_buckets(self):
+        self._create('OLD1', self.now - datetime.timedelta(hours=3))
+        self._create('OLD2', self.now - datetime.timedelta(hours=3))
+        self._create('LIVE', self.now + datetime.timedelta(hours=3))
+        self.assertEqual(2, len(self._buckets()))
+        self.assertEqual(2, self.api.delete_expired(self.now, 1))
+        self.assertEqual(1, len(self._buckets()))
+        self.assertIsNone(self.api.get('OLD1'))
+        self.assertEqual('LIVE', self.api.get('LIVE').id)
+        self.assertEqual(0, self.api.delete_expired(self.now, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,7 +22,9 @@ Test WSGI basics and provide some helper functions for other WSGI tests.
 """
 
 import unittest2 as unittest
+import eventlet
 import routes
+import socket
 import webob
 
 from keystone.common import wsgi
@@ -66,6 +68,26 @@ class TestWsgi(unittest.TestCase):
         result = webob.Request.blank('/bad').get_response(Router())
         self.assertNotEqual(result.body, "Router result")
 
+    def test_server_stats(self):
+        listener = eventlet.listen(('127.0.0.1', 0), backlog=20)
+        server = wsgi.Server(threads=5, keepalive=False)
+        server.start(common.BlankApp(), socket=listener, key='test')
+        try:
+            clients = [socket.create_connection(listener.getsockname())
+                       for _i in range(3)]
+            stats = wsgi.get_server_stats()['test']
+            self.assertEqual(5, stats['pool_size'])
+            self.assertEqual(5, stats['free'] + stats['busy'])
+            self.assertFalse(stats['keepalive'])
+            if stats['backlog'] is not None:
+                self.assertEqual(20, stats['backlog'])
+                self.assertTrue(0 <= stats['queued_accepts'] <= 3)
+        finally:
+            for client in clients:
+                client.close()
+            server.stop()
+        self.assertNotIn('test', wsgi.get_server_stats())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -29,6 +29,7 @@ TESTS = [
     test.SSLTest,
     test.ClientWithoutHPIDMTest,
     test.LDAPTest,
+    test.KvsTest,
     # Waiting on instructions on how to start memcached in jenkins:
     # But tests pass
     # MemcacheTest,
@@ -0,0 +1,92 @@
+"""
+Times the token lookups done on every password authentication as the tokens
+table grows.
+
+The lookups (TokenAPI.get_for_user_by_tenant and TokenAPI.get_for_user) run
+against an in-memory SQLite database created from the models. Use
+--no-indexes to drop the token indexes and compare with a full scan.
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+import uuid
+
+# Run against the keystone in this tree
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                os.pardir)))
+
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+from keystone.backends.sqlalchemy import models
+from keystone.backends.sqlalchemy.api.token import TokenAPI
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('-s', type=int, nargs='+', required=False,
+    default=[1000, 10000, 100000, 1000000],
+    help='token table sizes to measure', dest='sizes')
+parser.add_argument('-u', type=int, required=False, default=1000,
+    help='number of users owning the tokens', dest='users')
+parser.add_argument('-n', type=int, required=False, default=1000,
+    help='lookups timed per table size', dest='lookups')
+parser.add_argument('--no-indexes', required=False, action='store_true',
+    default=False, help='drop the token indexes', dest='no_indexes')
+args = parser.parse_args()
+
+
+def add_tokens(engine, count, users):
+    """Adds count tokens, spread over users and 10 tenants"""
+    now = datetime.datetime.utcnow()
+    tokens = models.Token.__table__
+    rows = []
+    for i in xrange(count):
+        rows.append({'id': uuid.uuid4().hex,
+                     'user_id': random.randint(1, users),
+                     'tenant_id': random.choice([None] + range(1, 10)),
+                     'expires': now + datetime.timedelta(
+                         seconds=random.randint(-86400, 86400))})
+        if len(rows) == 10000:
+            engine.execute(tokens.insert(), rows)
+            rows = []
+    if rows:
+        engine.execute(tokens.insert(), rows)
+
+
+def time_lookups(session, lookups, users):
+    """Returns the mean time of a lookup in milliseconds"""
+    api = TokenAPI()
+    start = time.time()
+    for i in xrange(lookups):
+        user_id = random.randint(1, users)
+        tenant_id = random.randint(1, 9)
+        if i % 2:
+            api.get_for_user_by_tenant(user_id, tenant_id, session=session)
+        else:
+            api.get_for_user(user_id, session=session)
+    return (time.time() - start) * 1000.0 / lookups
+
+
+def main():
+    engine = sqlalchemy.create_engine('sqlite://')
+    models.Base.metadata.create_all(engine)
+    if args.no_indexes:
+        for index in models.Token.__table__.indexes:
+            index.drop(engine)
+    session = sessionmaker(bind=engine)()
+
+    print '%10s %12s' % ('tokens', 'ms/lookup')
+    size = 0
+    for target in sorted(args.sizes):
+        add_tokens(engine, target - size, args.users)
+        size = target
+        print '%10d %12.3f' % (size, time_lookups(session, args.lookups,
+                                                  args.users))
+
+
+if __name__ == '__main__':
+    main()